@@ -1,7 +1,25 @@
 from django.conf import settings
 
 from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
 
 class CustomS3Boto3Storage(S3Boto3Storage):
 
-  location = settings.AWS_MEDIA_LOCATION
\ No newline at end of file
+  location = getattr(settings, 'AWS_MEDIA_LOCATION', 'media')
+
+  def presigned_post(self, name, content_type, max_size, expires_in):
+    # O navegador envia o arquivo direto ao bucket; a política assinada
+    # limita o tamanho, o Content-Type e a chave do objeto.
+    fields = {'Content-Type': content_type}
+    if self.default_acl:
+      fields['acl'] = self.default_acl
+
+    return self.connection.meta.client.generate_presigned_post(
+      Bucket=self.bucket_name,
+      Key=self._normalize_name(clean_name(name)),
+      Fields=fields,
+      Conditions=[{key: value} for key, value in fields.items()] + [
+        ['content-length-range', 1, max_size],
+      ],
+      ExpiresIn=expires_in,
+    )
@@ -0,0 +1,157 @@
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from django.conf import settings
+
+from .models import StockPrice
+from .indicators import IndicatorEngine
+from .series import load_series
+
+
+class ArrayLRUCache:
+  """Base dos caches por processo de arrays NumPy: limite em bytes e despejo LRU."""
+
+  def __init__(self, max_bytes):
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    self.refreshes = 0
+    self.evictions = 0
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+
+  def _lookup(self, key, version):
+    """Retorna (valor, entrada): o valor só quando a versão bate (e marca o acerto)."""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[0] == version:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1], entry
+    return None, entry
+
+  def _store(self, key, version, value):
+    with self._lock:
+      self._discard(key)
+      if value.nbytes > self.max_bytes:
+        return
+
+      self._entries[key] = (version, value)
+      self._bytes += value.nbytes
+      while self._bytes > self.max_bytes:
+        self._discard(next(iter(self._entries)))
+        self.evictions += 1
+
+  def _discard(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is not None:
+      self._bytes -= entry[1].nbytes
+
+  def invalidate(self, key):
+    with self._lock:
+      self._discard(key)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+    self.hits = self.misses = self.refreshes = self.evictions = 0
+
+  @property
+  def stats(self):
+    total = self.hits + self.misses + self.refreshes
+    return {
+      'entries': len(self._entries),
+      'bytes': self._bytes,
+      'max_bytes': self.max_bytes,
+      'hits': self.hits,
+      'misses': self.misses,
+      'refreshes': self.refreshes,
+      'evictions': self.evictions,
+      'hit_rate': self.hits / total if total else 0.0,
+    }
+
+
+class PriceSeriesCache(ArrayLRUCache):
+  """
+  Cache por processo das séries de preço (PriceSeries), limitado em bytes e
+  com despejo LRU.
+
+  Cada entrada guarda o Stock.last_update com que foi carregada. Quando o
+  last_update muda (a ingestão o atualiza a cada lote), só as barras a partir
+  da última data em cache são relidas e anexadas. Se o número de barras
+  anteriores a essa data mudou, houve backfill no passado e a série é
+  recarregada inteira. Correções de valores em barras antigas, sem novas
+  barras, só aparecem após `invalidate`.
+  """
+
+  def __init__(self, max_bytes=256 * 1024 * 1024):
+    super().__init__(max_bytes)
+
+  def get(self, stock):
+    series, entry = self._lookup(stock.pk, stock.last_update)
+    if series is not None:
+      return series
+
+    if entry is None or len(entry[1]) == 0:
+      self.misses += 1
+      series = load_series(stock.pk)
+    else:
+      self.refreshes += 1
+      series = self._refresh(stock.pk, entry[1])
+
+    self._store(stock.pk, stock.last_update, series)
+    return series
+
+  def between(self, stock, start=None, end=None):
+    """
+    Barras de `stock` entre start e end. Com o cache desligado
+    (PRICE_SERIES_CACHE_MAX_BYTES=0) o intervalo vai para a consulta, em vez
+    de carregar o histórico inteiro a cada requisição para recortá-lo.
+    """
+    if not self.max_bytes:
+      self.misses += 1
+      return load_series(stock.pk, since=start, until=end)
+    return self.get(stock).between(start, end)
+
+  def _refresh(self, stock_id, series):
+    last_date = date.fromordinal(int(series.dates[-1]))
+    if StockPrice.objects.filter(stock_id=stock_id, date__lt=last_date).count() != len(series) - 1:
+      return load_series(stock_id)
+    return series.append(load_series(stock_id, since=last_date))
+
+
+class IndicatorCache(ArrayLRUCache):
+  """
+  Indicadores por ativo, versionados pela série de preço de onde saíram.
+  Quando a série muda, o IndicatorEngine continua do resultado anterior em
+  vez de recalcular o histórico inteiro.
+  """
+
+  def __init__(self, engine, max_bytes=256 * 1024 * 1024):
+    super().__init__(max_bytes)
+    self.engine = engine
+
+  def get(self, stock, series):
+    indicators, entry = self._lookup(stock.pk, stock.last_update)
+    if indicators is not None:
+      return indicators
+
+    previous = entry[1] if entry is not None else None
+    if previous is None:
+      self.misses += 1
+    else:
+      self.refreshes += 1
+
+    indicators = self.engine.compute(series, previous)
+    self._store(stock.pk, stock.last_update, indicators)
+    return indicators
+
+
+price_cache = PriceSeriesCache(getattr(settings, 'PRICE_SERIES_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+indicator_cache = IndicatorCache(
+  IndicatorEngine(),
+  getattr(settings, 'INDICATOR_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+)
@@ -0,0 +1,63 @@
+import csv
+import json
+from itertools import islice
+from .models import Dividend, StockPrice
+
+EXPORTS = {
+  'prices': (StockPrice, ('open_price', 'high', 'low', 'close_price', 'volume')),
+  'dividends': (Dividend, ('value',)),
+}
+
+CONTENT_TYPES = {
+  'csv': 'text/csv; charset=utf-8',
+  'ndjson': 'application/x-ndjson',
+}
+
+
+def export_queryset(kind, symbols=None, start=None, end=None):
+  """Tuplas (symbol, date, *valores) ordenadas por ativo e data, sem instanciar modelos."""
+  model, fields = EXPORTS[kind]
+  queryset = model.objects.all()
+  if symbols:
+    queryset = queryset.filter(stock__symbol__in=symbols)
+  if start:
+    queryset = queryset.filter(date__gte=start)
+  if end:
+    queryset = queryset.filter(date__lte=end)
+
+  return queryset.order_by('stock_id', 'date').values_list('stock__symbol', 'date', *fields)
+
+
+class _Echo:
+  def write(self, value):
+    return value
+
+
+def encode_csv(header, rows, rows_per_chunk=1000):
+  writer = csv.writer(_Echo())
+  yield writer.writerow(header)
+  while chunk := list(islice(rows, rows_per_chunk)):
+    yield ''.join(writer.writerow(row) for row in chunk)
+
+
+def encode_ndjson(header, rows, rows_per_chunk=1000):
+  encoder = json.JSONEncoder(default=str, separators=(',', ':'))
+  while chunk := list(islice(rows, rows_per_chunk)):
+    yield ''.join(encoder.encode(dict(zip(header, row))) + '\n' for row in chunk)
+
+
+ENCODERS = {'csv': encode_csv, 'ndjson': encode_ndjson}
+
+
+def stream_export(kind, file_format, symbols=None, start=None, end=None, chunk_size=2000):
+  """
+  Gera o arquivo em pedaços lendo o banco com iterator(chunk_size): no
+  PostgreSQL isso usa um cursor do lado do servidor, então a memória do
+  worker não depende do tamanho da exportação.
+  """
+  queryset = export_queryset(kind, symbols, start, end)
+  # O arquivo é gerado depois que a view retorna; o banco escolhido pelo
+  # roteador (réplica, se houver) fica fixado agora.
+  queryset = queryset.using(queryset.db)
+  header = ['symbol', 'date', *EXPORTS[kind][1]]
+  return ENCODERS[file_format](header, queryset.iterator(chunk_size=chunk_size))
@@ -0,0 +1,178 @@
+from functools import lru_cache
+import numpy as np
+
+BLOCK = 64
+
+
+@lru_cache(maxsize=32)
+def _ema_kernel(alpha):
+  decay = 1.0 - alpha
+  lag = np.arange(BLOCK)[:, None] - np.arange(BLOCK)[None, :]
+  weights = np.where(lag >= 0, alpha * decay ** np.maximum(lag, 0), 0.0)
+  return weights.T, decay ** np.arange(1, BLOCK + 1)
+
+
+def ema(values, alpha, initial=None):
+  """
+  Média móvel exponencial y[i] = alpha * x[i] + (1 - alpha) * y[i - 1] ao
+  longo do último eixo. Sem `initial` a média começa no primeiro valor.
+
+  A recorrência é resolvida em blocos de BLOCK barras: dentro do bloco a
+  contribuição das entradas sai de um produto por uma matriz de pesos fixa, e
+  só o valor que passa de um bloco para o outro é propagado em Python. Com
+  uma matriz (ativos x barras) todos os ativos avançam juntos.
+  """
+  values = np.asarray(values, dtype=np.float64)
+  length = values.shape[-1]
+  if length == 0:
+    return values.copy()
+
+  weights, carry = _ema_kernel(alpha)
+  blocks = np.zeros(values.shape[:-1] + (length + -length % BLOCK,))
+  blocks[..., :length] = values
+  blocks = blocks.reshape(*values.shape[:-1], -1, BLOCK)
+  result = blocks @ weights
+
+  previous = values[..., 0] if initial is None else np.asarray(initial, dtype=np.float64)
+  for block in range(blocks.shape[-2]):
+    result[..., block, :] += carry * previous[..., None]
+    previous = result[..., block, -1]
+
+  return result.reshape(*values.shape[:-1], -1)[..., :length]
+
+
+def rolling_mean_std(values, window):
+  """Média e desvio padrão populacional móveis; as window - 1 primeiras posições ficam NaN."""
+  values = np.asarray(values, dtype=np.float64)
+  mean = np.full(values.shape, np.nan)
+  std = np.full(values.shape, np.nan)
+  if values.shape[-1] < window:
+    return mean, std
+
+  # Centrar no primeiro valor evita o cancelamento da soma dos quadrados.
+  centered = values - values[..., :1]
+  zeros = np.zeros(values.shape[:-1] + (1,))
+  sums = np.concatenate((zeros, np.cumsum(centered, -1)), -1)
+  squares = np.concatenate((zeros, np.cumsum(centered ** 2, -1)), -1)
+  window_sum = sums[..., window:] - sums[..., :-window]
+  window_squares = squares[..., window:] - squares[..., :-window]
+
+  mean[..., window - 1:] = window_sum / window + values[..., :1]
+  std[..., window - 1:] = np.sqrt(np.maximum(window_squares / window - (window_sum / window) ** 2, 0))
+  return mean, std
+
+
+class IndicatorSet:
+  """
+  Indicadores de um ativo alinhados às barras da série (datas em ordinais
+  int32). `state` guarda as colunas brutas, sem o NaN do aquecimento, que
+  servem de ponto de partida para a atualização incremental.
+  """
+
+  def __init__(self, dates, state):
+    self.dates = dates
+    self.state = state
+
+  def __len__(self):
+    return len(self.dates)
+
+  @property
+  def nbytes(self):
+    return self.dates.nbytes + sum(column.nbytes for column in self.state.values())
+
+
+class IndicatorEngine:
+  """
+  SMA, EMA, RSI, MACD, bandas de Bollinger e ATR calculados de uma vez sobre
+  a série inteira. Com o resultado anterior, `compute` recalcula só a última
+  barra já conhecida (que pode ter sido revista) e as novas.
+
+  RSI e ATR usam a suavização de Wilder (alpha = 1 / n) começando na
+  primeira barra; os primeiros n valores ficam NaN enquanto aquecem.
+  """
+
+  def __init__(self, sma_window=20, ema_window=20, rsi_window=14, macd=(12, 26, 9),
+               bollinger=(20, 2), atr_window=14):
+    self.sma_window = sma_window
+    self.ema_window = ema_window
+    self.rsi_window = rsi_window
+    self.macd_fast, self.macd_slow, self.macd_signal = macd
+    self.bollinger_window, self.bollinger_width = bollinger
+    self.atr_window = atr_window
+
+  def resume_index(self, series, previous):
+    """Primeira barra a recalcular; 0 se o histórico anterior mudou."""
+    if previous is None or len(previous) < 2 or len(series) < len(previous) - 1:
+      return 0
+    known = len(previous) - 2
+    return known + 1 if series.dates[known] == previous.dates[known] else 0
+
+  def compute(self, series, previous=None):
+    start = self.resume_index(series, previous)
+    new = self._compute_from(series, start, previous.state if start else None)
+    if start:
+      new = {name: np.concatenate((previous.state[name][:start], column)) for name, column in new.items()}
+    return IndicatorSet(series.dates, new)
+
+  def _compute_from(self, series, start, state):
+    def initial(name):
+      return None if state is None else state[name][start - 1]
+
+    def window(size):
+      # As barras anteriores a `start` que a janela móvel ainda enxerga.
+      return series.close[max(0, start - size + 1):] / 100
+
+    high = series.high[start:] / 100
+    low = series.low[start:] / 100
+    current = series.close[start:] / 100
+    if start:
+      previous_close = series.close[start - 1:-1] / 100
+    else:
+      previous_close = np.concatenate((current[:1], current[:-1]))
+
+    change = current - previous_close
+    true_range = np.maximum(high - low, np.maximum(abs(high - previous_close), abs(low - previous_close)))
+    if not start and len(true_range):
+      true_range[0] = high[0] - low[0]
+
+    ema_fast = ema(current, 2 / (self.macd_fast + 1), initial('ema_fast'))
+    ema_slow = ema(current, 2 / (self.macd_slow + 1), initial('ema_slow'))
+    sma, _ = rolling_mean_std(window(self.sma_window), self.sma_window)
+    middle, deviation = rolling_mean_std(window(self.bollinger_window), self.bollinger_window)
+    new_bars = len(current)
+
+    return {
+      'sma': sma[len(sma) - new_bars:],
+      'ema': ema(current, 2 / (self.ema_window + 1), initial('ema')),
+      'ema_fast': ema_fast,
+      'ema_slow': ema_slow,
+      'signal': ema(ema_fast - ema_slow, 2 / (self.macd_signal + 1), initial('signal')),
+      'avg_gain': ema(np.maximum(change, 0), 1 / self.rsi_window, initial('avg_gain')),
+      'avg_loss': ema(np.maximum(-change, 0), 1 / self.rsi_window, initial('avg_loss')),
+      'bb_middle': middle[len(middle) - new_bars:],
+      'bb_std': deviation[len(deviation) - new_bars:],
+      'atr': ema(true_range, 1 / self.atr_window, initial('atr')),
+    }
+
+  def outputs(self, indicators, start=0, stop=None):
+    """Colunas públicas entre as barras [start:stop], com NaN no aquecimento."""
+    state = {name: column[start:stop] for name, column in indicators.state.items()}
+    index = np.arange(len(indicators))[start:stop]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+      rsi = np.where(state['avg_loss'] == 0, 100.0, 100 - 100 / (1 + state['avg_gain'] / state['avg_loss']))
+    macd = state['ema_fast'] - state['ema_slow']
+    band = self.bollinger_width * state['bb_std']
+
+    return {
+      f'sma_{self.sma_window}': state['sma'],
+      f'ema_{self.ema_window}': state['ema'],
+      f'rsi_{self.rsi_window}': np.where(index < self.rsi_window, np.nan, rsi),
+      'macd': macd,
+      'macd_signal': state['signal'],
+      'macd_hist': macd - state['signal'],
+      'bb_middle': state['bb_middle'],
+      'bb_upper': state['bb_middle'] + band,
+      'bb_lower': state['bb_middle'] - band,
+      f'atr_{self.atr_window}': np.where(index < self.atr_window - 1, np.nan, state['atr']),
+    }
@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import Dividend, Stock, StockPrice
+
+CENT = Decimal('0.01')
+
+KINDS = {
+  'prices': (StockPrice, ('open_price', 'close_price', 'high', 'low', 'volume')),
+  'dividends': (Dividend, ('value',)),
+}
+
+
+def detect_format(path):
+  path = str(path)
+  if path.endswith('.parquet'):
+    return 'parquet'
+  if path.endswith(('.ndjson', '.jsonl')):
+    return 'ndjson'
+  return 'csv'
+
+
+def chunked(iterable, size):
+  iterator = iter(iterable)
+  while chunk := list(islice(iterator, size)):
+    yield chunk
+
+
+def read_batches(path, file_format=None, batch_size=50_000):
+  """
+  Lê o arquivo em lotes de dicionários sem carregá-lo inteiro. Parquet depende
+  do pyarrow, que não faz parte das dependências do projeto.
+  """
+  file_format = file_format or detect_format(path)
+
+  if file_format == 'parquet':
+    import pyarrow.parquet
+
+    for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=batch_size):
+      yield batch.to_pylist()
+    return
+
+  with open(path, newline='', encoding='utf-8') as source:
+    if file_format == 'csv':
+      rows = csv.DictReader(source)
+    else:
+      rows = (json.loads(line) for line in source if line.strip())
+    yield from chunked(rows, batch_size)
+
+
+class SymbolMap:
+  """Mapa symbol -> id de Stock carregado uma vez e completado sob demanda."""
+
+  def __init__(self, create_missing=False, using='default'):
+    self.create_missing = create_missing
+    self.using = using
+    self.ids = dict(Stock.objects.using(using).values_list('symbol', 'id'))
+
+  def resolve(self, symbols):
+    missing = set(symbols) - self.ids.keys()
+    if missing and self.create_missing:
+      Stock.objects.using(self.using).bulk_create(
+        [Stock(symbol=symbol, company_name=symbol, sector='') for symbol in missing],
+        ignore_conflicts=True
+      )
+      self.ids.update(
+        Stock.objects.using(self.using).filter(symbol__in=missing).values_list('symbol', 'id')
+      )
+    return self.ids
+
+
+def _parse_date(value):
+  return value if isinstance(value, date) else date.fromisoformat(str(value).strip()[:10])
+
+
+def _parse_value(field, value):
+  if field == 'volume':
+    return int(Decimal(str(value)))
+  return Decimal(str(value).strip()).quantize(CENT)
+
+
+def prepare_rows(kind, rows, symbol_map):
+  """
+  Converte um lote em tuplas (stock_id, date, *valores). Retorna (registros,
+  rejeitadas); linhas repetidas para o mesmo (stock, date) ficam com a última.
+  """
+  _, fields = KINDS[kind]
+  ids = symbol_map.resolve({(row.get('symbol') or '').strip().upper() for row in rows})
+  records, rejected = {}, []
+
+  for row in rows:
+    stock_id = ids.get((row.get('symbol') or '').strip().upper())
+    if stock_id is None:
+      rejected.append((row, 'símbolo desconhecido'))
+      continue
+
+    try:
+      day = _parse_date(row['date'])
+      values = tuple(_parse_value(field, row[field]) for field in fields)
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+      rejected.append((row, 'valores inválidos'))
+      continue
+
+    records[(stock_id, day)] = values
+
+  return [(stock_id, day, *values) for (stock_id, day), values in records.items()], rejected
+
+
+def _copy_upsert(connection, model, fields, records):
+  # COPY para uma tabela temporária e um único INSERT ... ON CONFLICT dela
+  # para a tabela real; bem mais rápido que INSERTs com milhares de parâmetros.
+  quote = connection.ops.quote_name
+  table = model._meta.db_table
+  columns = ['stock_id', 'date'] + [model._meta.get_field(field).column for field in fields]
+  column_list = ', '.join(quote(column) for column in columns)
+  staging = quote(f'{table}_ingest')
+
+  buffer = io.StringIO()
+  csv.writer(buffer).writerows(records)
+  copy_sql = f'COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)'
+
+  with connection.cursor() as cursor:
+    cursor.execute(
+      f'CREATE TEMP TABLE {staging} ON COMMIT DROP AS '
+      f'SELECT {column_list} FROM {quote(table)} WITH NO DATA'
+    )
+
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy_expert'):
+      buffer.seek(0)
+      raw_cursor.copy_expert(copy_sql, buffer)
+    else:
+      with raw_cursor.copy(copy_sql) as copy:
+        copy.write(buffer.getvalue())
+
+    updates = ', '.join(f'{quote(column)} = EXCLUDED.{quote(column)}' for column in columns[2:])
+    cursor.execute(
+      f'INSERT INTO {quote(table)} ({column_list}) SELECT {column_list} FROM {staging} '
+      f'ON CONFLICT ({quote("stock_id")}, {quote("date")}) DO UPDATE SET {updates}'
+    )
+
+
+def upsert(kind, records, using='default'):
+  """Grava os registros de um lote numa transação e atualiza Stock.last_update."""
+  model, fields = KINDS[kind]
+  connection = connections[using]
+
+  with transaction.atomic(using=using):
+    if connection.vendor == 'postgresql':
+      _copy_upsert(connection, model, fields, records)
+    else:
+      model.objects.using(using).bulk_create(
+        [
+          model(stock_id=stock_id, date=day, **dict(zip(fields, values)))
+          for stock_id, day, *values in records
+        ],
+        update_conflicts=True,
+        unique_fields=['stock', 'date'],
+        update_fields=list(fields)
+      )
+
+    Stock.objects.using(using).filter(
+      pk__in={record[0] for record in records}
+    ).update(last_update=timezone.now())
+
+  return len(records)
@@ -0,0 +1,66 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from financial.indicators import IndicatorEngine
+from financial.series import PriceSeries
+
+
+def synthetic_series(bars, rng, first_day=730_000):
+  close = np.maximum(100, 5_000 + np.cumsum(rng.integers(-60, 61, bars)))
+  open = close + rng.integers(-30, 31, bars)
+  return PriceSeries(
+    np.arange(first_day, first_day + bars, dtype=np.int32),
+    open,
+    np.maximum(open, close) + rng.integers(0, 40, bars),
+    np.minimum(open, close) - rng.integers(0, 40, bars),
+    close,
+    rng.integers(1_000, 1_000_000, bars),
+  )
+
+
+class Command(BaseCommand):
+  help = (
+    'Mede o IndicatorEngine em séries sintéticas: cálculo completo de cada '
+    'ativo e atualização incremental com uma barra nova.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--symbols', type=int, default=5_000)
+    parser.add_argument('--years', type=int, default=20)
+
+  def handle(self, *args, **options):
+    rng = np.random.default_rng(0)
+    bars = options['years'] * 252
+    engine = IndicatorEngine()
+    full = incremental = 0.0
+    mismatch = False
+
+    for symbol in range(options['symbols']):
+      series = synthetic_series(bars + 1, rng)
+      known = series.slice(0, bars)
+
+      started = time.perf_counter()
+      indicators = engine.compute(known)
+      full += time.perf_counter() - started
+
+      started = time.perf_counter()
+      updated = engine.compute(series, indicators)
+      incremental += time.perf_counter() - started
+
+      if symbol == 0:
+        expected = engine.outputs(engine.compute(series))
+        mismatch = any(
+          not np.allclose(column, expected[name], equal_nan=True)
+          for name, column in engine.outputs(updated).items()
+        )
+
+    total_bars = options['symbols'] * bars
+    self.stdout.write(f"{options['symbols']:,} ativos x {bars:,} barras = {total_bars:,} barras")
+    self.stdout.write(f'cálculo completo: {full:.2f}s ({total_bars / full:,.0f} barras/s)')
+    self.stdout.write(
+      f"atualização incremental (1 barra por ativo): {incremental:.2f}s "
+      f"({incremental / options['symbols'] * 1e6:,.0f} µs/ativo)"
+    )
+    if mismatch:
+      self.stderr.write(self.style.ERROR('Atualização incremental diverge do cálculo completo!'))
+    self.stdout.write(self.style.SUCCESS(f'ganho da atualização incremental: {full / incremental:.1f}x'))
@@ -0,0 +1,59 @@
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from financial.ingest import upsert
+from financial.models import Stock, StockPrice
+from financial.views import PricePagination
+
+
+class Command(BaseCommand):
+  help = (
+    'Compara paginação por OFFSET com a paginação por cursor de /api/prices/ '
+    'em várias profundidades. Os dados sintéticos são descartados no final.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--stocks', type=int, default=100)
+    parser.add_argument('--days', type=int, default=5_000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+
+  def handle(self, *args, **options):
+    with transaction.atomic():
+      self.load(options['stocks'], options['days'])
+      self.measure(options['page_size'], options['repeat'])
+      transaction.set_rollback(True)
+
+  def load(self, stocks, days):
+    Stock.objects.bulk_create([
+      Stock(symbol=f'BNCH{n}', company_name=f'Benchmark {n}', sector='') for n in range(stocks)
+    ])
+    first = date(2000, 1, 3)
+    for stock_id in Stock.objects.filter(symbol__startswith='BNCH').values_list('id', flat=True):
+      upsert('prices', [(stock_id, first + timedelta(days=n), 10, 10, 10, 10, 1000) for n in range(days)])
+    self.stdout.write(f'{stocks * days:,} barras sintéticas')
+
+  def best_of(self, repeat, func):
+    best = float('inf')
+    for _ in range(repeat):
+      started = time.perf_counter()
+      func()
+      best = min(best, time.perf_counter() - started)
+    return best
+
+  def measure(self, page_size, repeat):
+    paginator = PricePagination()
+    queryset = StockPrice.objects.order_by(*paginator.ordering)
+    total = queryset.count()
+
+    for fraction in (0, 0.1, 0.5, 0.9, 0.99):
+      offset = int(total * fraction)
+      anchor = queryset.values('stock_id', 'date')[max(offset - 1, 0)]
+      cursor = paginator.after(['stock_id', 'date'], [anchor['stock_id'], anchor['date']])
+
+      by_offset = self.best_of(repeat, lambda: list(queryset[offset:offset + page_size]))
+      by_cursor = self.best_of(repeat, lambda: list(queryset.filter(cursor)[:page_size]))
+      self.stdout.write(
+        f'offset {offset:>10,}: OFFSET {by_offset * 1000:8.2f}ms | cursor {by_cursor * 1000:6.2f}ms'
+      )
@@ -0,0 +1,35 @@
+from rest_framework import serializers
+from .models import StockPrice
+from .series import parse_interval
+
+
+class DateRangeQuerySerializer(serializers.Serializer):
+  start = serializers.DateField(required=False)
+  end = serializers.DateField(required=False)
+
+  def validate(self, attrs):
+    if attrs.get('start') and attrs.get('end') and attrs['start'] > attrs['end']:
+      raise serializers.ValidationError('start deve ser anterior a end.')
+    return attrs
+
+
+class PriceHistoryQuerySerializer(DateRangeQuerySerializer):
+  interval = serializers.CharField(default='daily')
+
+  def validate_interval(self, value):
+    try:
+      return parse_interval(value)
+    except ValueError as error:
+      raise serializers.ValidationError(str(error))
+
+
+class PriceListQuerySerializer(DateRangeQuerySerializer):
+  symbol = serializers.ListField(child=serializers.CharField(max_length=10), required=False)
+
+
+class StockPriceSerializer(serializers.ModelSerializer):
+  symbol = serializers.CharField(source='stock.symbol', read_only=True)
+
+  class Meta:
+    model = StockPrice
+    fields = ('symbol', 'date', 'open_price', 'high', 'low', 'close_price', 'volume')
@@ -0,0 +1,159 @@
+import re
+from datetime import date
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from .models import StockPrice
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+INTERVAL_ALIASES = {'daily': '1d', 'weekly': '1w', 'monthly': '1M'}
+INTERVAL = re.compile(r'^(?P<count>[1-9]\d{0,3})(?P<unit>[dwM])$')
+
+
+class PriceSeries:
+  """
+  Histórico de um ativo em colunas NumPy ordenadas por data: datas como
+  ordinais (date.toordinal) em int32, preços em centavos em int64 e volume em
+  int64.
+  """
+
+  COLUMNS = ('dates', 'open', 'high', 'low', 'close', 'volume')
+
+  def __init__(self, dates, open, high, low, close, volume):
+    self.dates = dates
+    self.open = open
+    self.high = high
+    self.low = low
+    self.close = close
+    self.volume = volume
+
+  @classmethod
+  def empty(cls):
+    return cls(np.empty(0, np.int32), *(np.empty(0, np.int64) for _ in range(5)))
+
+  @classmethod
+  def from_rows(cls, rows):
+    """Monta a série a partir de tuplas (date, open, high, low, close, volume), com os preços em float."""
+    if not rows:
+      return cls.empty()
+
+    # Uma coluna por campo, direto no dtype final: sem array de objetos.
+    dates, *prices, volume = zip(*rows)
+    return cls(
+      np.fromiter(map(date.toordinal, dates), np.int32, len(dates)),
+      *(np.rint(np.array(column, dtype=np.float64) * 100).astype(np.int64) for column in prices),
+      np.array(volume, dtype=np.int64)
+    )
+
+  def __len__(self):
+    return len(self.dates)
+
+  @property
+  def nbytes(self):
+    return sum(getattr(self, column).nbytes for column in self.COLUMNS)
+
+  def slice(self, start, stop):
+    return PriceSeries(*(getattr(self, column)[start:stop] for column in self.COLUMNS))
+
+  def append(self, other):
+    """Nova série com as barras de `other` substituindo as de mesma data em diante."""
+    if len(other) == 0:
+      return self
+    keep = np.searchsorted(self.dates, other.dates[0], 'left')
+    return PriceSeries(*(
+      np.concatenate((getattr(self, column)[:keep], getattr(other, column)))
+      for column in self.COLUMNS
+    ))
+
+  def index_range(self, start=None, end=None):
+    """Posições [lo, hi) das barras com start <= data <= end; cada limite é opcional."""
+    lo = 0 if start is None else int(np.searchsorted(self.dates, start.toordinal(), 'left'))
+    hi = len(self) if end is None else int(np.searchsorted(self.dates, end.toordinal(), 'right'))
+    return lo, hi
+
+  def between(self, start=None, end=None):
+    return self.slice(*self.index_range(start, end))
+
+  def bars(self):
+    """Barras como dicionários; preços em string com duas casas, como o DRF serializa Decimal."""
+    return [
+      {
+        'date': date.fromordinal(day).isoformat(),
+        'open': _format_cents(open),
+        'high': _format_cents(high),
+        'low': _format_cents(low),
+        'close': _format_cents(close),
+        'volume': volume,
+      }
+      for day, open, high, low, close, volume in zip(*(getattr(self, column).tolist() for column in self.COLUMNS))
+    ]
+
+
+def _format_cents(value):
+  sign = '-' if value < 0 else ''
+  whole, cents = divmod(abs(value), 100)
+  return f'{sign}{whole}.{cents:02d}'
+
+
+def load_series(stock_id, since=None, until=None):
+  """Carrega o histórico do banco; `since` e `until` limitam as datas (inclusive) na consulta."""
+  queryset = StockPrice.objects.filter(stock_id=stock_id)
+  if since is not None:
+    queryset = queryset.filter(date__gte=since)
+  if until is not None:
+    queryset = queryset.filter(date__lte=until)
+
+  # Os preços já vêm do banco como float, não como Decimal.
+  prices = {f'{field}_float': Cast(field, FloatField()) for field in ('open_price', 'high', 'low', 'close_price')}
+  return PriceSeries.from_rows(list(
+    queryset.annotate(**prices).order_by('date').values_list('date', *prices, 'volume')
+  ))
+
+
+def parse_interval(value):
+  """'daily', 'weekly', 'monthly' ou '<n>d', '<n>w', '<n>M'; retorna (n, unidade)."""
+  match = INTERVAL.match(INTERVAL_ALIASES.get(value, value))
+  if match is None:
+    raise ValueError(f'Intervalo inválido: {value}')
+  return int(match['count']), match['unit']
+
+
+def bucket_keys(dates, count, unit, anchor=None):
+  """
+  Chave de agrupamento por barra. Semanas começam na segunda-feira e meses no
+  dia 1; intervalos em dias são contados a partir de `anchor` (o primeiro dia
+  da série por padrão).
+  """
+  if unit == 'd':
+    anchor = dates[0] if anchor is None else anchor
+    return (dates.astype(np.int64) - anchor) // count
+  if unit == 'w':
+    # O ordinal 1 (01/01/0001) é uma segunda-feira.
+    return (dates.astype(np.int64) - 1) // (7 * count)
+
+  months = (dates.astype(np.int64) - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]')
+  return months.astype(np.int64) // count
+
+
+def resample(series, count, unit, anchor=None):
+  """
+  Agrega a série em barras maiores numa única passada vetorizada: abertura da
+  primeira barra, máxima, mínima, fechamento da última e soma do volume. A
+  data de cada barra agregada é a do primeiro pregão do período.
+  """
+  if len(series) == 0 or (count, unit) == (1, 'd'):
+    return series
+
+  keys = bucket_keys(series.dates, count, unit, anchor)
+  starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+  ends = np.append(starts[1:], len(keys)) - 1
+
+  return PriceSeries(
+    series.dates[starts],
+    series.open[starts],
+    np.maximum.reduceat(series.high, starts),
+    np.minimum.reduceat(series.low, starts),
+    series.close[ends],
+    np.add.reduceat(series.volume, starts),
+  )
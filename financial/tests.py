@@ -1,3 +1,452 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+import numpy as np
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from full_auth.pagination import KeysetPagination
+from users.models import Subscription, UserAccount
+from .cache import PriceSeriesCache, indicator_cache, price_cache
+from .indicators import IndicatorEngine, ema, rolling_mean_std
+from .ingest import SymbolMap, prepare_rows, upsert
+from .models import Dividend, Stock, StockPrice
+from .series import PriceSeries, load_series, parse_interval, resample
 
-# Create your tests here.
+
+def write_file(test, content, suffix):
+  path = tempfile.mktemp(suffix=suffix)
+  with open(path, 'w', encoding='utf-8') as target:
+    target.write(content)
+  test.addCleanup(os.remove, path)
+  return path
+
+
+class IngestMarketDataTests(TestCase):
+  def setUp(self):
+    self.petr = Stock.objects.create(symbol='PETR4', company_name='Petrobras', sector='Energia')
+
+  def test_upserts_prices_in_batches(self):
+    lines = ['symbol,date,open_price,close_price,high,low,volume']
+    lines += [f'petr4,2024-01-0{day},30.10,30.50,31.00,29.90,{day}000' for day in range(1, 6)]
+    lines += ['PETR4,2024-01-01,1,2,3,0.5,10', 'XXXX3,2024-01-01,1,1,1,1,1', 'PETR4,ontem,1,1,1,1,1']
+    out, err = StringIO(), StringIO()
+    last_update = self.petr.last_update
+
+    call_command('ingest_market_data', 'prices', write_file(self, '\n'.join(lines), '.csv'),
+                 batch_size=3, stdout=out, stderr=err)
+
+    self.assertEqual(StockPrice.objects.count(), 5)
+    price = StockPrice.objects.get(stock=self.petr, date=date(2024, 1, 1))
+    self.assertEqual((price.close_price, price.volume), (Decimal('2.00'), 10))
+    self.assertIn('6 gravadas, 2 rejeitadas', out.getvalue())
+    self.assertIn('símbolo desconhecido', err.getvalue())
+    self.petr.refresh_from_db()
+    self.assertGreater(self.petr.last_update, last_update)
+
+    call_command('ingest_market_data', 'prices', write_file(self, lines[0] + '\n' + lines[1].replace('30.50', '32.00'), '.csv'),
+                 stdout=StringIO())
+
+    self.assertEqual(StockPrice.objects.count(), 5)
+    self.assertEqual(StockPrice.objects.get(stock=self.petr, date=date(2024, 1, 1)).close_price, Decimal('32.00'))
+
+  def test_loads_ndjson_dividends_creating_missing_stocks(self):
+    rows = [
+      {'symbol': 'VALE3', 'date': '2024-03-15', 'value': 2.73},
+      {'symbol': 'PETR4', 'date': '2024-03-15', 'value': '1.1'},
+    ]
+
+    call_command('ingest_market_data', 'dividends', write_file(self, '\n'.join(map(json.dumps, rows)), '.ndjson'),
+                 create_missing=True, stdout=StringIO())
+
+    self.assertEqual(Dividend.objects.get(stock__symbol='VALE3').value, Decimal('2.73'))
+    self.assertEqual(Dividend.objects.get(stock=self.petr).value, Decimal('1.10'))
+
+  def test_symbol_map_is_loaded_once(self):
+    symbol_map = SymbolMap()
+    rows = [{'symbol': 'PETR4', 'date': '2024-01-02', 'value': '1'}] * 3
+
+    with self.assertNumQueries(0):
+      records, rejected = prepare_rows('dividends', rows, symbol_map)
+
+    self.assertEqual(records, [(self.petr.pk, date(2024, 1, 2), Decimal('1.00'))])
+    self.assertEqual(rejected, [])
+
+
+def random_series(days=400, seed=0):
+  rng = np.random.default_rng(seed)
+  dates = np.array([day for day in range(date(2023, 1, 2).toordinal(), date(2023, 1, 2).toordinal() + days)
+                    if date.fromordinal(day).weekday() < 5], dtype=np.int32)
+  close = 3000 + np.cumsum(rng.integers(-50, 51, len(dates)))
+  open = close + rng.integers(-20, 21, len(dates))
+  return PriceSeries(
+    dates, open, np.maximum(open, close) + 10, np.minimum(open, close) - 10, close,
+    rng.integers(1_000, 100_000, len(dates))
+  )
+
+
+class ResampleTests(SimpleTestCase):
+  def naive(self, series, key):
+    groups = {}
+    for bar in series.bars():
+      groups.setdefault(key(date.fromisoformat(bar['date'])), []).append(bar)
+    return [
+      {
+        'date': bars[0]['date'],
+        'open': bars[0]['open'],
+        'high': max(bars, key=lambda bar: Decimal(bar['high']))['high'],
+        'low': min(bars, key=lambda bar: Decimal(bar['low']))['low'],
+        'close': bars[-1]['close'],
+        'volume': sum(bar['volume'] for bar in bars),
+      }
+      for bars in groups.values()
+    ]
+
+  def test_matches_naive_grouping(self):
+    series = random_series()
+    first = date.fromordinal(int(series.dates[0]))
+    cases = [
+      ('weekly', lambda day: day.isocalendar()[:2]),
+      ('monthly', lambda day: (day.year, day.month)),
+      ('3M', lambda day: (day.year * 12 + day.month - 1) // 3),
+      ('10d', lambda day: (day - first).days // 10),
+    ]
+
+    for interval, key in cases:
+      with self.subTest(interval=interval):
+        self.assertEqual(resample(series, *parse_interval(interval)).bars(), self.naive(series, key))
+
+  def test_daily_and_empty_series_are_returned_as_is(self):
+    series = random_series(10)
+    self.assertIs(resample(series, 1, 'd'), series)
+    self.assertEqual(len(resample(PriceSeries.empty(), 1, 'w')), 0)
+
+  def test_rejects_unknown_intervals(self):
+    for interval in ('', '0d', '1y', 'hourly', '1m'):
+      with self.subTest(interval=interval), self.assertRaises(ValueError):
+        parse_interval(interval)
+
+
+class StockPriceHistoryTests(TestCase):
+  def setUp(self):
+    price_cache.clear()
+    self.client = APIClient()
+    self.client.force_authenticate(
+      UserAccount.objects.create_user(email='user@example.com', password='S3nha-forte!', first_name='Ana', last_name='Silva')
+    )
+    self.stock = Stock.objects.create(symbol='PETR4', company_name='Petrobras', sector='Energia')
+    StockPrice.objects.bulk_create([
+      StockPrice(stock=self.stock, date=date(2024, 1, 1) + timedelta(days=n), open_price=10 + n,
+                 close_price=Decimal('10.5') + n, high=11 + n, low=9 + n, volume=100)
+      for n in range(40)
+    ])
+
+  def test_monthly_bars_within_range(self):
+    response = self.client.get(
+      reverse('stock-history', args=['petr4']), {'interval': 'monthly', 'start': '2024-01-10'}
+    )
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.data['interval'], '1M')
+    self.assertEqual(response.data['bars'], [
+      {'date': '2024-01-10', 'open': '19.00', 'high': '41.00', 'low': '18.00', 'close': '40.50', 'volume': 2200},
+      {'date': '2024-02-01', 'open': '41.00', 'high': '50.00', 'low': '40.00', 'close': '49.50', 'volume': 900},
+    ])
+
+  def test_conditional_get_follows_last_update(self):
+    url = reverse('stock-history', args=['PETR4'])
+    etag = self.client.get(url, {'interval': 'weekly'})['ETag']
+
+    with self.assertNumQueries(1):
+      self.assertEqual(self.client.get(url, {'interval': 'weekly'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+    self.assertEqual(self.client.get(url, {'interval': 'monthly'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    upsert('prices', [(self.stock.pk, date(2024, 3, 1), 1, 1, 1, 1, 1)])
+    self.assertEqual(self.client.get(url, {'interval': 'weekly'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+  def test_invalid_query(self):
+    url = reverse('stock-history', args=['PETR4'])
+    self.assertEqual(self.client.get(url, {'interval': '1y'}).status_code, 400)
+    self.assertEqual(self.client.get(url, {'start': '2024-02-01', 'end': '2024-01-01'}).status_code, 400)
+    self.assertEqual(self.client.get(reverse('stock-history', args=['XXXX3'])).status_code, 404)
+
+
+class PriceSeriesCacheTests(TestCase):
+  def setUp(self):
+    self.stock = Stock.objects.create(symbol='VALE3', company_name='Vale', sector='Mineração')
+    self.ingest([(date(2024, 1, 1) + timedelta(days=n), 60 + n) for n in range(10)])
+    self.cache = PriceSeriesCache()
+
+  def ingest(self, bars, stock=None):
+    stock = stock or self.stock
+    upsert('prices', [(stock.pk, day, *[Decimal(close)] * 4, 1000) for day, close in bars])
+    stock.refresh_from_db()
+
+  def test_hits_until_last_update_changes(self):
+    first = self.cache.get(self.stock)
+
+    with self.assertNumQueries(0):
+      self.assertIs(self.cache.get(self.stock), first)
+
+    self.assertEqual(len(first), 10)
+    self.assertEqual(first.dates.dtype, np.int32)
+    self.assertEqual(self.cache.stats['hits'], 1)
+    self.assertEqual(self.cache.stats['bytes'], first.nbytes)
+
+  def test_appends_new_bars_incrementally(self):
+    self.cache.get(self.stock)
+    self.ingest([(date(2024, 1, 10), 99), (date(2024, 1, 11), 100)])
+
+    with self.assertNumQueries(2):
+      series = self.cache.get(self.stock)
+
+    self.assertEqual(len(series), 11)
+    self.assertEqual(series.close[-2:].tolist(), [9900, 10000])
+    self.assertEqual(self.cache.stats['refreshes'], 1)
+
+  def test_reloads_after_backfill(self):
+    self.cache.get(self.stock)
+    self.ingest([(date(2023, 12, 29), 50), (date(2024, 1, 12), 70)])
+
+    series = self.cache.get(self.stock)
+
+    self.assertEqual(len(series), 12)
+    self.assertEqual(series.close[0], 5000)
+
+  def test_evicts_least_recently_used_within_budget(self):
+    other = Stock.objects.create(symbol='ITUB4', company_name='Itaú', sector='Bancos')
+    self.ingest([(date(2024, 1, 1) + timedelta(days=n), 30) for n in range(10)], other)
+    size = self.cache.get(self.stock).nbytes
+    self.cache.max_bytes = size * 3 // 2
+
+    self.cache.get(other)
+
+    self.assertEqual(self.cache.stats['entries'], 1)
+    self.assertEqual(self.cache.stats['evictions'], 1)
+    self.cache.get(other)
+    self.assertEqual(self.cache.stats['hit_rate'], 1 / 3)
+
+
+  def test_disabled_cache_pushes_the_date_range_into_the_query(self):
+    self.cache.max_bytes = 0
+
+    with CaptureQueriesContext(connection) as ctx:
+      series = self.cache.between(self.stock, date(2024, 1, 3), date(2024, 1, 5))
+
+    self.assertEqual(series.dates.tolist(), [date(2024, 1, day).toordinal() for day in (3, 4, 5)])
+    self.assertEqual(series.close.tolist(), [6200, 6300, 6400])
+    self.assertEqual(series.open.dtype, np.int64)
+    self.assertIn("""."date" <= '2024-01-05'""", ctx.captured_queries[0]['sql'])
+    self.assertEqual(self.cache.stats['entries'], 0)
+
+  def test_loads_each_column_with_exact_cents(self):
+    # open, close, high, low e volume, na ordem de ingest.KINDS.
+    upsert('prices', [(self.stock.pk, date(2024, 2, 1), Decimal('1.01'), Decimal('0.29'), Decimal('12345678.35'), Decimal('0.07'), 7)])
+
+    series = load_series(self.stock.pk, since=date(2024, 2, 1))
+
+    self.assertEqual(
+      [series.open.tolist(), series.high.tolist(), series.low.tolist(), series.close.tolist(), series.volume.tolist()],
+      [[101], [1234567835], [7], [29], [7]]
+    )
+
+
+class IndicatorEngineTests(SimpleTestCase):
+  def reference_ema(self, values, alpha):
+    result, previous = [], values[0]
+    for value in values:
+      previous = alpha * value + (1 - alpha) * previous
+      result.append(previous)
+    return result
+
+  def test_blocked_ema_matches_recurrence(self):
+    values = np.random.default_rng(1).normal(size=(2, 300)).cumsum(-1)
+
+    np.testing.assert_allclose(ema(values, 0.1), [self.reference_ema(row, 0.1) for row in values])
+    np.testing.assert_allclose(ema(values[0], 2 / 27, initial=5.0)[:1], [2 / 27 * values[0, 0] + 25 / 27 * 5.0])
+
+  def test_rolling_mean_std(self):
+    values = np.random.default_rng(2).normal(100, 5, 200)
+    windows = np.lib.stride_tricks.sliding_window_view(values, 20)
+
+    mean, std = rolling_mean_std(values, 20)
+
+    self.assertTrue(np.isnan(mean[:19]).all())
+    np.testing.assert_allclose(mean[19:], windows.mean(-1))
+    np.testing.assert_allclose(std[19:], windows.std(-1), atol=1e-9)
+
+  def test_incremental_update_matches_full_computation(self):
+    engine = IndicatorEngine()
+    series = random_series(300)
+    previous = engine.compute(series.slice(0, 150))
+    revised = series.slice(149, len(series))
+    revised.close = revised.close.copy()
+    revised.close[0] += 25
+    series = series.slice(0, 149).append(revised)
+
+    updated = engine.compute(series, previous)
+    expected = engine.outputs(engine.compute(series))
+
+    self.assertEqual(engine.resume_index(series, previous), 149)
+    for name, column in engine.outputs(updated).items():
+      np.testing.assert_allclose(column, expected[name], err_msg=name, equal_nan=True)
+
+  def test_outputs(self):
+    engine = IndicatorEngine()
+    outputs = engine.outputs(engine.compute(random_series(200)))
+    rsi = outputs['rsi_14']
+
+    self.assertTrue(np.isnan(rsi[:14]).all() and np.isnan(outputs['sma_20'][:19]).all())
+    self.assertTrue(((rsi[14:] >= 0) & (rsi[14:] <= 100)).all())
+    self.assertTrue((outputs['bb_upper'][19:] >= outputs['bb_lower'][19:]).all())
+    np.testing.assert_allclose(outputs['macd_hist'], outputs['macd'] - outputs['macd_signal'])
+
+
+class StockIndicatorsTests(TestCase):
+  def setUp(self):
+    price_cache.clear()
+    indicator_cache.clear()
+    self.user = UserAccount.objects.create_user(
+      email='user@example.com', password='S3nha-forte!', first_name='Ana', last_name='Silva'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+    self.stock = Stock.objects.create(symbol='PETR4', company_name='Petrobras', sector='Energia')
+    upsert('prices', [
+      (self.stock.pk, date(2024, 1, 1) + timedelta(days=n), *[Decimal(30 + n % 7)] * 4, 100)
+      for n in range(60)
+    ])
+
+  def test_requires_pro_plan(self):
+    url = reverse('stock-indicators', args=['PETR4'])
+    self.assertEqual(self.client.get(url).status_code, 403)
+
+    Subscription.objects.filter(user=self.user).update(plan_type='BULL')
+    self.client.force_authenticate(UserAccount.objects.get(pk=self.user.pk))
+    response = self.client.get(url, {'start': '2024-02-01'})
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.data['dates'][0], '2024-02-01')
+    self.assertEqual(len(response.data['indicators']['sma_20']), 29)
+    self.assertEqual(indicator_cache.stats['misses'], 1)
+
+    self.client.get(url)
+    self.assertEqual(indicator_cache.stats['hits'], 1)
+    self.assertIsNone(self.client.get(url).data['indicators']['rsi_14'][0])
+
+
+class StockPriceListTests(TestCase):
+  def setUp(self):
+    self.client = APIClient()
+    self.client.force_authenticate(
+      UserAccount.objects.create_user(email='user@example.com', password='S3nha-forte!', first_name='Ana', last_name='Silva')
+    )
+    for symbol in ('PETR4', 'VALE3', 'ITUB4'):
+      stock = Stock.objects.create(symbol=symbol, company_name=symbol, sector='')
+      upsert('prices', [(stock.pk, date(2024, 1, 1) + timedelta(days=n), 10, 10, 10, 10, n) for n in range(7)])
+
+  def test_walks_all_pages_in_key_order(self):
+    seen, url = [], reverse('price-list')
+    params = {'symbol': ['petr4', 'VALE3'], 'start': '2024-01-02', 'page_size': 4}
+
+    while url:
+      response = self.client.get(url, params)
+      self.assertEqual(response.status_code, 200)
+      seen += [(bar['symbol'], bar['date']) for bar in response.data['results']]
+      url, params = response.data['next'], None
+
+    expected = list(
+      StockPrice.objects.filter(stock__symbol__in=['PETR4', 'VALE3'], date__gte=date(2024, 1, 2))
+      .order_by('stock_id', 'date').values_list('stock__symbol', 'date')
+    )
+    self.assertEqual(seen, [(symbol, day.isoformat()) for symbol, day in expected])
+    self.assertEqual(len(seen), 12)
+
+  def test_deep_pages_use_the_cursor_not_an_offset(self):
+    first = self.client.get(reverse('price-list'), {'page_size': 10})
+
+    with CaptureQueriesContext(connection) as ctx:
+      self.client.get(first.data['next'])
+
+    self.assertNotIn('OFFSET', ctx.captured_queries[-1]['sql'])
+
+  def test_rejects_cursors_that_do_not_match_the_key(self):
+    for values in (['x', 'y'], [{'a': 1}, 2], [1, '2024-13-01']):
+      with self.subTest(cursor=values):
+        cursor = KeysetPagination().encode_cursor(values)
+        self.assertEqual(self.client.get(reverse('price-list'), {'cursor': cursor}).status_code, 404)
+
+
+class MarketDataExportTests(TestCase):
+  def setUp(self):
+    self.client = APIClient()
+    self.client.force_authenticate(
+      UserAccount.objects.create_user(email='user@example.com', password='S3nha-forte!', first_name='Ana', last_name='Silva')
+    )
+    for symbol in ('PETR4', 'VALE3'):
+      stock = Stock.objects.create(symbol=symbol, company_name=symbol, sector='')
+      upsert('prices', [(stock.pk, date(2024, 1, 1) + timedelta(days=n), 10, Decimal('10.5'), 11, 9, n) for n in range(3)])
+      upsert('dividends', [(stock.pk, date(2024, 3, 1), Decimal('0.42'))])
+
+  def export(self, name, **params):
+    response = self.client.get(reverse('market-data-export', args=name.split('.')), params)
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response.streaming)
+    return b''.join(response.streaming_content).decode()
+
+  def test_streams_csv(self):
+    content = self.export('prices.csv', symbol='vale3', end='2024-01-02')
+
+    self.assertEqual(content.splitlines(), [
+      'symbol,date,open_price,high,low,close_price,volume',
+      'VALE3,2024-01-01,10.00,11.00,9.00,10.50,0',
+      'VALE3,2024-01-02,10.00,11.00,9.00,10.50,1',
+    ])
+
+  def test_streams_ndjson(self):
+    lines = self.export('dividends.ndjson').splitlines()
+
+    self.assertEqual([json.loads(line) for line in lines], [
+      {'symbol': 'PETR4', 'date': '2024-03-01', 'value': '0.42'},
+      {'symbol': 'VALE3', 'date': '2024-03-01', 'value': '0.42'},
+    ])
+
+  def test_unknown_export(self):
+    self.assertEqual(self.client.get(reverse('market-data-export', args=['users', 'csv'])).status_code, 404)
+    self.assertEqual(self.client.get(reverse('market-data-export', args=['prices', 'xlsx'])).status_code, 404)
+
+
+@skipUnless('replica' in settings.DATABASES, 'rode com --settings=full_auth.test_settings')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class MarketDataReplicaTests(TestCase):
+  databases = {'default', 'replica'} & set(settings.DATABASES)
+
+  def setUp(self):
+    self.client = APIClient()
+    self.client.force_authenticate(
+      UserAccount.objects.create_user(email='user@example.com', password='S3nha-forte!', first_name='Ana', last_name='Silva')
+    )
+    # Só a réplica tem o ativo: a resposta mostra de onde veio a leitura.
+    stock = Stock.objects.using('replica').create(symbol='PETR4', company_name='Petrobras', sector='')
+    StockPrice.objects.using('replica').bulk_create([
+      StockPrice(stock=stock, date=date(2024, 1, 1) + timedelta(days=n), open_price=10, close_price=10, high=10, low=10, volume=n)
+      for n in range(3)
+    ])
+
+  def test_price_list_reads_the_replica(self):
+    response = self.client.get(reverse('price-list'), {'symbol': 'PETR4'})
+
+    self.assertEqual(len(response.data['results']), 3)
+
+  def test_export_streams_from_the_replica(self):
+    response = self.client.get(reverse('market-data-export', args=['prices', 'csv']))
+
+    self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 4)
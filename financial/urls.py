@@ -0,0 +1,9 @@
+from django.urls import path
+from .views import MarketDataExportView, StockIndicatorsView, StockPriceHistoryView, StockPriceListView
+
+urlpatterns = [
+  path('prices/', StockPriceListView.as_view(), name='price-list'),
+  path('exports/<str:kind>.<str:extension>', MarketDataExportView.as_view(), name='market-data-export'),
+  path('stocks/<str:symbol>/history/', StockPriceHistoryView.as_view(), name='stock-history'),
+  path('stocks/<str:symbol>/indicators/', StockIndicatorsView.as_view(), name='stock-indicators'),
+]
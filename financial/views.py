@@ -1,3 +1,142 @@
-from django.shortcuts import render
+from datetime import date
+import numpy as np
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework.generics import ListAPIView
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from full_auth.conditional import Validators
+from full_auth.pagination import KeysetPagination
+from full_auth.replicas import replica_reads
+from users.permissions import IsProUser
+from .cache import indicator_cache, price_cache
+from .export import CONTENT_TYPES, EXPORTS, stream_export
+from .models import Stock, StockPrice
+from .serializers import (
+  DateRangeQuerySerializer,
+  PriceHistoryQuerySerializer,
+  PriceListQuerySerializer,
+  StockPriceSerializer
+)
+from .series import resample
 
-# Create your views here.
+
+class StockPriceHistoryView(APIView):
+  """
+  Histórico OHLC de um ativo em barras diárias, semanais, mensais ou de N
+  dias/semanas/meses (?interval=3d, 2w, 6M), opcionalmente entre start e end.
+  """
+
+  @replica_reads()
+  def get(self, request, symbol):
+    stock = get_object_or_404(Stock, symbol=symbol.upper())
+    query = PriceHistoryQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+
+    validators = Validators(stock.last_update, request.get_full_path())
+    not_modified = validators.not_modified(request)
+    if not_modified:
+      return not_modified
+
+    count, unit = query.validated_data['interval']
+    start = query.validated_data.get('start')
+    series = price_cache.between(stock, start, query.validated_data.get('end'))
+    bars = resample(series, count, unit, anchor=start.toordinal() if start else None)
+
+    return validators.apply(Response({
+      'symbol': stock.symbol,
+      'interval': f'{count}{unit}',
+      'bars': bars.bars(),
+    }))
+
+
+class StockIndicatorsView(APIView):
+  """
+  Indicadores técnicos (SMA, EMA, RSI, MACD, Bollinger e ATR) em colunas
+  alinhadas a `dates`. Valores ainda em aquecimento vêm como null. Exclusivo
+  dos planos pro.
+  """
+  permission_classes = [IsProUser]
+
+  @replica_reads()
+  def get(self, request, symbol):
+    stock = get_object_or_404(Stock, symbol=symbol.upper())
+    query = DateRangeQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+
+    validators = Validators(stock.last_update, request.get_full_path())
+    not_modified = validators.not_modified(request)
+    if not_modified:
+      return not_modified
+
+    series = price_cache.get(stock)
+    indicators = indicator_cache.get(stock, series)
+    start, stop = series.index_range(query.validated_data.get('start'), query.validated_data.get('end'))
+    columns = indicator_cache.engine.outputs(indicators, start, stop)
+
+    return validators.apply(Response({
+      'symbol': stock.symbol,
+      'dates': [date.fromordinal(day).isoformat() for day in series.dates[start:stop].tolist()],
+      'indicators': {
+        name: np.where(np.isnan(column), None, column.round(4)).tolist()
+        for name, column in columns.items()
+      },
+    }))
+
+
+class PricePagination(KeysetPagination):
+  # Mesma ordem do índice único (stock, date).
+  ordering = ('stock_id', 'date')
+
+
+def parse_price_query(request):
+  query = PriceListQuerySerializer(data={
+    **request.query_params.dict(),
+    'symbol': request.query_params.getlist('symbol'),
+  })
+  query.is_valid(raise_exception=True)
+  data = query.validated_data
+  return [symbol.upper() for symbol in data.get('symbol', [])], data.get('start'), data.get('end')
+
+
+class StockPriceListView(ListAPIView):
+  """Barras diárias de um ou mais ativos (?symbol=PETR4&symbol=VALE3), paginadas por cursor."""
+  serializer_class = StockPriceSerializer
+  pagination_class = PricePagination
+
+  @replica_reads()
+  def list(self, request, *args, **kwargs):
+    return super().list(request, *args, **kwargs)
+
+  def get_queryset(self):
+    symbols, start, end = parse_price_query(self.request)
+
+    queryset = StockPrice.objects.select_related('stock')
+    if symbols:
+      queryset = queryset.filter(stock__symbol__in=symbols)
+    if start:
+      queryset = queryset.filter(date__gte=start)
+    if end:
+      queryset = queryset.filter(date__lte=end)
+    return queryset
+
+
+class MarketDataExportView(APIView):
+  """
+  Exporta cotações ou dividendos em CSV ou NDJSON (/exports/prices.csv,
+  /exports/dividends.ndjson...), com os mesmos filtros de /prices/. A
+  resposta é transmitida em pedaços à medida que as linhas saem do banco.
+  """
+
+  @replica_reads()
+  def get(self, request, kind, extension):
+    if kind not in EXPORTS or extension not in CONTENT_TYPES:
+      raise Http404
+
+    symbols, start, end = parse_price_query(request)
+    response = StreamingHttpResponse(
+      stream_export(kind, extension, symbols, start, end),
+      content_type=CONTENT_TYPES[extension]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{extension}"'
+    return response
@@ -0,0 +1,27 @@
+import hashlib
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+class Validators:
+  """
+  ETag fraco e Last-Modified de uma representação, calculados só a partir
+  de timestamps. `not_modified` devolve o 304 (ou 412) antes de qualquer
+  serialização; `apply` grava os cabeçalhos na resposta completa.
+  """
+
+  def __init__(self, last_modified, *parts):
+    self.last_modified = int(last_modified.timestamp())
+    digest = hashlib.sha1(':'.join(map(str, (*parts, last_modified.isoformat()))).encode()).hexdigest()
+    self.etag = f'W/"{digest[:32]}"'
+
+  def not_modified(self, request):
+    response = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+    return response and self.apply(response)
+
+  def apply(self, response):
+    response['ETag'] = self.etag
+    response['Last-Modified'] = http_date(self.last_modified)
+    # O cliente guarda a resposta, mas sempre revalida antes de usá-la.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,153 @@
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.renderers import JSONRenderer
+from .metrics import observe_connection, observe_request
+
+logger = logging.getLogger('instrumentation')
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+  """
+  Tempos de uma requisição: consultas e tempo de banco, autenticação,
+  serialização e total. As fases podem se sobrepor (a consulta do usuário
+  durante a autenticação conta em `db` e em `auth`).
+  """
+
+  PHASES = ('db', 'auth', 'serialize')
+
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.queries = 0
+    self.durations = dict.fromkeys(self.PHASES, 0.0)
+
+  def add(self, phase, seconds):
+    self.durations[phase] += seconds
+
+  def elapsed(self):
+    return time.perf_counter() - self.started
+
+  def server_timing(self, total):
+    metrics = [f'db;dur={self.durations["db"] * 1000:.2f};desc="{self.queries} queries"']
+    metrics += [f'{phase};dur={self.durations[phase] * 1000:.2f}' for phase in self.PHASES[1:]]
+    metrics.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(metrics)
+
+
+@contextmanager
+def timing(phase):
+  """Soma o tempo do bloco à fase `phase` da requisição atual, se houver uma."""
+  timings = _current.get()
+  if timings is None:
+    yield
+    return
+
+  started = time.perf_counter()
+  try:
+    yield
+  finally:
+    timings.add(phase, time.perf_counter() - started)
+
+
+def _record_query(execute, sql, params, many, context):
+  timings = _current.get()
+  if timings is None:
+    return execute(sql, params, many, context)
+
+  started = time.perf_counter()
+  try:
+    return execute(sql, params, many, context)
+  finally:
+    timings.queries += 1
+    timings.add('db', time.perf_counter() - started)
+
+
+def _install_query_recorder(sender, connection, **kwargs):
+  if _record_query not in connection.execute_wrappers:
+    connection.execute_wrappers.append(_record_query)
+
+
+class ServerTimingMiddleware:
+  """
+  Mede cada requisição e devolve os tempos no header Server-Timing. Uma
+  amostra (REQUEST_TIMING_SAMPLE_RATE) vira uma linha JSON no logger
+  'instrumentation'; requisições acima de REQUEST_TIMING_SLOW_MS são sempre
+  registradas, como WARNING. Em respostas em streaming o total vai até a view
+  retornar, não até o fim do corpo.
+
+  As consultas são contadas por um execute_wrapper instalado em toda conexão
+  aberta; como o estado fica num ContextVar, entram também as feitas pelas
+  views assíncronas em threads do sync_to_async. Os mesmos números alimentam
+  as métricas do Prometheus (full_auth/metrics.py).
+  """
+
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+    connection_created.connect(_install_query_recorder)
+    connection_created.connect(observe_connection)
+    for connection in connections.all(initialized_only=True):
+      _install_query_recorder(None, connection)
+    if iscoroutinefunction(get_response):
+      markcoroutinefunction(self)
+
+  def __call__(self, request):
+    if iscoroutinefunction(self):
+      return self.__acall__(request)
+
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+      response = self.get_response(request)
+    finally:
+      _current.reset(token)
+    return self.finish(request, response, timings)
+
+  async def __acall__(self, request):
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+      response = await self.get_response(request)
+    finally:
+      _current.reset(token)
+    return self.finish(request, response, timings)
+
+  def finish(self, request, response, timings):
+    total = timings.elapsed()
+    observe_request(request, response, total, timings)
+    if settings.REQUEST_TIMING_HEADER:
+      response['Server-Timing'] = timings.server_timing(total)
+
+    slow = total * 1000 >= settings.REQUEST_TIMING_SLOW_MS
+    if slow or random.random() < settings.REQUEST_TIMING_SAMPLE_RATE:
+      match = request.resolver_match
+      logger.log(logging.WARNING if slow else logging.INFO, json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'view': match.view_name if match else None,
+        'status': response.status_code,
+        'total_ms': round(total * 1000, 2),
+        'queries': timings.queries,
+        **{f'{phase}_ms': round(seconds * 1000, 2) for phase, seconds in timings.durations.items()},
+        'slow': slow,
+      }))
+    return response
+
+
+class TimedJSONRenderer(JSONRenderer):
+  """JSONRenderer que conta a codificação da resposta como serialização."""
+
+  def render(self, data, accepted_media_type=None, renderer_context=None):
+    with timing('serialize'):
+      return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,276 @@
+import atexit
+import hmac
+import json
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2)
+
+
+class Registry:
+  """
+  Métricas do processo no formato de exposição do Prometheus.
+
+  Cada thread incrementa o próprio dicionário, sem lock: o caminho quente é
+  um `+=` num dict que só ela escreve. As threads são somadas apenas na
+  coleta (`collect`). Com vários workers (gunicorn), cada processo grava o seu
+  total em `<pid>.json` no diretório METRICS_MULTIPROC_DIR a cada
+  METRICS_FLUSH_INTERVAL segundos e na saída; a coleta soma os arquivos de
+  todos os processos. Os arquivos de workers mortos ficam, para os contadores
+  não voltarem a zero; o diretório deve ser esvaziado a cada deploy.
+  """
+
+  def __init__(self):
+    self.families = {}
+    self._reset()
+    os.register_at_fork(after_in_child=self._reset)
+
+  def _reset(self):
+    # Também roda no filho de um fork: o que veio do pai não é deste processo.
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    self._shards = []
+    self._flusher = None
+
+  def counter(self, name, documentation, labelnames=()):
+    return self._register(Counter(self, name, documentation, labelnames))
+
+  def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+  def _register(self, family):
+    self.families[family.name] = family
+    return family
+
+  def shard(self):
+    try:
+      return self._local.shard
+    except AttributeError:
+      shard = self._local.shard = {}
+      with self._lock:
+        self._shards.append(shard)
+        if self._flusher is None and settings.METRICS_MULTIPROC_DIR:
+          self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+          self._flusher.start()
+      return shard
+
+  def _flush_loop(self):
+    while True:
+      time.sleep(settings.METRICS_FLUSH_INTERVAL)
+      try:
+        self.flush()
+      except OSError:
+        logger.exception('Falha ao gravar as métricas em %s', settings.METRICS_MULTIPROC_DIR)
+
+  def samples(self):
+    """Soma das threads do processo: {(nome, labels): valor}, com os labels já em texto."""
+    merged = {}
+    for shard in list(self._shards):
+      for (name, labels), value in shard.copy().items():
+        _merge(merged, (name, tuple(map(str, labels))), value)
+    return merged
+
+  def flush(self):
+    directory = settings.METRICS_MULTIPROC_DIR
+    if not directory:
+      return
+
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as target:
+      json.dump([[name, labels, value] for (name, labels), value in self.samples().items()], target)
+    os.replace(temporary, path)
+
+  def collect(self):
+    directory = settings.METRICS_MULTIPROC_DIR
+    if not directory:
+      return self.samples()
+
+    self.flush()
+    merged = {}
+    for entry in os.scandir(directory):
+      if not entry.name.endswith('.json'):
+        continue
+      try:
+        with open(entry.path, encoding='utf-8') as source:
+          rows = json.load(source)
+      except (OSError, ValueError):
+        continue
+      for name, labels, value in rows:
+        _merge(merged, (name, tuple(labels)), value)
+    return merged
+
+  def exposition(self):
+    samples = self.collect()
+    lines = []
+    for name, family in self.families.items():
+      lines.append(f'# HELP {name} {family.documentation}')
+      lines.append(f'# TYPE {name} {family.type}')
+      for (sample_name, labels), value in sorted(samples.items()):
+        if sample_name == name:
+          lines.extend(family.render(labels, value))
+    return '\n'.join(lines) + '\n'
+
+
+def _merge(merged, key, value):
+  current = merged.get(key)
+  if current is None:
+    merged[key] = list(value) if isinstance(value, list) else value
+  elif isinstance(current, list):
+    for index, item in enumerate(value):
+      current[index] += item
+  else:
+    merged[key] = current + value
+
+
+def _escape(value):
+  return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+  pairs = [*zip(names, values), *extra]
+  if not pairs:
+    return ''
+  return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+  if value == math.inf:
+    return '+Inf'
+  return repr(float(value))
+
+
+class Counter:
+  type = 'counter'
+
+  def __init__(self, registry, name, documentation, labelnames):
+    self.registry = registry
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+
+  def inc(self, amount=1, **labels):
+    shard = self.registry.shard()
+    key = (self.name, tuple(map(labels.__getitem__, self.labelnames)))
+    shard[key] = shard.get(key, 0) + amount
+
+  def render(self, labels, value):
+    yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Histogram:
+  """Valores por balde (não cumulativos), depois soma e contagem."""
+
+  type = 'histogram'
+
+  def __init__(self, registry, name, documentation, labelnames, buckets):
+    self.registry = registry
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self.buckets = (*buckets, math.inf)
+
+  def observe(self, value, **labels):
+    shard = self.registry.shard()
+    key = (self.name, tuple(map(labels.__getitem__, self.labelnames)))
+    values = shard.get(key)
+    if values is None:
+      values = shard[key] = [0] * (len(self.buckets) + 2)
+    values[bisect_left(self.buckets, value)] += 1
+    values[-2] += value
+    values[-1] += 1
+
+  def render(self, labels, values):
+    cumulative = 0
+    for bound, count in zip(self.buckets, values):
+      cumulative += count
+      yield f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", _number(bound))])} {_number(cumulative)}'
+    yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(values[-2])}'
+    yield f'{self.name}_count{_labels(self.labelnames, labels)} {_number(values[-1])}'
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+http_requests = registry.counter(
+  'http_requests_total', 'Requisições por view, método e status.', ('view', 'method', 'status')
+)
+http_request_duration = registry.histogram(
+  'http_request_duration_seconds', 'Latência das requisições por view e método.', ('view', 'method')
+)
+auth_events = registry.counter(
+  'auth_events_total', 'Logins, refreshes e verificações de token por resultado.', ('event', 'result')
+)
+avatar_upload_size = registry.histogram(
+  'avatar_upload_size_bytes', 'Tamanho dos avatares recebidos.', ('source',), buckets=SIZE_BUCKETS
+)
+db_connections_opened = registry.counter(
+  'db_connections_opened_total', 'Conexões abertas com o banco por alias.', ('alias',)
+)
+db_queries = registry.counter('db_queries_total', 'Consultas ao banco por view.', ('view',))
+db_query_duration = registry.counter(
+  'db_query_duration_seconds_total', 'Tempo gasto em consultas ao banco por view.', ('view',)
+)
+
+# Views de autenticação (nomes das rotas, iguais nas versões síncrona e
+# assíncrona) e o evento que cada uma conta em auth_events.
+AUTH_EVENTS = {
+  'jwt-create': 'login',
+  'jwt-refresh': 'refresh',
+  'jwt-verify': 'verify',
+}
+
+
+def auth_result(status_code):
+  if status_code < 300:
+    return 'success'
+  if status_code in (429, 503):
+    return 'throttled'
+  return 'failure'
+
+
+def observe_request(request, response, seconds, timings):
+  """Chamado pelo ServerTimingMiddleware ao fim de cada requisição."""
+  match = request.resolver_match
+  view = match.view_name if match else 'unmatched'
+
+  http_requests.inc(view=view, method=request.method, status=response.status_code)
+  http_request_duration.observe(seconds, view=view, method=request.method)
+  if timings.queries:
+    db_queries.inc(timings.queries, view=view)
+    db_query_duration.inc(timings.durations['db'], view=view)
+  if view in AUTH_EVENTS:
+    auth_events.inc(event=AUTH_EVENTS[view], result=auth_result(response.status_code))
+
+
+def observe_connection(sender, connection, **kwargs):
+  db_connections_opened.inc(alias=connection.alias)
+
+
+@require_GET
+def metrics_view(request):
+  """
+  Exposição para o Prometheus; com METRICS_TOKEN definido, exige Bearer. Sem
+  o token o endpoint só responde em DEVELOPMENT_MODE; fora dele, 404.
+  """
+  if not settings.METRICS_TOKEN and not settings.DEVELOPMENT_MODE:
+    return HttpResponse(status=404)
+
+  if settings.METRICS_TOKEN:
+    expected = f'Bearer {settings.METRICS_TOKEN}'.encode()
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+      return HttpResponse(status=401)
+
+  return HttpResponse(registry.exposition(), content_type=CONTENT_TYPE)
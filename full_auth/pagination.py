@@ -0,0 +1,113 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+  """
+  Paginação por cursor sobre uma chave composta (`ordering`), por exemplo
+  ('stock_id', 'date') ou ('-created_at', '-id'). Cada página continua da
+  última linha da anterior com um WHERE sobre a chave, então o custo não
+  cresce com a profundidade desde que exista um índice na mesma ordem. Todos
+  os campos precisam ter a mesma direção, e a chave precisa ser única.
+
+  Só navega para frente: a resposta traz `next` e `results`.
+  """
+
+  ordering = ('pk',)
+  page_size = 100
+  max_page_size = 1000
+  cursor_query_param = 'cursor'
+  page_size_query_param = 'page_size'
+  invalid_cursor_message = 'Cursor inválido.'
+
+  def paginate_queryset(self, queryset, request, view=None):
+    self.request = request
+    self.page_size = self.get_page_size(request)
+    fields = [field.lstrip('-') for field in self.ordering]
+
+    cursor = self.decode_cursor(request, queryset.model)
+    if cursor is not None:
+      queryset = queryset.filter(self.after(fields, cursor))
+
+    rows = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+    self.has_next = len(rows) > self.page_size
+    rows = rows[:self.page_size]
+    self.next_position = [self.get_value(rows[-1], field) for field in fields] if rows else None
+    return rows
+
+  def after(self, fields, values):
+    # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y). O "a >= x" redundante
+    # na frente dá ao banco um ponto de partida no índice; sem ele o OR vira
+    # uma varredura desde o início.
+    lookup = 'lt' if self.ordering[0].startswith('-') else 'gt'
+    condition = Q()
+    for index, field in enumerate(fields):
+      equal = {name: value for name, value in zip(fields[:index], values)}
+      condition |= Q(**equal, **{f'{field}__{lookup}': values[index]})
+    return Q(**{f'{fields[0]}__{lookup}e': values[0]}) & condition
+
+  def get_value(self, row, field):
+    value = row[field] if isinstance(row, dict) else getattr(row, field)
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+  def get_page_size(self, request):
+    try:
+      size = int(request.query_params[self.page_size_query_param])
+    except (KeyError, ValueError):
+      return self.page_size
+    return max(1, min(size, self.max_page_size))
+
+  def decode_cursor(self, request, model):
+    encoded = request.query_params.get(self.cursor_query_param)
+    if not encoded:
+      return None
+
+    try:
+      values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+    except (TypeError, ValueError):
+      raise NotFound(self.invalid_cursor_message)
+
+    if not isinstance(values, list) or len(values) != len(self.ordering):
+      raise NotFound(self.invalid_cursor_message)
+
+    # Cada valor volta ao tipo do campo da chave: um cursor adulterado vira 404
+    # aqui, e não um erro do banco (ou 500) no WHERE.
+    try:
+      values = [self.get_field(model, field).to_python(value) for field, value in zip(self.ordering, values)]
+    except (ValidationError, TypeError, ValueError):
+      raise NotFound(self.invalid_cursor_message)
+    if None in values:
+      raise NotFound(self.invalid_cursor_message)
+    return values
+
+  def get_field(self, model, field):
+    name = field.lstrip('-')
+    return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+  def encode_cursor(self, values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+  def get_next_link(self):
+    if not self.has_next:
+      return None
+    url = self.request.build_absolute_uri()
+    return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+  def get_paginated_response(self, data):
+    return Response({'next': self.get_next_link(), 'results': data})
+
+  def get_paginated_response_schema(self, schema):
+    return {
+      'type': 'object',
+      'required': ['results'],
+      'properties': {
+        'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+        'results': schema,
+      },
+    }
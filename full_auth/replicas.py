@@ -0,0 +1,130 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.base_user import AbstractBaseUser
+from django.core.cache import caches
+
+# Réplica escolhida para as leituras do bloco replica_reads em andamento.
+_replica = ContextVar('read_replica', default=None)
+# Estado da requisição atual (ReplicaPinMiddleware).
+_request = ContextVar('replica_request', default=None)
+
+
+class _RequestState:
+  __slots__ = ('wrote',)
+
+  def __init__(self):
+    self.wrote = False
+
+
+def _pin_key(user_id):
+  return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+  """Manda as leituras de `user_id` para o primário por REPLICA_PIN_SECONDS."""
+  caches[settings.REPLICA_PIN_CACHE_ALIAS].set(_pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+  return user_id is not None and caches[settings.REPLICA_PIN_CACHE_ALIAS].get(_pin_key(user_id)) is not None
+
+
+@contextmanager
+def replica_reads(user_id=None):
+  """
+  Leituras do bloco vão para uma das DATABASE_REPLICAS, a mesma durante todo
+  o bloco. Ficam no primário se não há réplicas, se a requisição já escreveu
+  ou se `user_id` escreveu há menos de REPLICA_PIN_SECONDS (read-your-writes).
+  Também serve como decorador, sem usuário, para leituras que não dependem de
+  quem pede.
+  """
+  replicas = settings.DATABASE_REPLICAS
+  state = _request.get()
+  if not replicas or (state is not None and state.wrote) or is_pinned(user_id):
+    yield
+    return
+
+  token = _replica.set(random.choice(replicas))
+  try:
+    yield
+  finally:
+    _replica.reset(token)
+
+
+class ReplicaRouter:
+  """
+  Roteador de DATABASE_ROUTERS: leituras dentro de replica_reads vão para a
+  réplica escolhida; todo o resto, inclusive qualquer escrita, vai para o
+  primário. A primeira escrita da requisição encerra o uso de réplicas até o
+  fim dela, e o ReplicaPinMiddleware prende o usuário ao primário por um tempo.
+  """
+
+  def db_for_read(self, model, **hints):
+    replica = _replica.get()
+    if replica is None:
+      return None
+    state = _request.get()
+    if state is not None and state.wrote:
+      return None
+    return replica
+
+  def db_for_write(self, model, **hints):
+    state = _request.get()
+    if state is not None:
+      state.wrote = True
+    # Sem isso, salvar um objeto lido da réplica iria para a réplica.
+    return 'default'
+
+  def allow_relation(self, obj1, obj2, **hints):
+    # Réplicas têm os mesmos dados do primário.
+    return True
+
+
+class ReplicaPinMiddleware:
+  """
+  Acompanha as escritas de cada requisição e, se houve alguma, prende o
+  usuário autenticado ao primário por REPLICA_PIN_SECONDS, para as próximas
+  leituras dele não caírem numa réplica atrasada. O usuário é o que a
+  autenticação deixou em request.user (o DRF repassa o dele ao HttpRequest).
+  """
+
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+    if iscoroutinefunction(get_response):
+      markcoroutinefunction(self)
+
+  def __call__(self, request):
+    if iscoroutinefunction(self):
+      return self.__acall__(request)
+
+    state = _RequestState()
+    token = _request.set(state)
+    try:
+      response = self.get_response(request)
+    finally:
+      _request.reset(token)
+    self.finish(request, state)
+    return response
+
+  async def __acall__(self, request):
+    state = _RequestState()
+    token = _request.set(state)
+    try:
+      response = await self.get_response(request)
+    finally:
+      _request.reset(token)
+    self.finish(request, state)
+    return response
+
+  def finish(self, request, state):
+    # Só um usuário já carregado conta: o SimpleLazyObject da sessão não é
+    # avaliado aqui (no caminho assíncrono isso consultaria o banco).
+    user = getattr(request, 'user', None)
+    if state.wrote and settings.DATABASE_REPLICAS and issubclass(type(user), AbstractBaseUser):
+      pin_to_primary(user.pk)
@@ -1,5 +1,5 @@
 from datetime import timedelta
-from os import getenv, path
+from os import environ, getenv, path
 from pathlib import Path
 import sys
 import dj_database_url
@@ -43,9 +43,12 @@ INSTALLED_APPS = [
     'storages',
     'social_django',
     'users',    
+    'financial',
 ]
 
 MIDDLEWARE = [
+    'full_auth.instrumentation.ServerTimingMiddleware',
+    'full_auth.replicas.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -80,6 +83,39 @@ WSGI_APPLICATION = 'full_auth.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Reuso de conexões com o PostgreSQL, para a requisição não pagar connect e
+# handshake TLS. Por padrão cada thread mantém a conexão aberta por
+# DATABASE_CONN_MAX_AGE segundos e a testa antes de reusar (CONN_HEALTH_CHECKS).
+# DATABASE_POOL=True troca isso pelo pool do psycopg 3 (requer psycopg[pool]
+# no lugar do psycopg2); é o que serve sob ASGI, onde conexões persistentes não
+# são reaproveitadas entre requisições. O pool é por processo: com gunicorn,
+# DATABASE_POOL_MAX_SIZE deve cobrir as --threads de cada worker, e workers x
+# DATABASE_POOL_MAX_SIZE precisa caber no max_connections do banco. As réplicas
+# usam a mesma configuração, cada uma com o seu pool.
+DATABASE_CONN_MAX_AGE = int(getenv('DATABASE_CONN_MAX_AGE', '60'))
+DATABASE_POOL = getenv('DATABASE_POOL', 'False') == 'True'
+DATABASE_POOL_MIN_SIZE = int(getenv('DATABASE_POOL_MIN_SIZE', '1'))
+DATABASE_POOL_MAX_SIZE = int(getenv('DATABASE_POOL_MAX_SIZE', '4'))
+DATABASE_POOL_TIMEOUT = float(getenv('DATABASE_POOL_TIMEOUT', '10'))
+
+
+def database_from_url(url):
+    """Config de um banco a partir da URL, com o mesmo reuso de conexões do primário."""
+    config = dj_database_url.parse(
+        url,
+        conn_max_age=0 if DATABASE_POOL else DATABASE_CONN_MAX_AGE,
+        conn_health_checks=True,
+    )
+    if DATABASE_POOL:
+        config.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": DATABASE_POOL_MIN_SIZE,
+            "max_size": DATABASE_POOL_MAX_SIZE,
+            "timeout": DATABASE_POOL_TIMEOUT,
+        }
+    return config
+
+
+DATABASES = {}
 if DEVELOPMENT_MODE is True:
     DATABASES = {
         "default": {
@@ -91,12 +127,51 @@ elif len(sys.argv) > 0 and sys.argv[1] != 'collectstatic':
     if getenv("DATABASE_URL", None) is None:
         raise Exception("DATABASE_URL environment variable not defined")
     DATABASES = {
-        "default": dj_database_url.parse(getenv("DATABASE_URL")),
+        "default": database_from_url(getenv("DATABASE_URL")),
     }
 
+# Réplicas de leitura: cada DATABASE_URL_REPLICA_<N> vira o alias replica_<n>.
+# As leituras marcadas com full_auth.replicas.replica_reads (perfil e dados
+# de mercado) vão para uma delas; depois de uma escrita, o usuário fica no
+# primário por REPLICA_PIN_SECONDS, que deve passar do atraso de replicação.
+# Tokens revogados são lidos sempre do primário (users/revocation.py).
+# Com vários workers o pin precisa de um cache compartilhado
+# (REPLICA_PIN_CACHE_ALIAS).
+for name, url in sorted(environ.items()):
+    if name.startswith('DATABASE_URL_REPLICA_') and url:
+        DATABASES[f"replica_{name.removeprefix('DATABASE_URL_REPLICA_').lower()}"] = database_from_url(url)
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+
+DATABASE_ROUTERS = ['full_auth.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(getenv('REPLICA_PIN_SECONDS', '5'))
+REPLICA_PIN_CACHE_ALIAS = getenv('REPLICA_PIN_CACHE_ALIAS', 'default')
+
+# Cache. Sem CACHE_BACKEND é o LocMemCache, que é de cada processo: serve para
+# desenvolvimento e para um único worker. Em produção, com vários workers, os
+# limites de login (AUTH_LOGIN_THROTTLE_CACHE_ALIAS), o pin de réplica
+# (REPLICA_PIN_CACHE_ALIAS) e o cache de usuários (AUTH_USER_CACHE_ALIAS)
+# precisam de um cache compartilhado, por exemplo
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache e
+# CACHE_LOCATION=redis://host:6379/0 (requer o pacote redis). Fora do
+# DEVELOPMENT_MODE, `manage.py check` avisa se esses aliases são locais.
+CACHES = {
+    'default': {
+        'BACKEND': getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': getenv('CACHE_LOCATION', ''),
+    },
+}
+
 # Email settings
 
-EMAIL_BACKEND = 'django_ses.SESBackend'
+# As mensagens vão para a tabela OutboxEmail e são entregues pelo comando
+# drain_email_outbox usando o OUTBOX_DELIVERY_BACKEND.
+EMAIL_BACKEND = 'users.mail.OutboxEmailBackend'
+OUTBOX_DELIVERY_BACKEND = getenv('OUTBOX_DELIVERY_BACKEND', 'django_ses.SESBackend')
+OUTBOX_BATCH_SIZE = int(getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_MAX_ATTEMPTS = int(getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_RETRY_BASE_SECONDS = 60
+OUTBOX_RETRY_MAX_SECONDS = 60 * 60
+OUTBOX_LEASE_SECONDS = 5 * 60
 
 DEFAULT_FROM_EMAIL = getenv('AWS_SES_FROM_EMAIL')
 
@@ -144,6 +219,19 @@ USE_TZ = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = path.join(BASE_DIR, 'media')
 
+# Avatares são processados fora da requisição (0 processa na própria thread).
+AVATAR_PROCESSING_WORKERS = int(getenv('AVATAR_PROCESSING_WORKERS', '2'))
+# Os workers são threads do processo web, com os uploads na memória; acima
+# desse número de tarefas (em fila ou rodando) o upload responde 503.
+AVATAR_PROCESSING_BACKLOG = int(getenv('AVATAR_PROCESSING_BACKLOG', '32'))
+AVATAR_RENDITION_SIZES = (64, 128, 256)
+AVATAR_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+AVATAR_MAX_UPLOAD_SIZE = int(getenv('AVATAR_MAX_UPLOAD_SIZE', str(5 * 1024 * 1024)))
+AVATAR_UPLOAD_URL_EXPIRES = int(getenv('AVATAR_UPLOAD_URL_EXPIRES', '600'))  # segundos
+# Pendentes há mais que isso são reprocessados ou dados como falhos pelo
+# comando sweep_pending_avatars (rodar periodicamente, por exemplo no cron).
+AVATAR_PENDING_TIMEOUT = int(getenv('AVATAR_PENDING_TIMEOUT', '15'))  # minutos
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
@@ -183,7 +271,16 @@ REST_FRAMEWORK = {
     ],    
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'full_auth.instrumentation.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Proxies reversos na frente da aplicação. Com 0 o IP do cliente (limites de
+    # login) é o REMOTE_ADDR; com N, o N-ésimo endereço a partir do fim do
+    # X-Forwarded-For, o que o último proxy confiável anotou. Sem isso o DRF usaria o
+    # cabeçalho inteiro, que o cliente escolhe.
+    'NUM_PROXIES': int(getenv('NUM_PROXIES', '0')),
 }
 
 DJOSER = {
@@ -200,10 +297,43 @@ DJOSER = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=120),  # 30 minutos
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),     # 7 dias
-    'ROTATE_REFRESH_TOKENS': False,
+    'ROTATE_REFRESH_TOKENS': True,
+    # O refresh usado na rotação vai para users.revocation, não para o app
+    # token_blacklist do simplejwt (que consulta o banco em toda verificação).
     'BLACKLIST_AFTER_ROTATION': False,
 }
 
+# Assinatura assimétrica (RS256/ES256/EdDSA). Com HS256 o SIMPLE_JWT continua
+# assinando com a SECRET_KEY e o JWKS publicado fica vazio.
+JWT_SIGNING_ALGORITHM = getenv('JWT_SIGNING_ALGORITHM', 'HS256')
+JWT_KEYS_DIR = getenv('JWT_KEYS_DIR')
+JWT_ACTIVE_KEY_ID = getenv('JWT_ACTIVE_KEY_ID')
+JWKS_MAX_AGE = int(getenv('JWKS_MAX_AGE', '3600'))
+
+JWT_VERIFY_BATCH_MAX_SIZE = int(getenv('JWT_VERIFY_BATCH_MAX_SIZE', '500'))
+
+# Sob ASGI (full_auth/asgi.py liga AUTH_ASYNC_VIEWS) as views de token são
+# assíncronas e o hash das senhas roda num pool de AUTH_HASH_WORKERS threads.
+AUTH_ASYNC_VIEWS = getenv('AUTH_ASYNC_VIEWS', 'False') == 'True'
+AUTH_HASH_WORKERS = int(getenv('AUTH_HASH_WORKERS', '4'))
+
+# Login: janela deslizante de tentativas por IP e por e-mail (no cache
+# AUTH_LOGIN_THROTTLE_CACHE_ALIAS, que precisa ser compartilhado entre os
+# workers; veja CACHES) e limite de hashes simultâneos por processo.
+AUTH_LOGIN_THROTTLE_CACHE_ALIAS = getenv('AUTH_LOGIN_THROTTLE_CACHE_ALIAS', 'default')
+AUTH_LOGIN_THROTTLE_WINDOW = int(getenv('AUTH_LOGIN_THROTTLE_WINDOW', '60'))  # segundos
+AUTH_LOGIN_THROTTLE_IP_LIMIT = int(getenv('AUTH_LOGIN_THROTTLE_IP_LIMIT', '30'))
+AUTH_LOGIN_THROTTLE_EMAIL_LIMIT = int(getenv('AUTH_LOGIN_THROTTLE_EMAIL_LIMIT', '10'))
+AUTH_LOGIN_MAX_CONCURRENT_HASHES = int(getenv('AUTH_LOGIN_MAX_CONCURRENT_HASHES', getenv('AUTH_HASH_WORKERS', '4')))
+AUTH_LOGIN_HASH_WAIT = float(getenv('AUTH_LOGIN_HASH_WAIT', '0.5'))  # segundos
+
+# Tokens revogados (logout e rotação) ficam na tabela RevokedToken até expirar,
+# com filtros de Bloom por balde de expiração em cada processo na frente dela.
+AUTH_REVOCATION_BUCKET_SECONDS = int(getenv('AUTH_REVOCATION_BUCKET_SECONDS', '3600'))
+AUTH_REVOCATION_BLOOM_CAPACITY = int(getenv('AUTH_REVOCATION_BLOOM_CAPACITY', '4096'))  # por balde
+AUTH_REVOCATION_BLOOM_ERROR_RATE = float(getenv('AUTH_REVOCATION_BLOOM_ERROR_RATE', '0.001'))
+AUTH_REVOCATION_SYNC_INTERVAL = int(getenv('AUTH_REVOCATION_SYNC_INTERVAL', '5'))  # segundos
+
 AUTH_COOKIE = 'access'
 AUTH_COOKIE_ACCESS_MAX_AGE = 60 * 60 * 2
 AUTH_COOKIE_REFRESH_MAX_AGE = 60 * 60 * 24
@@ -212,6 +342,18 @@ AUTH_COOKIE_HTTP_ONLY = True
 AUTH_COOKIE_PATH = '/'
 AUTH_COOKIE_SAMESITE = None
 
+# Usuários autenticados em cache (users/cache.py). 'local' é por processo: com
+# vários workers, desativar um usuário ou trocar a senha só chega aos outros
+# depois de AUTH_USER_CACHE_TTL. Por isso o padrão fora do DEVELOPMENT_MODE é
+# 'django', no cache AUTH_USER_CACHE_ALIAS, que precisa ser compartilhado.
+AUTH_USER_CACHE_BACKEND = getenv('AUTH_USER_CACHE_BACKEND', 'local' if DEVELOPMENT_MODE else 'django')  # 'local' ou 'django'
+AUTH_USER_CACHE_ALIAS = getenv('AUTH_USER_CACHE_ALIAS', 'default')
+AUTH_USER_CACHE_MAX_SIZE = int(getenv('AUTH_USER_CACHE_MAX_SIZE', '10000'))
+AUTH_USER_CACHE_TTL = int(getenv('AUTH_USER_CACHE_TTL', '60'))  # segundos
+
+PRICE_SERIES_CACHE_MAX_BYTES = int(getenv('PRICE_SERIES_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+INDICATOR_CACHE_MAX_BYTES = int(getenv('INDICATOR_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
 SOCIAL_AUTH_GOOGLE_OAUTH2_KEY = getenv('GOOGLE_AUTH_KEY')
 SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET = getenv('GOOGLE_AUTH_SECRET_KEY')
 SOCIAL_AUTH_GOOGLE_OAUTH2_SCOPE = [
@@ -252,9 +394,30 @@ LOGGING = {
             'handlers': ['console', 'file'],
             'level': 'ERROR',
         },
+        'instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
     },
 }
 
+# Tempos por requisição (full_auth.instrumentation.ServerTimingMiddleware):
+# header Server-Timing e uma linha JSON para a amostra e para as requisições
+# lentas.
+REQUEST_TIMING_HEADER = getenv('REQUEST_TIMING_HEADER', 'True') == 'True'
+REQUEST_TIMING_SAMPLE_RATE = float(getenv('REQUEST_TIMING_SAMPLE_RATE', '0.01'))
+REQUEST_TIMING_SLOW_MS = float(getenv('REQUEST_TIMING_SLOW_MS', '500'))
+
+# Métricas do Prometheus em /metrics (full_auth/metrics.py). Com vários
+# workers, aponte METRICS_MULTIPROC_DIR para um diretório compartilhado, vazio
+# a cada deploy; cada processo grava ali seus totais a cada
+# METRICS_FLUSH_INTERVAL segundos.
+METRICS_MULTIPROC_DIR = getenv('METRICS_MULTIPROC_DIR') or None
+METRICS_FLUSH_INTERVAL = float(getenv('METRICS_FLUSH_INTERVAL', '5'))
+# Token Bearer exigido em /metrics. Fora do DEVELOPMENT_MODE, sem ele o
+# endpoint fica desligado (404).
+METRICS_TOKEN = getenv('METRICS_TOKEN') or None
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -0,0 +1,10 @@
+# Settings dos testes: python manage.py test --settings=full_auth.test_settings
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES, path
+
+# Um segundo SQLite, 'replica', fora de DATABASE_REPLICAS; os testes do
+# roteador o ativam com override_settings.
+DATABASES["replica"] = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": path.join(BASE_DIR, "replica.sqlite3"),
+}
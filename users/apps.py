@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from rest_framework_simplejwt import state
+        from .keys import build_token_backend, get_key_ring
+
+        # Com assinatura assimétrica, todos os tokens do simplejwt (inclusive os
+        # emitidos pelo login social do djoser) passam a usar o KeyRing.
+        key_ring = get_key_ring()
+        if key_ring is not None:
+            state.token_backend = build_token_backend(key_ring)
@@ -0,0 +1,210 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import serializers
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import PasswordField, TokenObtainSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+from .authentication import CustomJWTAuthentication
+from .revocation import revocation_store
+from .serializers import REVOKED_TOKEN
+from .throttling import login_throttle
+from .tokens import EntitledRefreshToken
+
+User = get_user_model()
+
+# PBKDF2 prende a CPU; o pool limita quantos hashes rodam ao mesmo tempo sem
+# bloquear o event loop nem a thread única do sync_to_async.
+hash_executor = ThreadPoolExecutor(max_workers=settings.AUTH_HASH_WORKERS, thread_name_prefix='password-hash')
+
+REQUIRED = serializers.Field.default_error_messages['required']
+NO_ACTIVE_ACCOUNT = TokenObtainSerializer.default_error_messages['no_active_account']
+
+# Os mesmos campos do TokenObtainSerializer, para o login assíncrono aceitar e
+# recusar (400) exatamente os mesmos valores que o síncrono.
+CREDENTIAL_FIELDS = {User.USERNAME_FIELD: serializers.CharField(), 'password': PasswordField()}
+
+
+async def run_hash(func, *args):
+  return await asyncio.get_running_loop().run_in_executor(hash_executor, func, *args)
+
+
+def read_data(request):
+  if request.content_type != 'application/json':
+    return request.POST.dict()
+
+  try:
+    data = json.loads(request.body or b'{}')
+  except ValueError:
+    return None
+  return data if isinstance(data, dict) else None
+
+
+def error(detail, status, code=None):
+  return JsonResponse({'detail': str(detail), **({'code': code} if code else {})}, status=status)
+
+
+def refused(exc):
+  response = error(exc.detail, exc.status_code, exc.default_code)
+  response['Retry-After'] = str(exc.wait)
+  return response
+
+
+def required(*fields):
+  return JsonResponse({field: [str(REQUIRED)] for field in fields}, status=400)
+
+
+def validate_credentials(data):
+  credentials, errors = {}, {}
+  for name, field in CREDENTIAL_FIELDS.items():
+    try:
+      credentials[name] = field.run_validation(data.get(name, serializers.empty))
+    except ValidationError as exc:
+      errors[name] = exc.detail
+  return credentials, errors
+
+
+def set_auth_cookie(response, name, value, max_age):
+  response.set_cookie(
+    name,
+    value,
+    max_age=max_age,
+    path=settings.AUTH_COOKIE_PATH,
+    secure=settings.AUTH_COOKIE_SECURE,
+    httponly=settings.AUTH_COOKIE_HTTP_ONLY,
+    samesite=settings.AUTH_COOKIE_SAMESITE
+  )
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncTokenObtainPairView(View):
+  """Equivalente assíncrono de CustomTokenObtainPairView."""
+
+  async def post(self, request, *args, **kwargs):
+    data = read_data(request)
+    if data is None:
+      return error('JSON inválido.', 400, 'parse_error')
+
+    credentials, errors = validate_credentials(data)
+    if errors:
+      return JsonResponse(errors, status=400)
+
+    try:
+      await login_throttle.acheck(request, credentials[User.USERNAME_FIELD])
+      async with login_throttle.ahash_slot():
+        user = await self.authenticate(credentials[User.USERNAME_FIELD], credentials['password'])
+    except APIException as exc:
+      return refused(exc)
+
+    if not api_settings.USER_AUTHENTICATION_RULE(user):
+      return error(NO_ACTIVE_ACCOUNT, 401, 'no_active_account')
+
+    refresh = EntitledRefreshToken.for_user(user)
+    access = await refresh.aaccess_token()
+    if api_settings.UPDATE_LAST_LOGIN:
+      await User.objects.filter(pk=user.pk).aupdate(last_login=timezone.now())
+
+    response = JsonResponse({'refresh': str(refresh), 'access': str(access)})
+    set_auth_cookie(response, 'access', str(access), settings.AUTH_COOKIE_ACCESS_MAX_AGE)
+    set_auth_cookie(response, 'refresh', str(refresh), settings.AUTH_COOKIE_REFRESH_MAX_AGE)
+    return response
+
+  async def authenticate(self, username, password):
+    # Mesmo critério do ModelBackend, inclusive o hash de mentira quando o
+    # usuário não existe, para o tempo de resposta não revelar o e-mail.
+    user = await User._default_manager.filter(**{User.USERNAME_FIELD: username}).afirst()
+    if user is None:
+      await run_hash(make_password, password)
+      return None
+
+    if await run_hash(user.check_password, password) and user.is_active:
+      return user
+    return None
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncTokenRefreshView(View):
+  """Equivalente assíncrono de CustomTokenRefreshView."""
+
+  async def post(self, request, *args, **kwargs):
+    data = read_data(request) or {}
+    raw_token = request.COOKIES.get('refresh') or data.get('refresh')
+    if not raw_token:
+      return required('refresh')
+
+    try:
+      refresh = EntitledRefreshToken(raw_token)
+    except TokenError as exc:
+      return error(exc.args[0], 401, InvalidToken.default_code)
+    if await revocation_store.ais_token_revoked(refresh):
+      return error(REVOKED_TOKEN, 401, InvalidToken.default_code)
+    if api_settings.ROTATE_REFRESH_TOKENS and not await revocation_store.aclaim_token(refresh):
+      return error(REVOKED_TOKEN, 401, InvalidToken.default_code)
+
+    body = {'access': str(await refresh.aaccess_token())}
+    if api_settings.ROTATE_REFRESH_TOKENS:
+      refresh.set_jti()
+      refresh.set_exp()
+      refresh.set_iat()
+      body['refresh'] = str(refresh)
+
+    response = JsonResponse(body)
+    set_auth_cookie(response, 'access', body['access'], settings.AUTH_COOKIE_ACCESS_MAX_AGE)
+    if 'refresh' in body:
+      set_auth_cookie(response, 'refresh', body['refresh'], settings.AUTH_COOKIE_REFRESH_MAX_AGE)
+    return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncTokenVerifyView(View):
+  """Equivalente assíncrono de CustomTokenVerifyView."""
+
+  async def post(self, request, *args, **kwargs):
+    data = read_data(request) or {}
+    raw_token = request.COOKIES.get('access') or data.get('token')
+    if not raw_token:
+      return required('token')
+
+    try:
+      token = UntypedToken(raw_token)
+    except TokenError as exc:
+      return error(exc.args[0], 401, InvalidToken.default_code)
+    if await revocation_store.ais_token_revoked(token):
+      return error(REVOKED_TOKEN, 401, InvalidToken.default_code)
+
+    return JsonResponse({})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncLogoutView(View):
+  """Equivalente assíncrono de LogoutView."""
+
+  async def post(self, request, *args, **kwargs):
+    # Como LogoutView, não exige um access token válido.
+    result = await CustomJWTAuthentication().aauthenticate(request)
+    tokens = []
+    if result is not None:
+      request.user, tokens = result[0], [result[1]]
+    refresh_token = request.COOKIES.get('refresh') or (read_data(request) or {}).get('refresh')
+    if refresh_token:
+      try:
+        tokens.append(RefreshToken(refresh_token))
+      except TokenError:
+        pass
+    if tokens:
+      await revocation_store.arevoke_tokens(*tokens)
+
+    response = HttpResponse(status=204)
+    response.delete_cookie('access')
+    response.delete_cookie('refresh')
+    return response
@@ -1,9 +1,21 @@
 from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from full_auth.instrumentation import timing
+from .cache import user_cache
+from .revocation import revocation_store
 
 
 class CustomJWTAuthentication(JWTAuthentication):
   def authenticate(self, request):
+    with timing('auth'):
+      return self._authenticate(request)
+
+  def _authenticate(self, request):
     try:
        
       header = self.get_header(request)
@@ -19,4 +31,66 @@ class CustomJWTAuthentication(JWTAuthentication):
 
       return self.get_user(validated_token), validated_token
     except:
-       return None
\ No newline at end of file
+       return None
+
+  def get_validated_token(self, raw_token):
+    validated_token = super().get_validated_token(raw_token)
+    if revocation_store.is_token_revoked(validated_token):
+      raise InvalidToken(_("Token is revoked"))
+    return validated_token
+
+  def get_user(self, validated_token):
+    user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+    token_id = validated_token.get(api_settings.JTI_CLAIM)
+
+    if user_id is None or token_id is None:
+      return super().get_user(validated_token)
+
+    user = user_cache.get(user_id, token_id)
+    if user is None:
+      user = super().get_user(validated_token)
+      user_cache.set(user_id, token_id, user)
+
+    return user
+
+  async def aauthenticate(self, request):
+    """authenticate para views assíncronas do Django (fora do DRF)."""
+    with timing('auth'):
+      return await self._aauthenticate(request)
+
+  async def _aauthenticate(self, request):
+    try:
+      header = self.get_header(request)
+      raw_token = request.COOKIES.get(settings.AUTH_COOKIE) if header is None else self.get_raw_token(header)
+      if raw_token is None:
+        return None
+
+      validated_token = super().get_validated_token(raw_token)
+      if await revocation_store.ais_token_revoked(validated_token):
+        return None
+      return await self.aget_user(validated_token), validated_token
+    except Exception:
+      return None
+
+  async def aget_user(self, validated_token):
+    """get_user para views assíncronas: mesmo cache, consulta pelo ORM assíncrono."""
+    user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+    token_id = validated_token.get(api_settings.JTI_CLAIM)
+
+    user = user_cache.get(user_id, token_id) if user_id is not None and token_id is not None else None
+    if user is not None:
+      return user
+
+    user = await self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+    if user is None:
+      raise AuthenticationFailed(_("User not found"), code="user_not_found")
+    if not user.is_active:
+      raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+    if api_settings.CHECK_REVOKE_TOKEN and (
+      validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+    ):
+      raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+    if token_id is not None:
+      user_cache.set(user_id, token_id, user)
+    return user
@@ -0,0 +1,382 @@
+import logging
+import re
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+from PIL import Image, ImageOps
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from full_auth.metrics import avatar_upload_size
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+RENDITION_FORMATS = {
+  'webp': ('WEBP', {'quality': 80, 'method': 4}),
+  'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+RENDITION_NAME = re.compile(r'^(?P<base>.+)/(?P<size>\d+)\.(?P<ext>webp|jpg)$')
+
+
+class AvatarPipelineFull(APIException):
+  status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+  default_detail = 'Muitos avatares em processamento, tente novamente em instantes.'
+  default_code = 'avatar_pipeline_full'
+
+
+def rendition_name(base, size, ext):
+  return f'{base}/{size}.{ext}'
+
+
+def main_rendition_name(base):
+  return rendition_name(base, max(settings.AVATAR_RENDITION_SIZES), 'jpg')
+
+
+def rendition_names(avatar_name):
+  """Todas as renditions irmãs de `avatar_name`, ou o próprio arquivo se for um upload antigo."""
+  match = RENDITION_NAME.match(avatar_name or '')
+  if match is None:
+    return [avatar_name] if avatar_name else []
+
+  return [
+    rendition_name(match['base'], size, ext)
+    for size in settings.AVATAR_RENDITION_SIZES
+    for ext in RENDITION_FORMATS
+  ]
+
+
+def rendition_urls(avatar_name, storage=None):
+  storage = storage or default_storage
+  match = RENDITION_NAME.match(avatar_name or '')
+  if match is None:
+    return {}
+
+  return {
+    str(size): {ext: storage.url(rendition_name(match['base'], size, ext)) for ext in RENDITION_FORMATS}
+    for size in settings.AVATAR_RENDITION_SIZES
+  }
+
+
+def render_avatar(data, sizes):
+  """
+  Decodifica a imagem uma única vez e gera um quadrado por tamanho em cada
+  formato de RENDITION_FORMATS. Os metadados (EXIF, ICC, comentários) não são
+  copiados para as renditions.
+  """
+  largest = max(sizes)
+
+  with Image.open(BytesIO(data)) as source:
+    # Em JPEG o draft reduz a imagem já na decodificação.
+    source.draft('RGB', (largest * 2, largest * 2))
+    image = ImageOps.exif_transpose(source).convert('RGB')
+
+  image = ImageOps.fit(image, (largest, largest), Image.Resampling.LANCZOS)
+  image.info = {}
+
+  renditions = {}
+  for size in sorted(sizes, reverse=True):
+    if image.width != size:
+      image = image.resize((size, size), Image.Resampling.LANCZOS)
+
+    for ext, (image_format, params) in RENDITION_FORMATS.items():
+      buffer = BytesIO()
+      image.save(buffer, image_format, **params)
+      renditions[(size, ext)] = buffer.getvalue()
+
+  return renditions
+
+
+def schedule_avatar(profile, upload_id, func, *args):
+  """
+  Marca `upload_id` como o avatar pendente do perfil e agenda `func` no
+  pipeline. Se o pipeline está cheio o perfil volta ao estado anterior e
+  AvatarPipelineFull (503) sobe para a view.
+  """
+  previous = (profile.avatar_status, profile.avatar_upload_id)
+  UserProfile.objects.filter(pk=profile.pk).update(
+    avatar_status=UserProfile.AVATAR_PENDING,
+    avatar_upload_id=upload_id,
+    update_at=timezone.now()
+  )
+  profile.avatar_status = UserProfile.AVATAR_PENDING
+  profile.avatar_upload_id = upload_id
+
+  try:
+    pipeline.submit(func, *args)
+  except AvatarPipelineFull:
+    UserProfile.objects.filter(pk=profile.pk, avatar_upload_id=upload_id).update(
+      avatar_status=previous[0],
+      avatar_upload_id=previous[1]
+    )
+    profile.avatar_status, profile.avatar_upload_id = previous
+    raise
+
+
+def enqueue_avatar(profile, upload):
+  """Marca o avatar como pendente e agenda o processamento; retorna o id do upload."""
+  upload_id = uuid.uuid4().hex
+  avatar_upload_size.observe(upload.size, source='multipart')
+  schedule_avatar(
+    profile,
+    upload_id,
+    process_avatar,
+    profile.pk,
+    upload_id,
+    UserProfile.avatar_path(profile, upload_id),
+    upload.read(),
+    profile.avatar.name or None
+  )
+  return upload_id
+
+
+def direct_upload_name(profile, upload_id):
+  return f'{UserProfile.avatar_path(profile, upload_id)}/original'
+
+
+def request_direct_upload(profile, content_type, storage=None):
+  """
+  Gera um POST pré-assinado para o cliente enviar o avatar direto ao storage.
+  O `upload_token` assinado é devolvido depois em confirm_avatar_upload.
+  """
+  storage = storage or default_storage
+  upload_id = uuid.uuid4().hex
+  post = storage.presigned_post(
+    direct_upload_name(profile, upload_id),
+    content_type,
+    settings.AVATAR_MAX_UPLOAD_SIZE,
+    settings.AVATAR_UPLOAD_URL_EXPIRES
+  )
+
+  return {
+    'url': post['url'],
+    'fields': post['fields'],
+    'upload_token': signing.dumps({'profile': profile.pk, 'upload': upload_id}, salt='avatar-upload'),
+  }
+
+
+def supports_direct_upload(storage=None):
+  return hasattr(storage or default_storage, 'presigned_post')
+
+
+def read_upload_token(profile, token):
+  data = signing.loads(token, salt='avatar-upload', max_age=settings.AVATAR_UPLOAD_URL_EXPIRES * 2)
+  if data.get('profile') != profile.pk:
+    raise signing.BadSignature('Upload de outro perfil')
+  return data['upload']
+
+
+def attach_direct_upload(profile, upload_id, storage=None):
+  """
+  Registra no perfil o upload feito direto ao storage e agenda as renditions.
+  O `avatar` continua no anterior até elas ficarem prontas (process_avatar);
+  o original nunca é servido. Retorna False se o arquivo não existe ou passa
+  do tamanho permitido. Com o pipeline cheio o original fica no storage e o
+  cliente pode confirmar de novo com o mesmo token.
+  """
+  storage = storage or default_storage
+  name = direct_upload_name(profile, upload_id)
+
+  try:
+    size = storage.size(name)
+  except (OSError, ClientError):
+    return False
+
+  avatar_upload_size.observe(size, source='direct')
+  if size > settings.AVATAR_MAX_UPLOAD_SIZE:
+    storage.delete(name)
+    return False
+
+  schedule_avatar(
+    profile,
+    upload_id,
+    process_stored_avatar,
+    profile.pk,
+    upload_id,
+    UserProfile.avatar_path(profile, upload_id),
+    name,
+    profile.avatar.name or None,
+    storage
+  )
+  return True
+
+
+def process_stored_avatar(profile_id, upload_id, base, name, previous_name=None, storage=None):
+  storage = storage or default_storage
+  try:
+    with storage.open(name) as upload:
+      data = upload.read()
+  except Exception:
+    logger.exception('Falha ao ler o avatar enviado %s', name)
+    mark_avatar_failed(profile_id, upload_id)
+    return False
+
+  if process_avatar(profile_id, upload_id, base, data, previous_name, storage):
+    storage.delete(name)
+    return True
+  return False
+
+
+def process_avatar(profile_id, upload_id, base, data, previous_name=None, storage=None):
+  """
+  Gera e salva as renditions do upload `upload_id`. Qualquer falha, inclusive
+  do storage ou do banco, deixa o perfil em AVATAR_FAILED em vez de pendente
+  para sempre; retorna se o processamento terminou.
+  """
+  storage = storage or default_storage
+  try:
+    renditions = render_avatar(data, settings.AVATAR_RENDITION_SIZES)
+  except (OSError, ValueError, Image.DecompressionBombError):
+    mark_avatar_failed(profile_id, upload_id)
+    return False
+
+  try:
+    for (size, ext), content in renditions.items():
+      storage.save(rendition_name(base, size, ext), ContentFile(content))
+
+    updated = UserProfile.objects.filter(pk=profile_id, avatar_upload_id=upload_id).update(
+      avatar=main_rendition_name(base),
+      avatar_status=UserProfile.AVATAR_READY,
+      update_at=timezone.now()
+    )
+  except Exception:
+    logger.exception('Falha ao salvar o avatar %s do perfil %s', upload_id, profile_id)
+    mark_avatar_failed(profile_id, upload_id)
+    delete_avatar_files(main_rendition_name(base), storage)
+    return False
+
+  # Se outro upload chegou enquanto este era processado, este é descartado.
+  obsolete = previous_name if updated else main_rendition_name(base)
+  if obsolete:
+    delete_avatar_files(obsolete, storage)
+  return True
+
+
+def mark_avatar_failed(profile_id, upload_id):
+  # Só o upload atual do perfil: um mais novo continua pendente.
+  try:
+    UserProfile.objects.filter(pk=profile_id, avatar_upload_id=upload_id).update(
+      avatar_status=UserProfile.AVATAR_FAILED,
+      update_at=timezone.now()
+    )
+  except Exception:
+    # O banco também falhou; sweep_pending_avatars encerra o pendente depois.
+    logger.exception('Falha ao marcar o avatar %s do perfil %s como falho', upload_id, profile_id)
+
+
+def sweep_pending_avatars(older_than, storage=None):
+  """
+  Encerra os avatares pendentes há mais de `older_than` (timedelta), cujo
+  processamento se perdeu (worker reiniciado, falha sem registro). Um upload
+  direto cujo original ainda está no storage é processado de novo; os demais
+  ficam em AVATAR_FAILED. Retorna quantos de cada.
+  """
+  storage = storage or default_storage
+  totals = {'requeued': 0, 'failed': 0}
+  stale = UserProfile.objects.filter(
+    avatar_status=UserProfile.AVATAR_PENDING,
+    update_at__lt=timezone.now() - older_than
+  ).select_related('user')
+
+  for profile in stale:
+    upload_id = profile.avatar_upload_id
+    name = direct_upload_name(profile, upload_id) if upload_id else None
+    if name and storage.exists(name):
+      process_stored_avatar(
+        profile.pk, upload_id, UserProfile.avatar_path(profile, upload_id), name, profile.avatar.name or None, storage
+      )
+      totals['requeued'] += 1
+    else:
+      UserProfile.objects.filter(pk=profile.pk, avatar_status=UserProfile.AVATAR_PENDING, avatar_upload_id=upload_id).update(
+        avatar_status=UserProfile.AVATAR_FAILED,
+        update_at=timezone.now()
+      )
+      totals['failed'] += 1
+  return totals
+
+
+def delete_avatar_files(avatar_name, storage=None):
+  storage = storage or default_storage
+  for name in rendition_names(avatar_name):
+    storage.delete(name)
+
+
+class AvatarPipeline:
+  """
+  Pool de threads dentro do próprio processo web: tira o processamento do
+  ciclo da requisição, mas não é uma fila externa. As tarefas e os bytes dos
+  uploads ficam na memória do processo e se perdem se ele reiniciar (o
+  sweep_pending_avatars encerra esses pendentes). Por isso o backlog é
+  limitado a AVATAR_PROCESSING_BACKLOG tarefas, em fila ou rodando; acima
+  disso submit levanta AvatarPipelineFull. Com AVATAR_PROCESSING_WORKERS = 0
+  as tarefas rodam na hora (útil em testes).
+  """
+
+  def __init__(self):
+    self._executor = None
+    self._lock = threading.Lock()
+    self._backlog = 0
+
+  @property
+  def executor(self):
+    with self._lock:
+      if self._executor is None:
+        self._executor = ThreadPoolExecutor(
+          max_workers=settings.AVATAR_PROCESSING_WORKERS,
+          thread_name_prefix='avatar'
+        )
+      return self._executor
+
+  def submit(self, func, *args, **kwargs):
+    if settings.AVATAR_PROCESSING_WORKERS == 0:
+      future = Future()
+      future.set_result(func(*args, **kwargs))
+      return future
+
+    with self._lock:
+      if self._backlog >= settings.AVATAR_PROCESSING_BACKLOG:
+        raise AvatarPipelineFull()
+      self._backlog += 1
+
+    try:
+      future = self.executor.submit(self._run, func, *args, **kwargs)
+    except BaseException:
+      self._release()
+      raise
+    future.add_done_callback(self._release)
+    return future
+
+  @property
+  def backlog(self):
+    return self._backlog
+
+  def _release(self, future=None):
+    with self._lock:
+      self._backlog -= 1
+
+  def _run(self, func, *args, **kwargs):
+    try:
+      return func(*args, **kwargs)
+    except Exception:
+      logger.exception('Falha ao processar avatar')
+      raise
+    finally:
+      connections.close_all()
+
+  def shutdown(self, wait=True):
+    # Espera fora do lock: as tarefas em andamento precisam dele em _release.
+    with self._lock:
+      executor, self._executor = self._executor, None
+    if executor is not None:
+      executor.shutdown(wait=wait)
+
+
+pipeline = AvatarPipeline()
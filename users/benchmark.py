@@ -0,0 +1,378 @@
+import json
+import platform
+import random
+import re
+import threading
+import time
+from base64 import b64decode
+from datetime import datetime, timezone as dt_timezone
+from io import BytesIO
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .bulk import chunked, create_accounts
+from .models import UserAccount
+
+BENCH_DOMAIN = 'bench.example.com'
+BENCH_PASSWORD = 'Bench-S3nha!2024'
+PLANS = ('BEAR', 'BULL', 'WOLF')
+
+# db;dur=1.23;desc="4 queries" (full_auth.instrumentation.ServerTimingMiddleware)
+SERVER_TIMING_QUERIES = re.compile(r'\bdb;[^,]*desc="(\d+) queries"')
+
+# PNG 1x1 usado pelo cenário de avatar.
+PNG = b64decode(
+  'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGP4z8AAAAMBAQDJ/pLvAAAAAElFTkSuQmCC'
+)
+
+DEFAULT_MIX = {
+  'jwt-create': 1,
+  'jwt-refresh': 2,
+  'jwt-verify': 6,
+  'profile-list': 6,
+  'profile-investment-info': 2,
+  'profile-update-notifications': 1,
+  'profile-update-avatar': 0,
+}
+
+
+# Endpoint -> método de VirtualUser que o exercita.
+SCENARIOS = {
+  'jwt-create': 'login',
+  'jwt-refresh': 'refresh_tokens',
+  'jwt-verify': 'verify',
+  'profile-list': 'profile',
+  'profile-investment-info': 'investment_info',
+  'profile-update-notifications': 'update_notifications',
+  'profile-update-avatar': 'update_avatar',
+}
+
+
+def make_cpf(number):
+  digits = [int(digit) for digit in f'{number:09d}']
+  for weight in (10, 11):
+    remainder = sum(digit * (weight - index) for index, digit in enumerate(digits)) % 11
+    digits.append(0 if remainder < 2 else 11 - remainder)
+  return ''.join(map(str, digits))
+
+
+def bench_email(number):
+  return f'bench-{number}@{BENCH_DOMAIN}'
+
+
+def seed_users(count):
+  """
+  Garante `count` usuários sintéticos (bench-<n>@bench.example.com) com planos
+  alternados e CPFs válidos na faixa 9xx.xxx.xxx. A senha é uma só, com um
+  único hash para todos. Retorna os e-mails.
+  """
+  emails = [bench_email(number) for number in range(count)]
+  existing = set(UserAccount.objects.filter(email__in=emails).values_list('email', flat=True))
+  rows = [
+    {
+      'email': email,
+      'first_name': 'Bench',
+      'last_name': str(number),
+      'cpf': make_cpf(900_000_000 + number),
+      'plan_type': PLANS[number % len(PLANS)],
+    }
+    for number, email in enumerate(emails)
+    if email not in existing
+  ]
+
+  password = make_password(BENCH_PASSWORD)
+  for chunk in chunked(rows, 1_000):
+    create_accounts(chunk, [password] * len(chunk))
+  return emails
+
+
+def delete_seeded():
+  return UserAccount.objects.filter(email__endswith=f'@{BENCH_DOMAIN}').delete()[0]
+
+
+def parse_mix(value):
+  mix = {}
+  for item in value.split(','):
+    name, _, weight = item.strip().partition(':')
+    if name not in SCENARIOS:
+      raise ValueError(f'Endpoint desconhecido: {name}')
+    mix[name] = int(weight or 1)
+  return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+class ClientTransport:
+  """APIClient do DRF no próprio processo; conta as consultas de cada requisição."""
+
+  def __init__(self, remote_addr='127.0.0.1'):
+    from rest_framework.test import APIClient
+
+    self.client = APIClient(HTTP_HOST=settings.ALLOWED_HOSTS[0], REMOTE_ADDR=remote_addr)
+
+  def request(self, method, path, data=None, token=None, multipart=False):
+    extra = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+    send = getattr(self.client, method.lower())
+    with CaptureQueriesContext(connection) as queries:
+      if method == 'GET':
+        response = send(path, **extra)
+      else:
+        response = send(path, data, format='multipart' if multipart else 'json', **extra)
+    # Cada cenário passa os tokens explicitamente; cookies da resposta anterior
+    # (o refresh os prefere ao corpo) não podem vazar para a próxima.
+    self.client.cookies.clear()
+    return response.status_code, _json(response.content), len(queries)
+
+  def close(self):
+    connection.close()
+
+
+class HttpTransport:
+  """HTTP contra um servidor já no ar (runserver, gunicorn ou uvicorn)."""
+
+  def __init__(self, base_url):
+    import requests
+
+    self.base_url = base_url.rstrip('/')
+    self.session = requests.Session()
+
+  def request(self, method, path, data=None, token=None, multipart=False):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    if multipart:
+      files = {name: (value.name, value.getvalue()) for name, value in data.items()}
+      response = self.session.request(method, self.base_url + path, files=files, headers=headers)
+    else:
+      response = self.session.request(
+        method, self.base_url + path, json=None if method == 'GET' else data, headers=headers
+      )
+    self.session.cookies.clear()
+    return response.status_code, _json(response.content), _server_timing_queries(response)
+
+  def close(self):
+    self.session.close()
+
+
+def _server_timing_queries(response):
+  """Consultas informadas pelo servidor no header Server-Timing, se ele o enviar."""
+  match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+  return int(match.group(1)) if match else None
+
+
+def _json(content):
+  try:
+    return json.loads(content or b'{}')
+  except ValueError:
+    return {}
+
+
+class VirtualUser:
+  """Um usuário sintético com seus tokens; cada cenário é um método."""
+
+  def __init__(self, email, transport, rng):
+    self.email = email
+    self.transport = transport
+    self.rng = rng
+    self.access = self.refresh = None
+
+  def login(self):
+    status, body, queries = self.transport.request(
+      'POST', '/api/jwt/create/', {'email': self.email, 'password': BENCH_PASSWORD}
+    )
+    if status == 200:
+      self.access, self.refresh = body['access'], body['refresh']
+    return status, queries
+
+  def refresh_tokens(self):
+    status, body, queries = self.transport.request('POST', '/api/jwt/refresh/', {'refresh': self.refresh})
+    if status == 200:
+      self.access = body['access']
+      self.refresh = body.get('refresh', self.refresh)
+    return status, queries
+
+  def verify(self):
+    status, _, queries = self.transport.request('POST', '/api/jwt/verify/', {'token': self.access})
+    return status, queries
+
+  def profile(self):
+    return self.get('/api/profile/')
+
+  def investment_info(self):
+    return self.get('/api/profile/investment_info/')
+
+  def get(self, path):
+    status, _, queries = self.transport.request('GET', path, token=self.access)
+    return status, queries
+
+  def update_notifications(self):
+    status, _, queries = self.transport.request(
+      'PATCH', '/api/profile/update_notifications/',
+      {'email_notifications': self.rng.random() < 0.5}, token=self.access
+    )
+    return status, queries
+
+  def update_avatar(self):
+    avatar = BytesIO(PNG)
+    avatar.name = 'avatar.png'
+    status, _, queries = self.transport.request(
+      'PATCH', '/api/profile/update_avatar/', {'avatar': avatar}, token=self.access, multipart=True
+    )
+    return status, queries
+
+  def run(self, name):
+    return getattr(self, SCENARIOS[name])()
+
+
+class Recorder:
+  def __init__(self):
+    self.latencies = {}
+    self.statuses = {}
+    self.queries = {}
+
+  def record(self, name, elapsed, status, queries):
+    self.latencies.setdefault(name, []).append(elapsed)
+    statuses = self.statuses.setdefault(name, {})
+    statuses[status] = statuses.get(status, 0) + 1
+    if queries is not None:
+      self.queries.setdefault(name, []).append(queries)
+
+  def merge(self, other):
+    for name, values in other.latencies.items():
+      self.latencies.setdefault(name, []).extend(values)
+    for name, statuses in other.statuses.items():
+      merged = self.statuses.setdefault(name, {})
+      for status, count in statuses.items():
+        merged[status] = merged.get(status, 0) + count
+    for name, values in other.queries.items():
+      self.queries.setdefault(name, []).extend(values)
+
+
+def percentile(values, fraction):
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_benchmark(make_transport, emails, mix, concurrency=8, duration=15.0, requests_per_worker=None, seed=0):
+  """
+  Roda `concurrency` usuários virtuais, cada um com o seu transporte, pela
+  duração ou até `requests_per_worker` requisições. O login inicial de cada
+  um fica fora das medidas. Com concorrência 1 roda na própria thread.
+  """
+  names, weights = list(mix), list(mix.values())
+  recorders = [Recorder() for _ in range(concurrency)]
+  deadline = time.perf_counter() + duration
+
+  def worker(index):
+    rng = random.Random(seed + index)
+    transport = make_transport(index)
+    try:
+      user = VirtualUser(emails[index % len(emails)], transport, rng)
+      user.login()
+      done = 0
+      while time.perf_counter() < deadline and (requests_per_worker is None or done < requests_per_worker):
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        status, queries = user.run(name)
+        recorders[index].record(name, time.perf_counter() - started, status, queries)
+        done += 1
+    finally:
+      if concurrency > 1:
+        transport.close()
+
+  started = time.perf_counter()
+  if concurrency == 1:
+    worker(0)
+  else:
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+  elapsed = time.perf_counter() - started
+
+  total = Recorder()
+  for recorder in recorders:
+    total.merge(recorder)
+  return summarize(total, elapsed)
+
+
+def summarize(recorder, elapsed):
+  endpoints = {}
+  for name, latencies in sorted(recorder.latencies.items()):
+    latencies = sorted(latencies)
+    statuses = recorder.statuses[name]
+    queries = sorted(recorder.queries.get(name, ()))
+    endpoints[name] = {
+      'requests': len(latencies),
+      'ok': sum(count for status, count in statuses.items() if status < 400),
+      'throttled': statuses.get(429, 0),
+      'errors': sum(count for status, count in statuses.items() if status >= 400 and status != 429),
+      'statuses': {str(status): count for status, count in sorted(statuses.items())},
+      'rps': round(len(latencies) / elapsed, 2),
+      'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+      'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+      'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+      'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+      'queries_p50': percentile(queries, 0.50) if queries else None,
+      'queries_max': queries[-1] if queries else None,
+    }
+
+  return {
+    'elapsed_s': round(elapsed, 3),
+    'rps': round(sum(result['requests'] for result in endpoints.values()) / elapsed, 2),
+    'endpoints': endpoints,
+  }
+
+
+def metadata(**options):
+  return {
+    'started_at': datetime.now(dt_timezone.utc).isoformat(),
+    'python': platform.python_version(),
+    'database': connection.vendor,
+    'async_views': settings.AUTH_ASYNC_VIEWS,
+    **options,
+  }
+
+
+def compare(current, baseline, threshold=0.2):
+  """
+  Regressões de `current` em relação a `baseline` (dois resultados salvos):
+  p95 maior ou vazão menor que o limite relativo, mediana de consultas maior
+  ou uma taxa de erro maior. Endpoints ausentes em um dos dois são ignorados.
+  """
+  regressions = []
+  for name, result in current['endpoints'].items():
+    base = baseline['endpoints'].get(name)
+    if not base or not base['requests'] or not result['requests']:
+      continue
+
+    if result['p95_ms'] > base['p95_ms'] * (1 + threshold):
+      regressions.append(f'{name}: p95 {base["p95_ms"]:.1f}ms -> {result["p95_ms"]:.1f}ms')
+    if result['rps'] < base['rps'] * (1 - threshold):
+      regressions.append(f'{name}: vazão {base["rps"]:.1f}/s -> {result["rps"]:.1f}/s')
+    # A mediana: o máximo pega consultas ocasionais (sincronização do
+    # RevocationStore, cache de usuários frio) que não são regressão.
+    if None not in (result['queries_p50'], base['queries_p50']) and result['queries_p50'] > base['queries_p50']:
+      regressions.append(f'{name}: consultas {base["queries_p50"]} -> {result["queries_p50"]}')
+
+    error_rate = result['errors'] / result['requests']
+    base_error_rate = base['errors'] / base['requests']
+    if error_rate > base_error_rate + 0.01:
+      regressions.append(f'{name}: erros {base_error_rate:.1%} -> {error_rate:.1%}')
+
+  return regressions
+
+
+def side_by_side(current, baseline):
+  """
+  Linhas (endpoint, vazão, p50 e p99 de `baseline` e de `current`) para os
+  endpoints presentes nos dois, como na comparação gunicorn x uvicorn.
+  """
+  rows = []
+  for name, result in current['endpoints'].items():
+    base = baseline['endpoints'].get(name)
+    if not base or not base['requests'] or not result['requests']:
+      continue
+    rows.append((
+      name,
+      (base['rps'], base['p50_ms'], base['p99_ms']),
+      (result['rps'], result['p50_ms'], result['p99_ms']),
+    ))
+  return rows
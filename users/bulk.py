@@ -0,0 +1,118 @@
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from .models import UserAccount, UserProfile, Subscription
+from .validators.validations import validate_cpfs
+
+PLAN_CODES = {code for code, _ in Subscription.PLAN_TYPES}
+
+
+def read_accounts(path, file_format=None):
+  """Lê um CSV ou NDJSON linha a linha, sem carregar o arquivo todo."""
+  file_format = file_format or ('ndjson' if str(path).endswith(('.ndjson', '.jsonl')) else 'csv')
+
+  with open(path, newline='', encoding='utf-8') as source:
+    if file_format == 'csv':
+      yield from csv.DictReader(source)
+    else:
+      for line in source:
+        if line.strip():
+          yield json.loads(line)
+
+
+def chunked(iterable, size):
+  iterator = iter(iterable)
+  while chunk := list(islice(iterator, size)):
+    yield chunk
+
+
+def clean_accounts(rows):
+  """
+  Normaliza e valida um lote de linhas. Retorna (válidas, rejeitadas), em que
+  cada rejeitada é (linha, motivo). E-mails e CPFs já existentes no banco são
+  verificados com uma consulta por lote.
+  """
+  valid, rejected = [], []
+  seen_emails, seen_cpfs = set(), set()
+  cpf_is_valid, cpfs = validate_cpfs([row.get('cpf') or '' for row in rows])
+
+  for row, cpf, cpf_ok in zip(rows, cpfs.tolist(), cpf_is_valid.tolist()):
+    email = UserAccount.objects.normalize_email((row.get('email') or '').strip()).lower()
+    plan_type = (row.get('plan_type') or 'BEAR').upper()
+
+    try:
+      validate_email(email)
+    except ValidationError:
+      rejected.append((row, 'e-mail inválido'))
+      continue
+
+    if not cpf_ok:
+      rejected.append((row, 'CPF inválido'))
+    elif plan_type not in PLAN_CODES:
+      rejected.append((row, 'plano inválido'))
+    elif email in seen_emails or cpf in seen_cpfs:
+      rejected.append((row, 'duplicado no arquivo'))
+    else:
+      seen_emails.add(email)
+      seen_cpfs.add(cpf)
+      valid.append({**row, 'email': email, 'cpf': cpf, 'plan_type': plan_type})
+
+  existing_emails = set(
+    UserAccount.objects.filter(email__in=seen_emails).values_list('email', flat=True)
+  )
+  existing_cpfs = set(
+    UserProfile.objects.filter(cpf__in=seen_cpfs).values_list('cpf', flat=True)
+  )
+
+  accepted = []
+  for row in valid:
+    if row['email'] in existing_emails or row['cpf'] in existing_cpfs:
+      rejected.append((row, 'já cadastrado'))
+    else:
+      accepted.append(row)
+
+  return accepted, rejected
+
+
+def create_accounts(rows, password_hashes):
+  """Cria usuários, assinaturas e perfis de um lote numa única transação."""
+  with transaction.atomic():
+    users = UserAccount.objects.bulk_create([
+      UserAccount(
+        email=row['email'],
+        first_name=row.get('first_name') or '',
+        last_name=row.get('last_name') or '',
+        password=password_hash,
+      )
+      for row, password_hash in zip(rows, password_hashes)
+    ])
+    Subscription.objects.bulk_create([
+      Subscription(user=user, plan_type=row['plan_type']) for user, row in zip(users, rows)
+    ])
+    UserProfile.objects.bulk_create([
+      UserProfile(user=user, cpf=row['cpf']) for user, row in zip(users, rows)
+    ])
+
+  return users
+
+
+class PasswordHasherPool:
+  """Pool de processos para o hash das senhas (PBKDF2 prende a CPU e o GIL)."""
+
+  def __init__(self, workers=None):
+    self.executor = ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+
+  def hash_many(self, passwords):
+    return list(self.executor.map(make_password, passwords, chunksize=64))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.executor.shutdown()
@@ -0,0 +1,147 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class UserCache:
+  """
+  Cache dos usuários autenticados, indexado por id do usuário e jti do token.
+
+  Com backend 'local' os usuários ficam num OrderedDict limitado (LRU + TTL)
+  dentro do processo, e a invalidação só alcança o próprio processo: nos
+  outros workers, desativar o usuário ou trocar a senha só vale depois de
+  `ttl` segundos. Serve para um processo só (desenvolvimento, testes). Com
+  backend 'django', o padrão fora do DEVELOPMENT_MODE, as entradas vão para o
+  cache `alias`, que deve ser compartilhado entre os workers; a invalidação
+  incrementa uma versão por usuário e o `clear` uma geração, ambas parte da
+  chave.
+  """
+
+  def __init__(self, backend='local', max_size=10000, ttl=60, alias='default'):
+    self.backend = backend
+    self.max_size = max_size
+    self.ttl = ttl
+    self.alias = alias
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+    self._keys_by_user = {}
+    self._lock = threading.Lock()
+
+  @property
+  def cache(self):
+    return caches[self.alias]
+
+  def get(self, user_id, token_id):
+    if self.backend == 'django':
+      user = self.cache.get(self._django_key(user_id, token_id))
+      with self._lock:
+        if user is None:
+          self.misses += 1
+        else:
+          self.hits += 1
+    else:
+      user = self._local_get((user_id, token_id))
+
+    return None if user is None else copy.copy(user)
+
+  def set(self, user_id, token_id, user):
+    if self.backend == 'django':
+      self.cache.set(self._django_key(user_id, token_id), user, self.ttl)
+    else:
+      self._local_set((user_id, token_id), copy.copy(user))
+
+  def invalidate(self, user_id):
+    if self.backend == 'django':
+      self._bump(self._version_key(user_id))
+      return
+
+    with self._lock:
+      for key in self._keys_by_user.pop(user_id, ()):
+        self._entries.pop(key, None)
+
+  def clear(self):
+    # Os dois backends. No compartilhado só as entradas deste cache saem, pela
+    # geração: o alias também guarda outras coisas.
+    self._bump(self._generation_key())
+    with self._lock:
+      self._entries.clear()
+      self._keys_by_user.clear()
+      self.hits = 0
+      self.misses = 0
+
+  @property
+  def stats(self):
+    with self._lock:
+      hits, misses, size = self.hits, self.misses, len(self._entries)
+    total = hits + misses
+    return {
+      'backend': self.backend,
+      'size': size if self.backend == 'local' else None,
+      'max_size': self.max_size,
+      'hits': hits,
+      'misses': misses,
+      'hit_rate': hits / total if total else 0.0,
+    }
+
+  def _local_get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[0] < time.monotonic():
+        self._discard(key)
+        entry = None
+
+      if entry is None:
+        self.misses += 1
+        return None
+
+      self.hits += 1
+      self._entries.move_to_end(key)
+      return entry[1]
+
+  def _local_set(self, key, user):
+    with self._lock:
+      self._entries[key] = (time.monotonic() + self.ttl, user)
+      self._entries.move_to_end(key)
+      self._keys_by_user.setdefault(key[0], set()).add(key)
+
+      while len(self._entries) > self.max_size:
+        oldest, _ = next(iter(self._entries.items()))
+        self._discard(oldest)
+
+  def _discard(self, key):
+    self._entries.pop(key, None)
+    keys = self._keys_by_user.get(key[0])
+    if keys is not None:
+      keys.discard(key)
+      if not keys:
+        del self._keys_by_user[key[0]]
+
+  def _bump(self, key):
+    try:
+      self.cache.incr(key)
+    except ValueError:
+      self.cache.set(key, 1, None)
+
+  def _generation_key(self):
+    return 'auth-user-generation'
+
+  def _version_key(self, user_id):
+    return f'auth-user-version:{user_id}'
+
+  def _django_key(self, user_id, token_id):
+    generation_key, version_key = self._generation_key(), self._version_key(user_id)
+    counters = self.cache.get_many([generation_key, version_key])
+    return f'auth-user:{counters.get(generation_key, 0)}:{user_id}:{counters.get(version_key, 0)}:{token_id}'
+
+
+user_cache = UserCache(
+  backend=getattr(settings, 'AUTH_USER_CACHE_BACKEND', 'local'),
+  max_size=getattr(settings, 'AUTH_USER_CACHE_MAX_SIZE', 10000),
+  ttl=getattr(settings, 'AUTH_USER_CACHE_TTL', 60),
+  alias=getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default'),
+)
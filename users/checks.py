@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHE_BACKENDS = (
+  'django.core.cache.backends.locmem.LocMemCache',
+  'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Estado que precisa valer entre todos os workers.
+SHARED_CACHE_SETTINGS = ('AUTH_LOGIN_THROTTLE_CACHE_ALIAS', 'REPLICA_PIN_CACHE_ALIAS')
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+  """Em produção, avisa se um cache que deve ser compartilhado é local ao processo."""
+  if settings.DEVELOPMENT_MODE:
+    return []
+
+  names = list(SHARED_CACHE_SETTINGS)
+  if settings.AUTH_USER_CACHE_BACKEND == 'django':
+    names.append('AUTH_USER_CACHE_ALIAS')
+
+  warnings = []
+  for name in names:
+    alias = getattr(settings, name)
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend in LOCAL_CACHE_BACKENDS:
+      warnings.append(Warning(
+        f'{name} aponta para o cache {alias!r} ({backend}), que não é compartilhado entre processos.',
+        hint='Com vários workers, configure CACHE_BACKEND/CACHE_LOCATION (ou o alias) com um Redis ou Memcached.',
+        id='users.W001',
+      ))
+  return warnings
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import urllib.request
+from functools import cached_property, lru_cache
+from pathlib import Path
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from jwt.algorithms import ECAlgorithm, OKPAlgorithm, RSAAlgorithm
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+
+ASYMMETRIC_ALGORITHMS = ('RS256', 'RS384', 'RS512', 'ES256', 'ES384', 'ES512', 'EdDSA')
+
+JWK_ENCODERS = {'RS': RSAAlgorithm, 'ES': ECAlgorithm, 'Ed': OKPAlgorithm}
+
+
+def generate_private_key(algorithm):
+  if algorithm.startswith('RS'):
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+  if algorithm.startswith('ES'):
+    curve = {'ES256': ec.SECP256R1, 'ES384': ec.SECP384R1, 'ES512': ec.SECP521R1}[algorithm]
+    return ec.generate_private_key(curve())
+  if algorithm == 'EdDSA':
+    return ed25519.Ed25519PrivateKey.generate()
+  raise ValueError(f"Algoritmo sem chave assimétrica: {algorithm}")
+
+
+def private_key_to_pem(private_key):
+  return private_key.private_bytes(
+    serialization.Encoding.PEM,
+    serialization.PrivateFormat.PKCS8,
+    serialization.NoEncryption()
+  )
+
+
+class KeyRing:
+  """
+  Conjunto de chaves de assinatura identificadas por kid. Apenas a chave ativa
+  assina; todas as chaves públicas continuam verificando e são publicadas no
+  JWKS, o que permite trocar a chave ativa sem invalidar tokens em trânsito.
+  """
+
+  def __init__(self, algorithm, private_keys=None, public_keys=None, active_kid=None):
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+      raise ImproperlyConfigured(f"JWT_SIGNING_ALGORITHM inválido: {algorithm}")
+
+    self.algorithm = algorithm
+    self.private_keys = dict(private_keys or {})
+    self.public_keys = {kid: key.public_key() for kid, key in self.private_keys.items()}
+    self.public_keys.update(public_keys or {})
+
+    if active_kid is None and len(self.private_keys) == 1:
+      active_kid = next(iter(self.private_keys))
+    if active_kid not in self.private_keys:
+      raise ImproperlyConfigured(
+        "Defina JWT_ACTIVE_KEY_ID com o kid de uma chave privada disponível."
+      )
+    self.active_kid = active_kid
+
+  @classmethod
+  def from_directory(cls, algorithm, directory, active_kid=None):
+    # <kid>.pem contém uma chave privada; <kid>.pub.pem uma chave aposentada,
+    # mantida só para verificar tokens emitidos antes da troca.
+    private_keys, public_keys = {}, {}
+    for path in sorted(Path(directory).glob('*.pem')):
+      data = path.read_bytes()
+      if path.name.endswith('.pub.pem'):
+        public_keys[path.name[:-len('.pub.pem')]] = serialization.load_pem_public_key(data)
+      else:
+        private_keys[path.stem] = serialization.load_pem_private_key(data, password=None)
+
+    return cls(algorithm, private_keys, public_keys, active_kid)
+
+  @property
+  def signing_key(self):
+    return self.private_keys[self.active_kid]
+
+  def public_key(self, kid):
+    return self.public_keys.get(kid)
+
+  @cached_property
+  def jwks(self):
+    encoder = JWK_ENCODERS[self.algorithm[:2]]
+    keys = []
+    for kid, public_key in sorted(self.public_keys.items()):
+      jwk = encoder.to_jwk(public_key, as_dict=True)
+      jwk.update({'kid': kid, 'alg': self.algorithm, 'use': 'sig'})
+      keys.append(jwk)
+    return {'keys': keys}
+
+  @cached_property
+  def etag(self):
+    return hashlib.sha256(json.dumps(self.jwks, sort_keys=True).encode()).hexdigest()[:32]
+
+
+class KeyRingTokenBackend(TokenBackend):
+  """
+  TokenBackend do simplejwt que assina com a chave ativa do KeyRing, grava o
+  kid no cabeçalho e escolhe a chave de verificação por esse kid.
+  """
+
+  def __init__(self, key_ring, **kwargs):
+    self.key_ring = key_ring
+    super().__init__(key_ring.algorithm, **kwargs)
+
+  def _validate_algorithm(self, algorithm):
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+      super()._validate_algorithm(algorithm)
+
+  def encode(self, payload):
+    jwt_payload = payload.copy()
+    if self.audience is not None:
+      jwt_payload['aud'] = self.audience
+    if self.issuer is not None:
+      jwt_payload['iss'] = self.issuer
+
+    return jwt.encode(
+      jwt_payload,
+      self.key_ring.signing_key,
+      algorithm=self.algorithm,
+      headers={'kid': self.key_ring.active_kid},
+      json_encoder=self.json_encoder,
+    )
+
+  def get_verifying_key(self, token):
+    key = self.key_ring.public_key(jwt.get_unverified_header(token).get('kid'))
+    if key is None:
+      raise TokenBackendError("Token assinado com uma chave desconhecida")
+    return key
+
+
+@lru_cache(maxsize=None)
+def get_key_ring():
+  if settings.JWT_SIGNING_ALGORITHM not in ASYMMETRIC_ALGORITHMS:
+    return None
+
+  if not settings.JWT_KEYS_DIR:
+    raise ImproperlyConfigured("JWT_KEYS_DIR é obrigatório para assinatura assimétrica.")
+
+  return KeyRing.from_directory(
+    settings.JWT_SIGNING_ALGORITHM,
+    settings.JWT_KEYS_DIR,
+    settings.JWT_ACTIVE_KEY_ID
+  )
+
+
+def build_token_backend(key_ring):
+  return KeyRingTokenBackend(
+    key_ring,
+    audience=api_settings.AUDIENCE,
+    issuer=api_settings.ISSUER,
+    leeway=api_settings.LEEWAY,
+    json_encoder=api_settings.JSON_ENCODER,
+  )
+
+
+def fetch_jwks(url, timeout=5):
+  with urllib.request.urlopen(url, timeout=timeout) as response:
+    max_age = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+    return json.load(response), int(max_age.group(1)) if max_age else 300
+
+
+class LocalTokenVerifier:
+  """
+  Verificação offline para os serviços que confiam nos nossos tokens.
+
+  O JWKS publicado em /api/.well-known/jwks.json é mantido em memória pelo
+  tempo indicado no Cache-Control. Um kid desconhecido força uma nova busca
+  (no máximo uma a cada `min_refresh_interval` segundos), de modo que a troca
+  da chave ativa não derruba tokens recém-emitidos.
+  """
+
+  def __init__(self, jwks_url, audience=None, issuer=None, leeway=0,
+               min_refresh_interval=30, fetch=fetch_jwks, clock=time.monotonic):
+    self.jwks_url = jwks_url
+    self.audience = audience
+    self.issuer = issuer
+    self.leeway = leeway
+    self.min_refresh_interval = min_refresh_interval
+    self.fetch = fetch
+    self.clock = clock
+    self._keys = {}
+    self._expires_at = 0
+    self._fetched_at = None
+    self._lock = threading.Lock()
+
+  def verify(self, token):
+    jwk = self._get_key(jwt.get_unverified_header(token).get('kid'))
+    return jwt.decode(
+      token,
+      jwk.key,
+      algorithms=[jwk.algorithm_name],
+      audience=self.audience,
+      issuer=self.issuer,
+      leeway=self.leeway,
+      options={'verify_aud': self.audience is not None, 'require': ['exp']},
+    )
+
+  def _get_key(self, kid):
+    now = self.clock()
+    if now >= self._expires_at or (kid not in self._keys and self._can_refresh(now)):
+      self._refresh(now)
+
+    try:
+      return self._keys[kid]
+    except KeyError:
+      raise jwt.InvalidTokenError(f"Chave de assinatura desconhecida: {kid}")
+
+  def _can_refresh(self, now):
+    return self._fetched_at is None or now - self._fetched_at >= self.min_refresh_interval
+
+  def _refresh(self, now):
+    with self._lock:
+      jwks, max_age = self.fetch(self.jwks_url)
+      self._keys = {jwk.key_id: jwk for jwk in jwt.PyJWKSet.from_dict(jwks).keys}
+      self._fetched_at = now
+      self._expires_at = now + max_age
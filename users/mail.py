@@ -0,0 +1,133 @@
+import base64
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxEmail
+
+
+def _encode_attachment(attachment):
+  filename, content, mimetype = attachment
+  if isinstance(content, str):
+    content = content.encode()
+  return [filename, base64.b64encode(content).decode(), mimetype]
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+  """
+  Backend de e-mail que só grava as mensagens na tabela OutboxEmail. O envio
+  de fato é feito pelo comando drain_email_outbox, fora da requisição.
+  """
+
+  def send_messages(self, email_messages):
+    rows = [
+      OutboxEmail(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL or '',
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+        headers=dict(message.extra_headers),
+        alternatives=[list(alternative) for alternative in getattr(message, 'alternatives', [])],
+        attachments=[_encode_attachment(attachment) for attachment in message.attachments],
+      )
+      for message in email_messages
+      if message.recipients()
+    ]
+    OutboxEmail.objects.bulk_create(rows)
+    return len(rows)
+
+
+def build_message(email, connection=None):
+  message = EmailMultiAlternatives(
+    subject=email.subject,
+    body=email.body,
+    from_email=email.from_email or None,
+    to=email.to,
+    cc=email.cc,
+    bcc=email.bcc,
+    reply_to=email.reply_to,
+    headers=email.headers,
+    alternatives=[tuple(alternative) for alternative in email.alternatives],
+    connection=connection,
+  )
+  for filename, content, mimetype in email.attachments:
+    message.attach(filename, base64.b64decode(content), mimetype)
+  return message
+
+
+def retry_delay(attempts):
+  return timedelta(seconds=min(
+    settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+    settings.OUTBOX_RETRY_MAX_SECONDS
+  ))
+
+
+def claim_batch(batch_size):
+  """
+  Reserva um lote de e-mails pendentes empurrando o next_attempt_at para
+  depois do lease, de modo que outro worker não pegue as mesmas linhas. Se o
+  worker morrer no meio do lote, as linhas voltam a ficar disponíveis.
+  """
+  now = timezone.now()
+  with transaction.atomic():
+    emails = list(
+      OutboxEmail.objects.select_for_update(skip_locked=True)
+      .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+      .order_by('next_attempt_at', 'id')[:batch_size]
+    )
+    OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+      next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+    )
+  return emails
+
+
+def deliver_batch(emails, connection):
+  sent, failed = [], []
+  for email in emails:
+    try:
+      connection.send_messages([build_message(email, connection)])
+    except Exception as error:
+      email.attempts += 1
+      email.last_error = f'{type(error).__name__}: {error}'
+      if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboxEmail.DEAD
+      else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+      failed.append(email)
+    else:
+      email.attempts += 1
+      email.status = OutboxEmail.SENT
+      email.sent_at = timezone.now()
+      sent.append(email)
+
+  OutboxEmail.objects.bulk_update(sent, ['attempts', 'status', 'sent_at'])
+  OutboxEmail.objects.bulk_update(failed, ['attempts', 'status', 'next_attempt_at', 'last_error'])
+  return len(sent), len(failed)
+
+
+def drain_outbox(batch_size=None, max_batches=None):
+  """Envia lotes até a fila esvaziar, reaproveitando uma conexão com o provedor."""
+  batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+  totals = {'sent': 0, 'failed': 0, 'batches': 0}
+
+  connection = get_connection(settings.OUTBOX_DELIVERY_BACKEND, fail_silently=False)
+  connection.open()
+  try:
+    while max_batches is None or totals['batches'] < max_batches:
+      emails = claim_batch(batch_size)
+      if not emails:
+        break
+
+      sent, failed = deliver_batch(emails, connection)
+      totals['sent'] += sent
+      totals['failed'] += failed
+      totals['batches'] += 1
+  finally:
+    connection.close()
+
+  return totals
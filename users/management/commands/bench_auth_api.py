@@ -0,0 +1,134 @@
+import json
+from contextlib import ExitStack
+from unittest import mock
+from django.core.management.base import BaseCommand, CommandError
+from users.benchmark import (
+  DEFAULT_MIX,
+  ClientTransport,
+  HttpTransport,
+  compare,
+  delete_seeded,
+  metadata,
+  parse_mix,
+  run_benchmark,
+  seed_users,
+  side_by_side,
+)
+from users.throttling import login_throttle
+
+
+class Command(BaseCommand):
+  help = (
+    'Carga concorrente nos endpoints de autenticação e perfil (jwt/create, '
+    'jwt/refresh, jwt/verify, users/ do djoser e profile/ com suas ações) com '
+    'usuários sintéticos. Sem --url usa o test client no próprio processo e '
+    'conta as consultas por requisição; com --url mede um servidor já no ar '
+    'usando o mesmo banco, com as consultas lidas do header Server-Timing '
+    '(suba-o com AUTH_LOGIN_THROTTLE_IP_LIMIT e '
+    'AUTH_LOGIN_THROTTLE_EMAIL_LIMIT altos, senão os logins viram 429). '
+    'Resultados em JSON com --output; --compare mostra vazão, p50 e p99 lado a '
+    'lado com uma execução anterior, aponta regressões e termina com erro se '
+    'houver alguma. Para comparar views síncronas e assíncronas, suba '
+    '"gunicorn full_auth.wsgi -w N" e rode com --url, --label gunicorn e '
+    '--output gunicorn.json; depois suba "uvicorn full_auth.asgi:application '
+    '--workers N" e rode com o mesmo --mix, --label uvicorn e --compare '
+    'gunicorn.json.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--url', help='Servidor a medir, ex.: http://127.0.0.1:8000')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--requests', type=int, help='Requisições por usuário virtual (em vez da duração)')
+    parser.add_argument('--mix', default=','.join(f'{name}:{weight}' for name, weight in DEFAULT_MIX.items()),
+                        help='Pesos por endpoint, ex.: jwt-verify:5,profile-list:5')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Arquivo JSON para salvar o resultado')
+    parser.add_argument('--label', help='Nome da execução na comparação lado a lado (padrão: o alvo)')
+    parser.add_argument('--compare', help='Resultado JSON de referência')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Piora relativa tolerada em p95 e vazão (0.2 = 20%%)')
+    parser.add_argument('--keep-throttle', action='store_true',
+                        help='No modo test client, mantém os limites de login configurados')
+    parser.add_argument('--cleanup', action='store_true', help='Apaga os usuários sintéticos no final')
+
+  def handle(self, *args, **options):
+    try:
+      mix = parse_mix(options['mix'])
+    except ValueError as exc:
+      raise CommandError(exc)
+
+    emails = seed_users(options['users'])
+    self.stdout.write(f'{len(emails)} usuários sintéticos')
+
+    if options['url']:
+      make_transport = lambda index: HttpTransport(options['url'])
+    else:
+      # Um IP por usuário virtual, como clientes distintos.
+      make_transport = lambda index: ClientTransport(remote_addr=f'10.0.{index // 250}.{index % 250 + 1}')
+
+    with ExitStack() as stack:
+      if not options['url'] and not options['keep_throttle']:
+        stack.enter_context(mock.patch.dict(login_throttle.limits, ip=10 ** 9, email=10 ** 9))
+      try:
+        result = run_benchmark(
+          make_transport,
+          emails,
+          mix,
+          concurrency=options['concurrency'],
+          duration=options['duration'],
+          requests_per_worker=options['requests'],
+          seed=options['seed'],
+        )
+      finally:
+        if options['cleanup']:
+          delete_seeded()
+
+    result['meta'] = metadata(
+      target=options['url'] or 'test-client',
+      label=options['label'] or options['url'] or 'test-client',
+      users=len(emails),
+      concurrency=options['concurrency'],
+      duration=options['duration'],
+      requests_per_worker=options['requests'],
+      mix=mix,
+    )
+    self.report(result)
+
+    if options['output']:
+      with open(options['output'], 'w', encoding='utf-8') as target:
+        json.dump(result, target, indent=2)
+      self.stdout.write(f'resultado salvo em {options["output"]}')
+
+    if options['compare']:
+      with open(options['compare'], encoding='utf-8') as source:
+        baseline = json.load(source)
+      self.report_side_by_side(result, baseline)
+      regressions = compare(result, baseline, options['threshold'])
+      for regression in regressions:
+        self.stderr.write(f'regressão: {regression}')
+      if regressions:
+        raise CommandError(f'{len(regressions)} regressão(ões) em relação a {options["compare"]}')
+      self.stdout.write(self.style.SUCCESS('sem regressões'))
+
+  def report(self, result):
+    self.stdout.write(f'{result["rps"]:,.1f} req/s no total em {result["elapsed_s"]:.1f}s')
+    self.stdout.write(
+      f'{"endpoint":30} {"req/s":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"consultas":>9} {"erros":>6} {"429":>5}'
+    )
+    for name, endpoint in result['endpoints'].items():
+      queries = '-' if endpoint['queries_max'] is None else f'{endpoint["queries_p50"]}/{endpoint["queries_max"]}'
+      self.stdout.write(
+        f'{name:30} {endpoint["rps"]:8.1f} {endpoint["p50_ms"]:7.1f}ms {endpoint["p95_ms"]:7.1f}ms '
+        f'{endpoint["p99_ms"]:7.1f}ms {queries:>9} {endpoint["errors"]:6} {endpoint["throttled"]:5}'
+      )
+
+  def report_side_by_side(self, result, baseline):
+    labels = [run.get('meta', {}).get('label', '?') for run in (baseline, result)]
+    self.stdout.write(f'{"":30} {labels[0][:26]:>26}   {labels[1][:26]:>26}')
+    self.stdout.write(f'{"endpoint":30} {"req/s":>8} {"p50":>8} {"p99":>8}   {"req/s":>8} {"p50":>8} {"p99":>8}')
+    for name, base, current in side_by_side(result, baseline):
+      self.stdout.write(
+        f'{name:30} ' + '   '.join(f'{rps:8.1f} {p50:7.1f}ms {p99:7.1f}ms' for rps, p50, p99 in (base, current))
+      )
@@ -0,0 +1,71 @@
+import time
+import uuid
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from financial.ingest import upsert
+from financial.models import Stock
+from users.models import Subscription, UserAccount, UserProfile
+
+
+class Command(BaseCommand):
+  help = (
+    'Repete o polling do SPA (perfil, investment_info e histórico de um ativo) '
+    'com e sem If-None-Match e compara bytes enviados e CPU. Os dados '
+    'sintéticos são descartados no final.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--polls', type=int, default=300)
+    parser.add_argument('--years', type=int, default=20)
+
+  def handle(self, *args, **options):
+    with transaction.atomic():
+      client, urls = self.setup(options['years'])
+      plain = self.replay(client, urls, options['polls'], conditional=False)
+      conditional = self.replay(client, urls, options['polls'], conditional=True)
+      transaction.set_rollback(True)
+
+    for label, (sent, cpu, not_modified) in (('sem ETag', plain), ('com ETag', conditional)):
+      self.stdout.write(f'{label}: {sent / 1024:,.0f} KiB enviados, CPU {cpu:.2f}s, {not_modified} respostas 304')
+    self.stdout.write(self.style.SUCCESS(
+      f'economia: {1 - conditional[0] / plain[0]:.1%} dos bytes, {1 - conditional[1] / plain[1]:.1%} da CPU'
+    ))
+
+  def setup(self, years):
+    user = UserAccount.objects.create(email=f'bench-{uuid.uuid4().hex}@example.com', first_name='Bench', last_name='Mark')
+    Subscription.objects.create(user=user)
+    UserProfile.objects.create(user=user, cpf=uuid.uuid4().hex[:11])
+
+    stock = Stock.objects.create(symbol=f'B{uuid.uuid4().hex[:8]}'.upper(), company_name='Benchmark', sector='')
+    first = date.today() - timedelta(days=365 * years)
+    upsert('prices', [(stock.pk, first + timedelta(days=n), 10, 10, 10, 10, 1000) for n in range(365 * years)])
+
+    client = Client(
+      HTTP_HOST=settings.ALLOWED_HOSTS[0],
+      HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}'
+    )
+    urls = [
+      reverse('profile-list'),
+      reverse('profile-investment-info'),
+      reverse('stock-history', args=[stock.symbol]) + '?interval=weekly',
+    ]
+    return client, urls
+
+  def replay(self, client, urls, polls, conditional):
+    etags, sent, not_modified = {}, 0, 0
+    started = time.process_time()
+
+    for poll in range(polls):
+      url = urls[poll % len(urls)]
+      headers = {'HTTP_IF_NONE_MATCH': etags[url]} if conditional and url in etags else {}
+      response = client.get(url, **headers)
+      etags[url] = response.get('ETag')
+      not_modified += response.status_code == 304
+      sent += len(response.content) + sum(len(k) + len(v) + 4 for k, v in response.items())
+
+    return sent, time.process_time() - started, not_modified
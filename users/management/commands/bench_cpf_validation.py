@@ -0,0 +1,53 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from users.validators.validations import validate_cpf, validate_cpfs
+
+DIGIT_COLUMNS = [0, 1, 2, 4, 5, 6, 8, 9, 10, 12, 13]
+
+
+def synthetic_cpfs(count, seed=0):
+  """CPFs no formato XXX.XXX.XXX-XX, metade com dígitos verificadores corretos."""
+  rng = np.random.default_rng(seed)
+  digits = rng.integers(0, 10, size=(count, 11))
+  fix = rng.random(count) < 0.5
+  for position in (9, 10):
+    weights = np.arange(position + 1, 1, -1)
+    remainder = (digits[:, :position] @ weights) % 11
+    digits[fix, position] = np.where(remainder < 2, 0, 11 - remainder)[fix]
+
+  codes = np.empty((count, 14), dtype=np.uint32)
+  codes[:, DIGIT_COLUMNS] = digits + 48
+  codes[:, [3, 7]] = ord('.')
+  codes[:, 11] = ord('-')
+  return codes.view('<U14').ravel()
+
+
+class Command(BaseCommand):
+  help = 'Compara validate_cpf (escalar) com validate_cpfs (NumPy) em CPFs sintéticos.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--count', type=int, default=10_000_000)
+    parser.add_argument('--scalar-sample', type=int, default=500_000,
+                        help='Quantos CPFs medir com a função escalar (o tempo é extrapolado).')
+
+  def handle(self, *args, **options):
+    cpfs = synthetic_cpfs(options['count'])
+    self.stdout.write(f'{len(cpfs):,} CPFs sintéticos')
+
+    started = time.perf_counter()
+    mask, _ = validate_cpfs(cpfs)
+    vectorized = time.perf_counter() - started
+
+    sample = cpfs[:options['scalar_sample']].tolist()
+    started = time.perf_counter()
+    scalar_mask = [validate_cpf(cpf) for cpf in sample]
+    scalar = (time.perf_counter() - started) * len(cpfs) / len(sample)
+
+    if scalar_mask != mask[:len(sample)].tolist():
+      self.stderr.write(self.style.ERROR('Resultados divergentes entre as duas versões!'))
+
+    self.stdout.write(f'válidos: {mask.sum():,}')
+    self.stdout.write(f'validate_cpfs: {vectorized:.2f}s ({len(cpfs) / vectorized:,.0f} CPFs/s)')
+    self.stdout.write(f'validate_cpf (estimado): {scalar:.2f}s ({len(cpfs) / scalar:,.0f} CPFs/s)')
+    self.stdout.write(self.style.SUCCESS(f'ganho: {scalar / vectorized:.1f}x'))
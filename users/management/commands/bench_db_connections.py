@@ -0,0 +1,107 @@
+import time
+from unittest import mock
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.urls import reverse
+from users.benchmark import BENCH_PASSWORD, percentile, seed_users
+from users.throttling import login_throttle
+
+
+class Command(BaseCommand):
+  help = (
+    'Compara jwt/create e profile/ abrindo uma conexão por requisição '
+    '(CONN_MAX_AGE=0) com conexões persistentes e, se configurado, com o pool '
+    'do psycopg 3. Conta as conexões abertas e o tempo gasto abrindo-as. Usa o '
+    'banco configurado: contra PostgreSQL remoto a diferença inclui o '
+    'handshake TLS; no SQLite de desenvolvimento é só o custo local.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=300)
+
+  def handle(self, *args, **options):
+    email = seed_users(1)[0]
+    modes = {
+      'uma conexão por requisição': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'pool': None},
+      'persistente': {'CONN_MAX_AGE': settings.DATABASE_CONN_MAX_AGE, 'CONN_HEALTH_CHECKS': True, 'pool': None},
+    }
+    configured_pool = connection.settings_dict.get('OPTIONS', {}).get('pool')
+    if configured_pool:
+      modes['pool'] = {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True, 'pool': configured_pool}
+
+    results = {}
+    with mock.patch.dict(login_throttle.limits, ip=10 ** 9, email=10 ** 9):
+      for label, mode in modes.items():
+        with self.configured(mode):
+          results[label] = self.run(email, options['logins'], options['requests'])
+
+    self.stdout.write(f'{connection.vendor}, {options["logins"]} logins e {options["requests"]} leituras de perfil')
+    for label, endpoints in results.items():
+      for name, (p50, rps, connects, connect_ms) in endpoints.items():
+        self.stdout.write(
+          f'{label:28} {name:12} p50 {p50:7.2f}ms {rps:8.1f} req/s '
+          f'{connects:5} conexões ({connect_ms:.3f}ms por requisição abrindo conexão)'
+        )
+
+  def configured(self, mode):
+    options = dict(connection.settings_dict.get('OPTIONS', {}))
+    if mode['pool']:
+      options['pool'] = mode['pool']
+    else:
+      options.pop('pool', None)
+
+    connection.close()
+    return mock.patch.dict(connection.settings_dict, {
+      'CONN_MAX_AGE': mode['CONN_MAX_AGE'],
+      'CONN_HEALTH_CHECKS': mode['CONN_HEALTH_CHECKS'],
+      'OPTIONS': options,
+    })
+
+  def run(self, email, logins, requests):
+    client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    response = client.post(reverse('jwt-create'), {'email': email, 'password': BENCH_PASSWORD})
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {response.json()["access"]}'}
+    return {
+      'jwt/create': self.measure(
+        lambda: client.post(reverse('jwt-create'), {'email': email, 'password': BENCH_PASSWORD}), logins
+      ),
+      'profile/': self.measure(lambda: client.get(reverse('profile-list'), **headers), requests),
+    }
+
+  def measure(self, send, count):
+    connects = []
+    connect = connection.connect
+
+    def timed_connect():
+      started = time.perf_counter()
+      try:
+        connect()
+      finally:
+        connects.append(time.perf_counter() - started)
+
+    # O test client desliga o close_old_connections dos sinais
+    # request_started/request_finished; aqui ele roda em volta de cada
+    # requisição, fechando ou mantendo a conexão como num worker de verdade.
+    timings = []
+    with mock.patch.object(connection, 'connect', timed_connect):
+      started = time.perf_counter()
+      for _ in range(count):
+        request_started = time.perf_counter()
+        close_old_connections()
+        response = send()
+        close_old_connections()
+        timings.append(time.perf_counter() - request_started)
+        if response.status_code != 200:
+          raise CommandError(f'{response.request["PATH_INFO"]} respondeu {response.status_code}')
+      elapsed = time.perf_counter() - started
+
+    timings.sort()
+    return (
+      percentile(timings, 0.50) * 1000,
+      count / elapsed,
+      len(connects),
+      sum(connects) / count * 1000,
+    )
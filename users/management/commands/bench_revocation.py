@@ -0,0 +1,95 @@
+import random
+import time
+import uuid
+from unittest import mock
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from users.models import RevokedToken, UserAccount
+from users.revocation import RevocationStore
+from users.serializers import CustomTokenRefreshSerializer
+
+
+class Command(BaseCommand):
+  help = (
+    'Mede o RevocationStore com muitos tokens revogados: carga inicial, memória, '
+    'verificações por segundo e vazão do refresh com rotação, com e sem o filtro '
+    'de Bloom na frente do banco. Os dados sintéticos são descartados no final.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--revoked', type=int, default=1_000_000)
+    parser.add_argument('--checks', type=int, default=100_000)
+    parser.add_argument('--refreshes', type=int, default=2_000)
+
+  def handle(self, *args, **options):
+    with transaction.atomic():
+      self.load(options['revoked'])
+      store = RevocationStore(sync_interval=3600)
+
+      started = time.perf_counter()
+      store.sync()
+      elapsed = time.perf_counter() - started
+      stats = store.stats
+      self.stdout.write(
+        f'carga inicial: {elapsed:.2f}s, {stats["buckets"]} baldes, {stats["filters"]} filtros, '
+        f'{stats["nbytes"] / 2 ** 20:.1f} MiB ({stats["nbytes"] / max(stats["tokens"], 1):.1f} bytes/token)'
+      )
+
+      self.measure_checks(store, options['checks'])
+      self.measure_refresh(store, options['refreshes'])
+      transaction.set_rollback(True)
+
+  def load(self, count):
+    now = time.time()
+    lifetime = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+    for start in range(0, count, 20_000):
+      RevokedToken.objects.bulk_create([
+        RevokedToken(jti=uuid.uuid4().hex, exp=int(now + random.uniform(60, lifetime)))
+        for _ in range(min(20_000, count - start))
+      ])
+    self.stdout.write(f'{count:,} tokens revogados sintéticos')
+
+  def measure_checks(self, store, count):
+    now = time.time()
+    lifetime = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+    probes = [(uuid.uuid4().hex, now + random.uniform(60, lifetime)) for _ in range(count)]
+
+    started = time.perf_counter()
+    revoked = sum(store.is_revoked(jti, exp) for jti, exp in probes)
+    bloom = time.perf_counter() - started
+
+    sample = probes[:2_000]
+    started = time.perf_counter()
+    for jti, _ in sample:
+      RevokedToken.objects.filter(jti=jti).exists()
+    database = (time.perf_counter() - started) / len(sample) * count
+
+    self.stdout.write(
+      f'verificação de token válido: Bloom {bloom / count * 1e6:.2f}µs | '
+      f'consulta ao banco {database / count * 1e6:.2f}µs '
+      f'(falsos positivos: {store.false_positives}/{count}, revogados: {revoked})'
+    )
+
+  def measure_refresh(self, store, count):
+    user = UserAccount.objects.create_user(email='bench-revocation@example.com', password=None, first_name='B', last_name='R')
+
+    def run():
+      token = str(RefreshToken.for_user(user))
+      started = time.perf_counter()
+      for _ in range(count):
+        serializer = CustomTokenRefreshSerializer(data={'refresh': token})
+        serializer.is_valid(raise_exception=True)
+        token = serializer.validated_data['refresh']
+      return count / (time.perf_counter() - started)
+
+    with mock.patch('users.serializers.revocation_store', store):
+      with_bloom = run()
+      # Sem o filtro: toda verificação vai ao banco.
+      with mock.patch.object(store, '_maybe_revoked', return_value=True):
+        database_only = run()
+
+    self.stdout.write(
+      f'refresh com rotação: {with_bloom:,.0f}/s com Bloom | {database_only:,.0f}/s consultando o banco sempre'
+    )
@@ -0,0 +1,46 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class Command(BaseCommand):
+  help = 'Compara jwt/verify/batch/ com uma requisição a jwt/verify/ por token.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--tokens', type=int, default=settings.JWT_VERIFY_BATCH_MAX_SIZE)
+    parser.add_argument('--repeat', type=int, default=3)
+
+  def handle(self, *args, **options):
+    tokens = [self.make_token(i) for i in range(options['tokens'])]
+    client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+
+    single = self.best_of(options['repeat'], lambda: [
+      client.post(reverse('jwt-verify'), {'token': token}, content_type='application/json')
+      for token in tokens
+    ])
+    batch = self.best_of(options['repeat'], lambda: client.post(
+      reverse('jwt-verify-batch'), {'tokens': tokens}, content_type='application/json'
+    ))
+
+    self.stdout.write(f'tokens: {len(tokens)}')
+    self.stdout.write(f'uma requisição por token: {single:.4f}s ({len(tokens) / single:,.0f} tokens/s)')
+    self.stdout.write(f'lote: {batch:.4f}s ({len(tokens) / batch:,.0f} tokens/s)')
+    self.stdout.write(self.style.SUCCESS(f'ganho: {single / batch:.1f}x'))
+
+  def make_token(self, index):
+    token = AccessToken()
+    token['user_id'] = index
+    if index % 10 == 0:
+      token.set_exp(lifetime=-AccessToken.lifetime)
+    return str(token)
+
+  def best_of(self, repeat, run):
+    timings = []
+    for _ in range(repeat):
+      started = time.perf_counter()
+      run()
+      timings.append(time.perf_counter() - started)
+    return min(timings)
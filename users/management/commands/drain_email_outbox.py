@@ -0,0 +1,49 @@
+import logging
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from users.mail import drain_outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+  help = (
+    'Envia os e-mails da fila OutboxEmail em lotes, com nova tentativa e descarte. '
+    'Uma varredura que falha (banco ou provedor fora do ar) é registrada no log e '
+    'repetida com espera crescente, até --max-backoff segundos.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+    parser.add_argument('--once', action='store_true', help='Esvazia a fila uma vez e termina.')
+    parser.add_argument('--sleep', type=float, default=5.0, help='Espera entre varreduras, em segundos.')
+    parser.add_argument('--max-backoff', type=float, default=300.0, help='Espera máxima após falhas, em segundos.')
+
+  def handle(self, *args, **options):
+    failures = 0
+    while True:
+      close_old_connections()
+      try:
+        totals = drain_outbox(batch_size=options['batch_size'])
+      except Exception:
+        if options['once']:
+          raise
+        failures += 1
+        logger.exception('Falha ao esvaziar a fila de e-mails (%d seguida(s))', failures)
+        # Uma conexão quebrada não se recupera sozinha; a próxima varredura abre outra.
+        connections.close_all()
+        time.sleep(min(options['sleep'] * 2 ** failures, options['max_backoff']))
+        continue
+
+      failures = 0
+      if totals['batches']:
+        self.stdout.write(
+          f"enviados: {totals['sent']}, falhas: {totals['failed']}, lotes: {totals['batches']}"
+        )
+
+      if options['once']:
+        return
+
+      time.sleep(options['sleep'])
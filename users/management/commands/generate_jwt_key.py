@@ -0,0 +1,34 @@
+from datetime import date
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from users.keys import ASYMMETRIC_ALGORITHMS, generate_private_key, private_key_to_pem
+
+
+class Command(BaseCommand):
+  help = (
+    'Gera uma nova chave de assinatura em JWT_KEYS_DIR. A chave é publicada no JWKS '
+    'imediatamente, mas só passa a assinar quando JWT_ACTIVE_KEY_ID apontar para ela.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--kid', default=date.today().isoformat())
+    parser.add_argument('--algorithm', default=settings.JWT_SIGNING_ALGORITHM, choices=ASYMMETRIC_ALGORITHMS)
+    parser.add_argument('--keys-dir', default=settings.JWT_KEYS_DIR)
+
+  def handle(self, *args, **options):
+    if not options['keys_dir']:
+      raise CommandError('Defina JWT_KEYS_DIR ou use --keys-dir.')
+
+    path = Path(options['keys_dir']) / f"{options['kid']}.pem"
+    if path.exists():
+      raise CommandError(f'A chave {path} já existe.')
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(private_key_to_pem(generate_private_key(options['algorithm'])))
+    path.chmod(0o600)
+
+    self.stdout.write(self.style.SUCCESS(f'Chave criada em {path}'))
+    self.stdout.write(
+      f"Aguarde JWKS_MAX_AGE ({settings.JWKS_MAX_AGE}s) antes de definir JWT_ACTIVE_KEY_ID={options['kid']}."
+    )
@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand
+from users.bulk import PasswordHasherPool, chunked, clean_accounts, create_accounts, read_accounts
+
+
+class Command(BaseCommand):
+  help = (
+    'Importa contas de um arquivo CSV ou NDJSON (email, first_name, last_name, '
+    'password, cpf, plan_type) em lotes transacionais.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['csv', 'ndjson'])
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None, help='Processos para o hash das senhas.')
+
+  def handle(self, *args, **options):
+    started = time.perf_counter()
+    created = rejected = 0
+
+    with PasswordHasherPool(options['workers']) as hasher:
+      for rows in chunked(read_accounts(options['path'], options['format']), options['chunk_size']):
+        accepted, refused = clean_accounts(rows)
+        hashes = hasher.hash_many([row.get('password') or None for row in accepted])
+        create_accounts(accepted, hashes)
+
+        created += len(accepted)
+        rejected += len(refused)
+        for row, reason in refused:
+          self.stderr.write(f"{row.get('email')}: {reason}")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+          f'{created} contas criadas, {rejected} rejeitadas ({created / elapsed:,.0f} contas/s)'
+        )
+
+    self.stdout.write(self.style.SUCCESS(
+      f'Importação concluída em {time.perf_counter() - started:.1f}s: {created} criadas, {rejected} rejeitadas.'
+    ))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from users.avatars import pipeline, sweep_pending_avatars
+
+
+class Command(BaseCommand):
+  help = (
+    'Reprocessa ou marca como falhos os avatares pendentes há mais de --older-than '
+    'minutos, cujo processamento se perdeu.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--older-than', type=int, default=settings.AVATAR_PENDING_TIMEOUT, help='Minutos.')
+
+  def handle(self, *args, **options):
+    totals = sweep_pending_avatars(timedelta(minutes=options['older_than']))
+    # Espera as remoções de arquivos antigos que o reprocessamento agendou.
+    pipeline.shutdown()
+    self.stdout.write(f"reprocessados: {totals['requeued']}, falhos: {totals['failed']}")
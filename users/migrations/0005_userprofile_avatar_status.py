@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_userprofile_cpf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Processando'), ('ready', 'Pronto'), ('failed', 'Falhou')], max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_upload_id',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0006_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useraccount',
+            index=models.Index(fields=['created_at', 'id'], name='useraccount_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useraccount',
+            name='entitlements_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser,  PermissionsMixin
 from django.utils import timezone
 from .validators.validations import validate_cpf, validate_phone, validate_min_value, validate_max_value
@@ -19,11 +19,13 @@ class UserAccountManager(BaseUserManager):
         )
 
         user.set_password(password)
-        user.save(using=self._db)
 
-        Subscription.objects.create(user=user, plan_type='BEAR')
+        with transaction.atomic(using=self._db):
+            user.save(using=self._db)
+
+            Subscription.objects.create(user=user, plan_type='BEAR')
 
-        UserProfile.objects.create(user=user)
+            UserProfile.objects.create(user=user)
 
         return user
 
@@ -53,12 +55,20 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
 
     created_at = models.DateTimeField(auto_now_add=True)
     update_ate = models.DateTimeField(auto_now=True)
+    # Incrementada a cada mudança na assinatura; os access tokens levam a versão
+    # em que as claims de plano foram emitidas (users.tokens).
+    entitlements_version = models.PositiveIntegerField(default=0)
 
     objects = UserAccountManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name']
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='useraccount_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -67,7 +77,7 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
 
     @property
     def is_prof(self):
-        return hasattr(self, 'subscription') and self.subscription.is_pro
+        return hasattr(self, 'subscription') and self.subscription.is_pro()
 
 class UserProfile(models.Model):
     def avatar_path(instance, filename):
@@ -94,7 +104,22 @@ class UserProfile(models.Model):
         null=True,
         blank=True
     )
+    AVATAR_PENDING = 'pending'
+    AVATAR_READY = 'ready'
+    AVATAR_FAILED = 'failed'
+
     avatar = models.ImageField(upload_to=avatar_path, null=True, blank=True)
+    avatar_status = models.CharField(
+        max_length=10,
+        choices=[
+            (AVATAR_PENDING, 'Processando'),
+            (AVATAR_READY, 'Pronto'),
+            (AVATAR_FAILED, 'Falhou')
+        ],
+        null=True,
+        blank=True
+    )
+    avatar_upload_id = models.CharField(max_length=32, null=True, blank=True)
 
     #Informações de endereço
     address = models.CharField(max_length=255, blank=True, null=True)
@@ -161,6 +186,7 @@ class Subscription(models.Model):
         ('BULL', 'Profissional'),
         ('WOLF', 'Trader')
     ]
+    PRO_PLANS = ('BULL', 'WOLF')
 
     user = models.OneToOneField(UserAccount, on_delete=models.CASCADE, related_name='subscription')
     plan_type = models.CharField(max_length=10, choices=PLAN_TYPES, default='BEAR')
@@ -172,11 +198,63 @@ class Subscription(models.Model):
     next_payment_date = models.DateTimeField(null=True, blank=True)
 
     def is_pro(self):
-        return self.plan_type in ['BULL', 'WOLF'] and self.is_active and (self.end_date is None or self.end_date > timezone.now())
+        return self.plan_type in self.PRO_PLANS and self.is_active and (self.end_date is None or self.end_date > timezone.now())
+
+
+class OutboxEmail(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+
+    subject = models.TextField()
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list)
+    bcc = models.JSONField(default=list)
+    reply_to = models.JSONField(default=list)
+    headers = models.JSONField(default=dict)
+    alternatives = models.JSONField(default=list)
+    attachments = models.JSONField(default=list)
+
+    status = models.CharField(
+        max_length=10,
+        choices=[
+            (PENDING, 'Pendente'),
+            (SENT, 'Enviado'),
+            (DEAD, 'Descartado')
+        ],
+        default=PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        verbose_name = 'E-mail na fila'
+        verbose_name_plural = 'E-mails na fila'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
 
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)}"
 
 
 
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=255, unique=True)
+    # Claim exp do token (timestamp); inteiro para a carga dos filtros não
+    # converter milhões de datas.
+    exp = models.BigIntegerField(db_index=True)
+    revoked_at = models.DateTimeField(default=timezone.now, db_index=True)
 
-    
\ No newline at end of file
+    class Meta:
+        verbose_name = 'Token revogado'
+        verbose_name_plural = 'Tokens revogados'
+
+    def __str__(self):
+        return self.jti
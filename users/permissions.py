@@ -1,5 +1,12 @@
 from rest_framework import permissions
+from .tokens import has_current_entitlements, is_pro_from_claims
 
 class IsProUser(permissions.BasePermission):
   def has_permission(self, request, view):
-    return request.user.is_authenticated and request.user.is_pro
\ No newline at end of file
+    if not (request.user and request.user.is_authenticated):
+      return False
+
+    if request.auth is not None and has_current_entitlements(request.auth, request.user):
+      return is_pro_from_claims(request.auth)
+
+    return request.user.is_prof
@@ -0,0 +1,270 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from rest_framework_simplejwt.settings import api_settings
+from .models import RevokedToken
+
+MASK64 = (1 << 64) - 1
+
+# Revogações gravadas por outros processos podem chegar ao banco com
+# revoked_at um pouco no passado (transação lenta); a sincronização relê essa
+# margem.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def _digest(jti):
+  return hashlib.blake2b(jti.encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+  """
+  Filtro de Bloom de tamanho fixo dimensionado para `capacity` itens com taxa
+  de falso positivo `error_rate`. As k posições saem de double hashing sobre
+  um único blake2b de 128 bits, (h1 + i * h2) mod 2**64 mod m, tanto em `add`
+  quanto no `add_many` vetorizado.
+  """
+
+  def __init__(self, capacity, error_rate=0.001):
+    self.capacity = capacity
+    self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    self.hashes = max(1, round(self.size / capacity * math.log(2)))
+    self.bits = bytearray((self.size + 7) // 8)
+    self.count = 0
+
+  def __contains__(self, jti):
+    bits = self.bits
+    return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(jti))
+
+  def __len__(self):
+    return self.count
+
+  @property
+  def nbytes(self):
+    return len(self.bits)
+
+  def add(self, jti):
+    for position in self._positions(jti):
+      self.bits[position >> 3] |= 1 << (position & 7)
+    self.count += 1
+
+  def add_many(self, jtis):
+    if len(jtis) < 64:
+      for jti in jtis:
+        self.add(jti)
+      return
+
+    pairs = np.frombuffer(b''.join(_digest(jti) for jti in jtis), dtype='<u8').reshape(-1, 2)
+    steps = np.arange(self.hashes, dtype=np.uint64)
+    positions = (pairs[:, :1] + steps * (pairs[:, 1:] | np.uint64(1))) % np.uint64(self.size)
+
+    bits = np.unpackbits(np.frombuffer(self.bits, dtype=np.uint8), bitorder='little')
+    bits[positions.ravel()] = 1
+    self.bits[:] = np.packbits(bits, bitorder='little').tobytes()
+    self.count += len(jtis)
+
+  def _positions(self, jti):
+    digest = _digest(jti)
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [((h1 + i * h2) & MASK64) % self.size for i in range(self.hashes)]
+
+
+class RevocationStore:
+  """
+  JTIs revogados até o `exp` do token. A verdade fica na tabela RevokedToken;
+  em cada processo, filtros de Bloom respondem ao caso comum (token não
+  revogado) sem ir ao banco. Só um positivo do filtro é confirmado no banco.
+
+  Os filtros são separados por balde de expiração (exp // bucket_seconds):
+  a consulta olha só o balde do token e, quando todos os tokens de um balde
+  expiram, o balde inteiro é descartado. Se um balde enche, ganha um filtro
+  novo com o dobro da capacidade e metade da taxa de erro, o que mantém a
+  taxa total abaixo de `error_rate`.
+
+  O que outros processos revogam chega pela sincronização, feita no máximo a
+  cada `sync_interval` segundos; o que o próprio processo revoga vale na hora.
+  Linhas expiradas são apagadas do banco uma vez por balde.
+  """
+
+  def __init__(self, bucket_seconds=3600, capacity=4096, error_rate=0.001, sync_interval=5):
+    self.bucket_seconds = bucket_seconds
+    self.capacity = capacity
+    self.error_rate = error_rate
+    self.sync_interval = sync_interval
+    self._lock = threading.Lock()
+    self.clear()
+
+  def clear(self):
+    with self._lock:
+      self._buckets = {}
+      self._synced_at = None
+      self._next_sync = 0.0
+      self._purged_bucket = None
+      self.checks = 0
+      self.bloom_hits = 0
+      self.false_positives = 0
+
+  def revoke(self, jti, exp):
+    """Revoga `jti` até `exp` (a claim exp do token, em segundos)."""
+    self.revoke_many([(jti, exp)])
+
+  def revoke_many(self, entries):
+    """Revoga vários pares (jti, exp) num único INSERT."""
+    RevokedToken.objects.bulk_create([self._row(*entry) for entry in entries], ignore_conflicts=True)
+    self._insert(entries)
+
+  async def arevoke_many(self, entries):
+    await RevokedToken.objects.abulk_create([self._row(*entry) for entry in entries], ignore_conflicts=True)
+    self._insert(entries)
+
+  def revoke_tokens(self, *tokens):
+    self.revoke_many(self._entries(tokens))
+
+  async def arevoke_tokens(self, *tokens):
+    await self.arevoke_many(self._entries(tokens))
+
+  def claim_token(self, token):
+    """
+    Revoga `token` só se ninguém o revogou antes e diz se conseguiu. O INSERT
+    no primário decide entre usos concorrentes do mesmo token, inclusive em
+    outros processos, que o filtro local ainda não conhece.
+    """
+    entries = self._entries([token])
+    if not entries:
+      return True
+
+    jti, exp = entries[0]
+    try:
+      with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        self._rows().create(jti=jti, exp=int(exp))
+    except IntegrityError:
+      claimed = False
+    else:
+      claimed = True
+    self._insert(entries)
+    return claimed
+
+  async def aclaim_token(self, token):
+    return await sync_to_async(self.claim_token)(token)
+
+  def is_revoked(self, jti, exp):
+    if time.monotonic() >= self._next_sync:
+      self.sync()
+    if not self._maybe_revoked(jti, exp):
+      return False
+    return self._confirm(self._rows().filter(jti=jti).exists())
+
+  async def ais_revoked(self, jti, exp):
+    if time.monotonic() >= self._next_sync:
+      await sync_to_async(self.sync)()
+    if not self._maybe_revoked(jti, exp):
+      return False
+    return self._confirm(await self._rows().filter(jti=jti).aexists())
+
+  def is_token_revoked(self, token):
+    jti = token.get(api_settings.JTI_CLAIM)
+    return jti is not None and self.is_revoked(jti, token['exp'])
+
+  async def ais_token_revoked(self, token):
+    jti = token.get(api_settings.JTI_CLAIM)
+    return jti is not None and await self.ais_revoked(jti, token['exp'])
+
+  def sync(self):
+    """Traz as revogações novas do banco (todas, na primeira vez) e descarta os baldes vencidos."""
+    with self._lock:
+      now = time.time()
+      started = datetime.fromtimestamp(now, dt_timezone.utc)
+      queryset = self._rows().filter(exp__gt=now)
+      if self._synced_at is not None:
+        queryset = queryset.filter(revoked_at__gte=self._synced_at - SYNC_OVERLAP)
+      rows = list(queryset.values_list('jti', 'exp'))
+
+      current = int(now) // self.bucket_seconds
+      for bucket in [bucket for bucket in self._buckets if bucket < current]:
+        del self._buckets[bucket]
+      if self._purged_bucket != current:
+        # Limpeza, não escrita do usuário: com o banco explícito o roteador
+        # não a conta para prender o usuário ao primário (full_auth/replicas.py).
+        self._rows().filter(exp__lte=now).delete()
+        self._purged_bucket = current
+
+      self._synced_at = started
+      self._next_sync = time.monotonic() + self.sync_interval
+
+    self._insert(rows)
+
+  @property
+  def stats(self):
+    filters = [bloom for stages in self._buckets.values() for bloom in stages]
+    return {
+      'buckets': len(self._buckets),
+      'filters': len(filters),
+      'tokens': sum(len(bloom) for bloom in filters),
+      'nbytes': sum(bloom.nbytes for bloom in filters),
+      'checks': self.checks,
+      'bloom_hits': self.bloom_hits,
+      'false_positives': self.false_positives,
+    }
+
+  def _entries(self, tokens):
+    return [
+      (token[api_settings.JTI_CLAIM], token['exp'])
+      for token in tokens
+      if token.get(api_settings.JTI_CLAIM) is not None
+    ]
+
+  def _rows(self):
+    # Sempre o primário, mesmo dentro de replica_reads: uma réplica atrasada
+    # faria a sincronização avançar _synced_at sem ver revogações recentes, que
+    # nunca mais entrariam no filtro deste processo.
+    return RevokedToken.objects.using(DEFAULT_DB_ALIAS)
+
+  def _row(self, jti, exp):
+    return RevokedToken(jti=jti, exp=int(exp))
+
+  def _maybe_revoked(self, jti, exp):
+    self.checks += 1
+    stages = self._buckets.get(int(exp) // self.bucket_seconds, ())
+    if not any(jti in bloom for bloom in stages):
+      return False
+    self.bloom_hits += 1
+    return True
+
+  def _confirm(self, revoked):
+    if not revoked:
+      self.false_positives += 1
+    return revoked
+
+  def _insert(self, rows):
+    by_bucket = {}
+    for jti, exp in rows:
+      by_bucket.setdefault(int(exp) // self.bucket_seconds, []).append(jti)
+
+    with self._lock:
+      for bucket, jtis in by_bucket.items():
+        stages = self._buckets.setdefault(bucket, [])
+        if stages:
+          # A sincronização relê revogações já conhecidas; não contam de novo.
+          jtis = [jti for jti in jtis if not any(jti in bloom for bloom in stages)]
+        while jtis:
+          if not stages or len(stages[-1]) >= stages[-1].capacity:
+            level = len(stages)
+            stages.append(BloomFilter(max(self.capacity << level, 2 * len(jtis)), self.error_rate / 2 ** (level + 1)))
+          room = stages[-1].capacity - len(stages[-1])
+          stages[-1].add_many(jtis[:room])
+          jtis = jtis[room:]
+
+
+revocation_store = RevocationStore(
+  bucket_seconds=getattr(settings, 'AUTH_REVOCATION_BUCKET_SECONDS', 3600),
+  capacity=getattr(settings, 'AUTH_REVOCATION_BLOOM_CAPACITY', 4096),
+  error_rate=getattr(settings, 'AUTH_REVOCATION_BLOOM_ERROR_RATE', 0.001),
+  sync_interval=getattr(settings, 'AUTH_REVOCATION_SYNC_INTERVAL', 5),
+)
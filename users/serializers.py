@@ -1,28 +1,44 @@
 from datetime import date
 import re
 from rest_framework import serializers
+from django.conf import settings
+from django.core import signing
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer, TokenVerifySerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+from .avatars import read_upload_token, rendition_urls
 from .models import UserProfile
+from .revocation import revocation_store
+from .tokens import BatchTokenVerifier, EntitledRefreshToken
 from .validators.validations import validate_cpf
 
 User = get_user_model()
 
+REVOKED_TOKEN = 'Token revogado.'
+
 class UserSerializer(serializers.ModelSerializer):
   class Meta:
     model = User
     fields = ('id', 'email', 'first_name', 'last_name', 'is_active')
     read_only_fields = ('id', 'is_active')
 
+class AccountListSerializer(UserSerializer):
+  class Meta(UserSerializer.Meta):
+    fields = UserSerializer.Meta.fields + ('is_staff', 'created_at')
+
 class UserProfileSerializer(serializers.ModelSerializer):
   user = serializers.PrimaryKeyRelatedField(read_only=True)
   first_name = serializers.CharField(source="user.first_name", required=False)
   last_name = serializers.CharField(source="user.last_name", required=False)
   full_name = serializers.SerializerMethodField()
+  avatar_renditions = serializers.SerializerMethodField()
 
   class Meta:
     model = UserProfile
     fields = '__all__'
-    read_only_fields = ('user', 'created_at', 'update_at')
+    read_only_fields = ('user', 'created_at', 'update_at', 'avatar_status', 'avatar_upload_id')
 
   def validate_cpf(self, value):       
         
@@ -36,6 +52,9 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
   def get_full_name(self, obj):
     return obj.user.get_full_name()
+
+  def get_avatar_renditions(self, obj):
+    return rendition_urls(obj.avatar.name)
   
   def validate_age(self, value):
     if value and (value < 18 or value > 120):
@@ -66,4 +85,61 @@ class UserProfileUpdateSerializer(UserProfileSerializer):
 class UserAvatarUpdateSerializer(serializers.ModelSerializer):
   class Meta:
     model = UserProfile
-    fields = ('avatar',)
\ No newline at end of file
+    fields = ('avatar',)
+
+class AvatarUploadRequestSerializer(serializers.Serializer):
+  content_type = serializers.ChoiceField(choices=settings.AVATAR_CONTENT_TYPES)
+
+class AvatarUploadConfirmSerializer(serializers.Serializer):
+  upload_token = serializers.CharField()
+
+  def validate_upload_token(self, value):
+    try:
+      return read_upload_token(self.context['profile'], value)
+    except signing.BadSignature:
+      raise serializers.ValidationError("Upload inválido ou expirado.")
+
+class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+  token_class = EntitledRefreshToken
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+  token_class = EntitledRefreshToken
+
+  def validate(self, attrs):
+    refresh = self.token_class(attrs['refresh'])
+    if revocation_store.is_token_revoked(refresh):
+      raise TokenError(REVOKED_TOKEN)
+
+    # O refresh usado deixa de valer; quem o reapresentar (inclusive quem o
+    # roubou, ou um refresh concorrente em outro worker) recebe 401.
+    if api_settings.ROTATE_REFRESH_TOKENS and not revocation_store.claim_token(refresh):
+      raise TokenError(REVOKED_TOKEN)
+
+    data = {'access': str(refresh.access_token)}
+
+    if api_settings.ROTATE_REFRESH_TOKENS:
+      refresh.set_jti()
+      refresh.set_exp()
+      refresh.set_iat()
+      data['refresh'] = str(refresh)
+
+    return data
+
+class CustomTokenVerifySerializer(TokenVerifySerializer):
+  def validate(self, attrs):
+    if revocation_store.is_token_revoked(UntypedToken(attrs['token'])):
+      raise TokenError(REVOKED_TOKEN)
+    return {}
+
+class TokenBatchVerifySerializer(serializers.Serializer):
+  tokens = serializers.ListField(
+    child=serializers.CharField(trim_whitespace=True),
+    allow_empty=False,
+    max_length=settings.JWT_VERIFY_BATCH_MAX_SIZE,
+    write_only=True
+  )
+
+  def validate(self, attrs):
+    verifier = BatchTokenVerifier()
+    results = [{'status': status} for status in verifier.verify_many(attrs['tokens'])]
+    return {'results': results}
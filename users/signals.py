@@ -0,0 +1,18 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import UserAccount, Subscription
+from .cache import user_cache
+from .tokens import mark_entitlements_changed
+
+
+@receiver(post_save, sender=UserAccount)
+@receiver(post_delete, sender=UserAccount)
+def invalidate_cached_user(sender, instance, **kwargs):
+  user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_entitlement_claims(sender, instance, created=False, **kwargs):
+  if not created:
+    mark_entitlements_changed(instance.user_id)
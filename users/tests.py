@@ -1,3 +1,1505 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+import jwt
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from hypothesis import given, settings as hypothesis_settings, strategies as st
+from PIL import Image
+from rest_framework.exceptions import Throttled
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from custom_storages import CustomS3Boto3Storage
+from full_auth.instrumentation import ServerTimingMiddleware
+from full_auth.metrics import Registry
+from full_auth.pagination import KeysetPagination
+from full_auth.replicas import replica_reads
+from . import avatars, urls
+from .async_views import AsyncLogoutView, AsyncTokenObtainPairView, AsyncTokenRefreshView, AsyncTokenVerifyView
+from .authentication import CustomJWTAuthentication
+from .cache import UserCache, user_cache
+from .checks import check_shared_caches
+from .keys import KeyRing, LocalTokenVerifier, build_token_backend, generate_private_key
+from .avatars import AvatarPipeline, AvatarPipelineFull, process_avatar
+from .benchmark import compare
+from .mail import drain_outbox
+from .models import OutboxEmail, RevokedToken, UserAccount, UserProfile, Subscription
+from .permissions import IsProUser
+from .revocation import BloomFilter, RevocationStore, revocation_store
+from .throttling import LoginThrottle, login_throttle
+from .tokens import BatchTokenVerifier, has_current_entitlements
+from .validators.validations import validate_cpf, validate_cpfs
 
-# Create your tests here.
+
+def create_user(email='user@example.com', password='S3nha-forte!', **kwargs):
+  kwargs.setdefault('first_name', 'Ana')
+  kwargs.setdefault('last_name', 'Silva')
+  return UserAccount.objects.create_user(email=email, password=password, **kwargs)
+
+
+class UserCacheTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    user_cache.clear()
+    self.user = create_user()
+    self.client = APIClient()
+    self.access = str(RefreshToken.for_user(self.user).access_token)
+    self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+  def test_second_authentication_skips_user_query(self):
+    request = APIRequestFactory().get('/api/profile/', HTTP_AUTHORIZATION=f'Bearer {self.access}')
+    authentication = CustomJWTAuthentication()
+    authentication.authenticate(request)
+
+    with self.assertNumQueries(0):
+      user, _ = authentication.authenticate(request)
+
+    self.assertEqual(user.pk, self.user.pk)
+    self.assertEqual(user_cache.stats['hits'], 1)
+    self.assertEqual(user_cache.stats['misses'], 1)
+
+  def test_save_invalidates_cached_user(self):
+    self.client.get('/api/profile/')
+    self.user.is_active = False
+    self.user.save()
+
+    response = self.client.get('/api/profile/')
+
+    self.assertEqual(response.status_code, 401)
+
+  def test_lru_eviction(self):
+    local = UserCache(max_size=2, ttl=60)
+    local.set(1, 'a', self.user)
+    local.set(2, 'b', self.user)
+    local.get(1, 'a')
+    local.set(3, 'c', self.user)
+
+    self.assertIsNone(local.get(2, 'b'))
+    self.assertIsNotNone(local.get(1, 'a'))
+    self.assertEqual(local.stats['size'], 2)
+
+  def test_ttl_expiry(self):
+    local = UserCache(ttl=10)
+    with mock.patch('users.cache.time.monotonic', return_value=100.0):
+      local.set(1, 'a', self.user)
+    with mock.patch('users.cache.time.monotonic', return_value=111.0):
+      self.assertIsNone(local.get(1, 'a'))
+
+  def test_django_backend_invalidation(self):
+    shared = UserCache(backend='django')
+    shared.set(self.user.pk, 'a', self.user)
+    self.assertEqual(shared.get(self.user.pk, 'a').pk, self.user.pk)
+
+    shared.invalidate(self.user.pk)
+
+    self.assertIsNone(shared.get(self.user.pk, 'a'))
+    self.assertEqual(shared.stats['hits'], 1)
+    self.assertEqual(shared.stats['misses'], 1)
+
+  def test_clear_empties_both_backends(self):
+    local, shared = UserCache(), UserCache(backend='django')
+    for backend in (local, shared):
+      backend.set(self.user.pk, 'a', self.user)
+    cache.set('outra-chave', 1)
+
+    for backend in (local, shared):
+      backend.clear()
+      self.assertIsNone(backend.get(self.user.pk, 'a'))
+      self.assertEqual((backend.stats['hits'], backend.stats['misses']), (0, 1))
+    self.assertEqual(cache.get('outra-chave'), 1)
+
+  def test_counters_are_exact_under_concurrency(self):
+    local = UserCache()
+    local.set(1, 'a', self.user)
+
+    def lookups():
+      for _ in range(2000):
+        local.get(1, 'a')
+        local.get(2, 'b')
+
+    threads = [threading.Thread(target=lookups) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual((local.stats['hits'], local.stats['misses']), (8000, 8000))
+
+
+class EntitlementClaimsTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.user = create_user()
+    self.client = APIClient()
+
+  def login(self):
+    response = self.client.post('/api/jwt/create/', {'email': self.user.email, 'password': 'S3nha-forte!'})
+    self.assertEqual(response.status_code, 200)
+    return AccessToken(response.json()['access'])
+
+  def test_access_token_carries_plan_claims(self):
+    self.user.subscription.plan_type = 'BULL'
+    self.user.subscription.save()
+
+    token = self.login()
+
+    self.assertEqual(token['plan'], 'BULL')
+    self.assertTrue(token['plan_active'])
+    self.assertIsNone(token['plan_end'])
+
+  def test_refresh_reloads_plan_claims(self):
+    response = self.client.post('/api/jwt/create/', {'email': self.user.email, 'password': 'S3nha-forte!'})
+    Subscription.objects.filter(user=self.user).update(plan_type='WOLF')
+
+    response = self.client.post('/api/jwt/refresh/', {'refresh': response.json()['refresh']}, format='json')
+
+    self.assertEqual(AccessToken(response.json()['access'])['plan'], 'WOLF')
+
+  def test_is_pro_user_answers_from_claims(self):
+    self.user.subscription.plan_type = 'BULL'
+    self.user.subscription.save()
+    cache.clear()
+    token = self.login()
+    user = UserAccount.objects.get(pk=self.user.pk)
+
+    with self.assertNumQueries(0):
+      allowed = IsProUser().has_permission(SimpleNamespace(user=user, auth=token), None)
+
+    self.assertTrue(allowed)
+
+  def test_plan_change_makes_claims_stale(self):
+    subscription = self.user.subscription
+    subscription.plan_type = 'BULL'
+    subscription.save()
+    token = self.login()
+
+    subscription.plan_type = 'BEAR'
+    subscription.save()
+    # A marca fica no banco: não some com o cache nem depende do processo.
+    cache.clear()
+
+    user = UserAccount.objects.get(pk=self.user.pk)
+    self.assertFalse(has_current_entitlements(token, user))
+    self.assertFalse(IsProUser().has_permission(SimpleNamespace(user=user, auth=token), None))
+    self.assertTrue(has_current_entitlements(self.login(), user))
+
+
+class TokenBatchVerifyTests(TestCase):
+  def setUp(self):
+    self.client = APIClient()
+
+  def test_reports_status_per_token(self):
+    valid = AccessToken()
+    expired = AccessToken()
+    expired.set_exp(lifetime=-AccessToken.lifetime)
+    tampered = str(AccessToken())[:-2] + 'xx'
+
+    response = self.client.post(
+      reverse('jwt-verify-batch'), {'tokens': [str(valid), str(expired), tampered, 'lixo']}, format='json'
+    )
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(
+      [result['status'] for result in response.data['results']],
+      ['valid', 'expired', 'invalid', 'invalid']
+    )
+
+  def test_reports_tokens_revoked_by_logout(self):
+    revocation_store.clear()
+    refresh = RefreshToken.for_user(create_user())
+    access = refresh.access_token
+    self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+    self.client.post(reverse('logout'), {'refresh': str(refresh)}, format='json')
+
+    response = self.client.post(
+      reverse('jwt-verify-batch'), {'tokens': [str(access), str(refresh), str(AccessToken())]}, format='json'
+    )
+
+    self.assertEqual(
+      [result['status'] for result in response.data['results']], ['revoked', 'revoked', 'valid']
+    )
+
+  def test_rejects_empty_batch(self):
+    response = self.client.post(reverse('jwt-verify-batch'), {'tokens': []}, format='json')
+
+    self.assertEqual(response.status_code, 400)
+
+
+class KeyRolloverTests(TestCase):
+  def setUp(self):
+    self.client = APIClient()
+    self.user = create_user()
+    self.now = 0
+    self.fetches = 0
+    self.old_key = generate_private_key('RS256')
+    self.new_key = generate_private_key('RS256')
+
+  def use_key_ring(self, key_ring):
+    for patcher in (
+      mock.patch('rest_framework_simplejwt.state.token_backend', build_token_backend(key_ring)),
+      mock.patch('users.views.get_key_ring', return_value=key_ring),
+    ):
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def fetch(self, url):
+    self.fetches += 1
+    response = self.client.get(url)
+    return response.json(), settings.JWKS_MAX_AGE
+
+  def verify_on_server(self, token):
+    return self.client.post(reverse('jwt-verify'), {'token': token}, format='json').status_code
+
+  def test_jwks_is_cacheable(self):
+    self.use_key_ring(KeyRing('RS256', {'k1': self.old_key}))
+
+    response = self.client.get(reverse('jwks'))
+
+    self.assertEqual([key['kid'] for key in response.json()['keys']], ['k1'])
+    self.assertIn(f'max-age={settings.JWKS_MAX_AGE}', response['Cache-Control'])
+    self.assertIn('public', response['Cache-Control'])
+    cached = self.client.get(reverse('jwks'), HTTP_IF_NONE_MATCH=response['ETag'])
+    self.assertEqual(cached.status_code, 304)
+
+  def test_rollover_keeps_in_flight_tokens_valid(self):
+    self.use_key_ring(KeyRing('RS256', {'k1': self.old_key}))
+    old_token = str(AccessToken.for_user(self.user))
+    verifier = LocalTokenVerifier(reverse('jwks'), fetch=self.fetch, clock=lambda: self.now)
+    self.assertEqual(verifier.verify(old_token)['user_id'], self.user.pk)
+
+    # A nova chave é publicada e ativada enquanto o token antigo ainda vale.
+    self.use_key_ring(KeyRing('RS256', {'k1': self.old_key, 'k2': self.new_key}, active_kid='k2'))
+    new_token = str(AccessToken.for_user(self.user))
+    self.now = 60
+
+    self.assertEqual(jwt.get_unverified_header(new_token)['kid'], 'k2')
+    self.assertEqual(verifier.verify(new_token)['user_id'], self.user.pk)
+    self.assertEqual(verifier.verify(old_token)['user_id'], self.user.pk)
+    self.assertEqual(self.fetches, 2)
+    self.assertEqual(self.verify_on_server(old_token), 200)
+    self.assertEqual(self.verify_on_server(new_token), 200)
+    self.assertEqual(
+      BatchTokenVerifier().verify_many([old_token, new_token]),
+      [BatchTokenVerifier.VALID, BatchTokenVerifier.VALID]
+    )
+
+    # Depois que a chave antiga é removida, os tokens dela deixam de valer.
+    self.use_key_ring(KeyRing('RS256', {'k2': self.new_key}))
+    self.assertEqual(self.verify_on_server(old_token), 401)
+    self.assertEqual(self.verify_on_server(new_token), 200)
+
+  def test_unknown_kid_refetch_is_rate_limited(self):
+    self.use_key_ring(KeyRing('RS256', {'k1': self.old_key}))
+    verifier = LocalTokenVerifier(reverse('jwks'), fetch=self.fetch, clock=lambda: self.now)
+    verifier.verify(str(AccessToken.for_user(self.user)))
+    forged = jwt.encode({'exp': time.time() + 60}, self.new_key, algorithm='RS256', headers={'kid': 'k9'})
+
+    for _ in range(3):
+      with self.assertRaises(jwt.InvalidTokenError):
+        verifier.verify(forged)
+
+    self.assertEqual(self.fetches, 1)
+
+  def test_eddsa_signing(self):
+    self.use_key_ring(KeyRing('EdDSA', {'ed1': generate_private_key('EdDSA')}))
+    token = str(AccessToken.for_user(self.user))
+
+    self.assertEqual(jwt.get_unverified_header(token)['alg'], 'EdDSA')
+    self.assertEqual(self.verify_on_server(token), 200)
+    self.assertEqual(self.client.get(reverse('jwks')).json()['keys'][0]['crv'], 'Ed25519')
+
+
+class FlakyBackend(BaseEmailBackend):
+  failures = 0
+
+  def send_messages(self, email_messages):
+    if FlakyBackend.failures:
+      FlakyBackend.failures -= 1
+      raise ConnectionError('SES indisponível')
+    mail.outbox.extend(email_messages)
+    return len(email_messages)
+
+
+@override_settings(
+  EMAIL_BACKEND='users.mail.OutboxEmailBackend',
+  OUTBOX_DELIVERY_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+  OUTBOX_MAX_ATTEMPTS=2
+)
+class EmailOutboxTests(TestCase):
+  def test_registration_email_is_queued_not_sent(self):
+    response = APIClient().post('/api/users/', {
+      'email': 'nova@example.com',
+      'first_name': 'Nova',
+      'last_name': 'Conta',
+      'password': 'S3nha-forte!',
+      're_password': 'S3nha-forte!',
+    }, format='json')
+
+    self.assertEqual(response.status_code, 201)
+    self.assertEqual(len(mail.outbox), 0)
+    email = OutboxEmail.objects.get()
+    self.assertEqual(email.to, ['nova@example.com'])
+    self.assertTrue(email.alternatives)
+
+  def test_drain_sends_in_batches_over_one_connection(self):
+    for index in range(5):
+      EmailMultiAlternatives(f'Assunto {index}', 'Corpo', 'app@example.com', [f'{index}@example.com']).send()
+
+    with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_connection:
+      totals = drain_outbox(batch_size=2)
+
+    self.assertEqual(open_connection.call_count, 1)
+    self.assertEqual(totals, {'sent': 5, 'failed': 0, 'batches': 3})
+    self.assertEqual(len(mail.outbox), 5)
+    self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.SENT).exists())
+
+  @override_settings(OUTBOX_DELIVERY_BACKEND='users.tests.FlakyBackend')
+  def test_failures_are_retried_then_dead_lettered(self):
+    EmailMultiAlternatives('Assunto', 'Corpo', 'app@example.com', ['a@example.com']).send()
+    FlakyBackend.failures = 1
+
+    drain_outbox()
+    email = OutboxEmail.objects.get()
+    self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+    self.assertGreater(email.next_attempt_at, timezone.now())
+
+    OutboxEmail.objects.update(next_attempt_at=timezone.now())
+    drain_outbox()
+    self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.SENT)
+
+    EmailMultiAlternatives('Outro', 'Corpo', 'app@example.com', ['b@example.com']).send()
+    for _ in range(2):
+      FlakyBackend.failures = 1
+      OutboxEmail.objects.filter(status=OutboxEmail.PENDING).update(next_attempt_at=timezone.now())
+      drain_outbox()
+
+    dead = OutboxEmail.objects.get(subject='Outro')
+    self.assertEqual(dead.status, OutboxEmail.DEAD)
+    self.assertIn('SES indisponível', dead.last_error)
+
+  def test_drain_command_survives_failures_with_backoff(self):
+    command = 'users.management.commands.drain_email_outbox'
+    totals = {'sent': 1, 'failed': 0, 'batches': 1}
+    sleeps = []
+
+    def sleep(seconds):
+      sleeps.append(seconds)
+      if len(sleeps) == 4:
+        raise KeyboardInterrupt
+
+    with mock.patch(f'{command}.drain_outbox', side_effect=[OSError('banco fora'), OSError('banco fora'), totals, totals]), \
+         mock.patch(f'{command}.time.sleep', side_effect=sleep), \
+         mock.patch(f'{command}.close_old_connections'), \
+         mock.patch(f'{command}.connections') as connections, \
+         self.assertLogs(command, 'ERROR') as logs, \
+         self.assertRaises(KeyboardInterrupt):
+      call_command('drain_email_outbox', sleep=5, max_backoff=15, stdout=StringIO())
+
+    self.assertEqual(sleeps, [10, 15, 5, 5])
+    self.assertEqual(len(logs.records), 2)
+    self.assertEqual(connections.close_all.call_count, 2)
+
+
+def make_cpf(number):
+  digits = [int(digit) for digit in f'{number:09d}']
+  for weight in (10, 11):
+    remainder = sum(digit * (weight - index) for index, digit in enumerate(digits)) % 11
+    digits.append(0 if remainder < 2 else 11 - remainder)
+  return ''.join(map(str, digits))
+
+
+cpf_like = st.one_of(
+  st.integers(0, 999_999_999).map(make_cpf),
+  st.integers(0, 999_999_999).map(lambda n: '{0[0]}{0[1]}{0[2]}.{0[3]}{0[4]}{0[5]}.{0[6]}{0[7]}{0[8]}-{0[9]}{0[10]}'.format(make_cpf(n))),
+  st.sampled_from('0123456789').map(lambda digit: digit * 11),
+  st.text(alphabet='0123456789.- x٣', max_size=16),
+  st.integers(),
+  st.none(),
+)
+
+
+class BatchCpfValidationTests(SimpleTestCase):
+  @given(st.lists(cpf_like, max_size=50), st.integers(1, 8))
+  @hypothesis_settings(max_examples=300, deadline=None)
+  def test_matches_scalar_validation(self, values, chunk_size):
+    mask, normalized = validate_cpfs(values, chunk_size=chunk_size)
+
+    self.assertEqual(mask.tolist(), [validate_cpf(value) for value in values])
+    self.assertEqual(normalized.tolist(), [re.sub(r'[^0-9]', '', str(value)) for value in values])
+
+  def test_accepts_numpy_arrays(self):
+    mask, normalized = validate_cpfs(np.array(['529.982.247-25', '52998224724']))
+
+    self.assertEqual(mask.tolist(), [True, False])
+    self.assertEqual(normalized.tolist(), ['52998224725', '52998224724'])
+
+
+class ImportAccountsTests(TestCase):
+  def write(self, content, suffix):
+    path = tempfile.mktemp(suffix=suffix)
+    with open(path, 'w', encoding='utf-8') as target:
+      target.write(content)
+    self.addCleanup(os.remove, path)
+    return path
+
+  def test_imports_csv_in_chunks(self):
+    existing = create_user(email='existente@example.com')
+    UserProfile.objects.filter(user=existing).update(cpf=make_cpf(1))
+    lines = ['email,first_name,last_name,password,cpf,plan_type']
+    lines += [f'Pessoa{n}@Example.com,Pessoa,{n},senha-{n},{make_cpf(n)},' for n in range(2, 7)]
+    lines += [
+      'existente@example.com,Já,Existe,x,' + make_cpf(100) + ',',
+      'invalido,Sem,Email,x,' + make_cpf(101) + ',',
+      'cpf@example.com,Cpf,Ruim,x,12345678900,',
+      'pessoa2@example.com,Duplicada,No Arquivo,x,' + make_cpf(102) + ',',
+      'wolf@example.com,Wolf,Plan,x,' + make_cpf(103) + ',wolf',
+    ]
+    out, err = StringIO(), StringIO()
+
+    call_command('import_accounts', self.write('\n'.join(lines), '.csv'), chunk_size=4, workers=1, stdout=out, stderr=err)
+
+    self.assertEqual(UserAccount.objects.count(), 7)
+    user = UserAccount.objects.get(email='pessoa3@example.com')
+    self.assertTrue(user.check_password('senha-3'))
+    self.assertEqual(user.profile.cpf, make_cpf(3))
+    self.assertEqual(user.subscription.plan_type, 'BEAR')
+    self.assertEqual(UserAccount.objects.get(email='wolf@example.com').subscription.plan_type, 'WOLF')
+    self.assertIn('6 criadas, 4 rejeitadas', out.getvalue())
+    self.assertIn('CPF inválido', err.getvalue())
+
+  def test_imports_ndjson(self):
+    rows = [{'email': 'a@example.com', 'first_name': 'A', 'last_name': 'B', 'cpf': make_cpf(7)}]
+
+    call_command('import_accounts', self.write('\n'.join(map(json.dumps, rows)), '.ndjson'), workers=1, stdout=StringIO())
+
+    self.assertFalse(UserAccount.objects.get(email='a@example.com').has_usable_password())
+
+
+class AccountListTests(TestCase):
+  def setUp(self):
+    self.staff = create_user(email='staff@example.com', is_staff=True)
+    UserAccount.objects.bulk_create([
+      UserAccount(email=f'conta{n}@example.com', first_name='Conta', last_name=str(n)) for n in range(5)
+    ])
+    UserAccount.objects.filter(email__startswith='conta').update(created_at=self.staff.created_at)
+    self.client = APIClient()
+
+  def test_pages_newest_first_by_cursor(self):
+    self.client.force_authenticate(self.staff)
+    emails, url = [], reverse('account-list') + '?page_size=2'
+
+    while url:
+      response = self.client.get(url)
+      self.assertEqual(response.status_code, 200)
+      emails += [account['email'] for account in response.data['results']]
+      url = response.data['next']
+
+    # Empates em created_at são desfeitos pelo id.
+    expected = list(UserAccount.objects.order_by('-created_at', '-id').values_list('email', flat=True))
+    self.assertEqual(emails, expected)
+    self.assertEqual(len(emails), 6)
+
+  def test_rejects_invalid_cursor_and_non_staff(self):
+    self.client.force_authenticate(self.staff)
+    self.assertEqual(self.client.get(reverse('account-list'), {'cursor': 'xx'}).status_code, 404)
+    for values in (['x', 'y'], [{'a': 1}, 2], [None, 1]):
+      cursor = KeysetPagination().encode_cursor(values)
+      self.assertEqual(self.client.get(reverse('account-list'), {'cursor': cursor}).status_code, 404, values)
+
+    self.client.force_authenticate(UserAccount.objects.get(email='conta1@example.com'))
+    self.assertEqual(self.client.get(reverse('account-list')).status_code, 403)
+
+
+class ConditionalProfileTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    user_cache.clear()
+    self.user = create_user()
+    self.client = APIClient()
+    self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+  def test_not_modified_skips_serialization(self):
+    for name in ('profile-list', 'profile-investment-info'):
+      with self.subTest(endpoint=name):
+        response = self.client.get(reverse(name))
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with mock.patch('users.views.UserProfileSerializer.to_representation') as serialize, \
+             self.assertNumQueries(1):
+          response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        serialize.assert_not_called()
+
+  def test_changes_produce_new_validators(self):
+    first = self.client.get(reverse('profile-list'))
+    other = self.client.get(reverse('profile-investment-info'))
+    self.assertNotEqual(first['ETag'], other['ETag'])
+
+    self.client.patch(reverse('profile-update-notifications'), {'email_notifications': False}, format='json')
+    response = self.client.get(reverse('profile-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+    self.assertEqual(response.status_code, 200)
+    self.assertFalse(response.data['email_notifications'])
+
+    response = self.client.get(reverse('profile-list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+    self.assertEqual(response.status_code, 304)
+
+    self.user.first_name = 'Bia'
+    self.user.save()
+    response = self.client.get(reverse('profile-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+    self.assertEqual(response.data['first_name'], 'Bia')
+
+
+class AsyncAuthViewsTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.user = create_user()
+    self.factory = AsyncRequestFactory()
+
+  async def post(self, view, data=None, headers=None):
+    request = self.factory.post('/', data or {}, content_type='application/json', headers=headers)
+    response = await view.as_view()(request)
+    return response, json.loads(response.content or b'{}')
+
+  async def test_login_refresh_and_verify(self):
+    response, body = await self.post(
+      AsyncTokenObtainPairView, {'email': 'user@example.com', 'password': 'S3nha-forte!'}
+    )
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(AccessToken(body['access'])['plan'], 'BEAR')
+    self.assertEqual(response.cookies['refresh'].value, body['refresh'])
+
+    response, refreshed = await self.post(AsyncTokenRefreshView, {'refresh': body['refresh']})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(AccessToken(refreshed['access'])['user_id'], self.user.pk)
+
+    response, _ = await self.post(AsyncTokenVerifyView, {'token': refreshed['access']})
+    self.assertEqual(response.status_code, 200)
+
+  async def test_rejects_bad_credentials_and_tokens(self):
+    for data in ({'email': 'user@example.com', 'password': 'errada'}, {'email': 'x@example.com', 'password': 'x'}):
+      response, body = await self.post(AsyncTokenObtainPairView, data)
+      self.assertEqual((response.status_code, body['code']), (401, 'no_active_account'))
+
+    response, body = await self.post(AsyncTokenObtainPairView, {'email': 'user@example.com'})
+    self.assertEqual((response.status_code, list(body)), (400, ['password']))
+
+    for view, field in ((AsyncTokenRefreshView, 'refresh'), (AsyncTokenVerifyView, 'token')):
+      response, body = await self.post(view, {field: 'nao-e-um-token'})
+      self.assertEqual((response.status_code, body['code']), (401, 'token_not_valid'))
+
+  async def test_logout_with_only_a_refresh_token(self):
+    refresh = RefreshToken.for_user(self.user)
+
+    response, _ = await self.post(AsyncLogoutView, {'refresh': str(refresh)}, headers={'Authorization': 'Bearer expirado'})
+
+    self.assertEqual(response.status_code, 204)
+    self.assertEqual((response.cookies['access'].value, response.cookies['refresh'].value), ('', ''))
+    response, body = await self.post(AsyncTokenRefreshView, {'refresh': str(refresh)})
+    self.assertEqual((response.status_code, body['code']), (401, 'token_not_valid'))
+
+  async def test_logout_without_tokens_still_clears_the_cookies(self):
+    response, _ = await self.post(AsyncLogoutView)
+
+    self.assertEqual(response.status_code, 204)
+    self.assertEqual(response.cookies['refresh'].value, '')
+    self.assertEqual(await RevokedToken.objects.acount(), 0)
+
+  async def test_logout_ignores_a_body_that_is_not_a_json_object(self):
+    refresh = RefreshToken.for_user(self.user)
+    headers = {'Authorization': f'Bearer {refresh.access_token}'}
+
+    response, _ = await self.post(AsyncLogoutView, [str(refresh)], headers=headers)
+
+    self.assertEqual(response.status_code, 204)
+    self.assertEqual(await RevokedToken.objects.acount(), 1)
+
+
+
+class LoginThrottleTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    create_user()
+    self.client = APIClient()
+    self.throttle = LoginThrottle(window=60, ip_limit=5, email_limit=3, max_concurrent=1, hash_wait=0)
+    for module in ('users.views', 'users.async_views'):
+      patcher = mock.patch(f'{module}.login_throttle', self.throttle)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def login(self, email='user@example.com', password='errada', **extra):
+    return self.client.post('/api/jwt/create/', {'email': email, 'password': password}, **extra)
+
+  def test_limits_attempts_per_email_before_hashing(self):
+    for _ in range(3):
+      self.assertEqual(self.login(email=' User@Example.com ').status_code, 401)
+
+    with mock.patch.object(UserAccount, 'check_password') as check_password:
+      response = self.login()
+
+    self.assertEqual(response.status_code, 429)
+    self.assertIn('Retry-After', response)
+    check_password.assert_not_called()
+    self.assertEqual(self.login(email='outra@example.com').status_code, 401)
+    self.assertEqual(
+      {name: self.throttle.stats[name] for name in ('admitted', 'rejected_email', 'rejected_ip')},
+      {'admitted': 4, 'rejected_email': 1, 'rejected_ip': 0}
+    )
+
+  def test_limits_attempts_per_ip(self):
+    for index in range(5):
+      self.assertEqual(self.login(email=f'u{index}@example.com').status_code, 401)
+
+    self.assertEqual(self.login(email='u9@example.com').status_code, 429)
+    self.assertEqual(self.login(email='u9@example.com', REMOTE_ADDR='10.0.0.2').status_code, 401)
+    self.assertEqual(self.throttle.stats['rejected_ip'], 1)
+
+  def test_previous_window_counts_proportionally(self):
+    request = APIRequestFactory().post('/')
+    with mock.patch('users.throttling.time.time', return_value=6000.0):
+      for _ in range(3):
+        self.throttle.check(request, 'user@example.com')
+
+    # Na metade da janela seguinte as 3 tentativas anteriores valem 1,5.
+    with mock.patch('users.throttling.time.time', return_value=6090.0):
+      self.throttle.check(request, 'user@example.com')
+      with self.assertRaises(Throttled) as raised:
+        self.throttle.check(request, 'user@example.com')
+
+    self.assertEqual(raised.exception.wait, 30)
+
+  def test_rejects_when_hash_slots_are_taken(self):
+    with self.throttle.hash_slot():
+      response = self.login()
+
+    self.assertEqual(response.status_code, 503)
+    self.assertEqual(response['Retry-After'], '1')
+    self.assertEqual(self.throttle.stats['rejected_busy'], 1)
+    self.assertEqual(self.login(password='S3nha-forte!').status_code, 200)
+    self.assertEqual(self.throttle.stats['in_flight'], 0)
+
+  async def test_async_view_shares_the_limits(self):
+    factory = AsyncRequestFactory()
+    for expected in (401, 401, 401, 429):
+      request = factory.post('/', {'email': 'user@example.com', 'password': 'errada'}, content_type='application/json')
+      response = await AsyncTokenObtainPairView.as_view()(request)
+      self.assertEqual(response.status_code, expected)
+
+    self.assertEqual(json.loads(response.content)['code'], 'throttled')
+    self.assertIn('Retry-After', response)
+
+  def test_check_warns_about_a_process_local_cache_in_production(self):
+    with override_settings(DEVELOPMENT_MODE=False):
+      self.assertEqual(
+        [warning.id for warning in check_shared_caches(None)], ['users.W001', 'users.W001']
+      )
+    with override_settings(DEVELOPMENT_MODE=False, AUTH_USER_CACHE_BACKEND='django'):
+      self.assertEqual(len(check_shared_caches(None)), 3)
+
+    shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()}
+    with override_settings(DEVELOPMENT_MODE=False, CACHES={'default': shared}):
+      self.assertEqual(check_shared_caches(None), [])
+    with override_settings(DEVELOPMENT_MODE=True):
+      self.assertEqual(check_shared_caches(None), [])
+
+  def test_forwarded_for_does_not_reset_the_ip_limit(self):
+    statuses = [
+      self.login(email=f'x{n}@example.com', HTTP_X_FORWARDED_FOR=f'198.51.100.{n}').status_code for n in range(7)
+    ]
+
+    self.assertEqual(statuses, [401] * 5 + [429] * 2)
+
+  @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+  def test_behind_a_proxy_only_its_entry_counts(self):
+    statuses = [
+      self.login(email=f'x{n}@example.com', HTTP_X_FORWARDED_FOR=f'198.51.100.{n}, 203.0.113.7').status_code
+      for n in range(6)
+    ]
+
+    self.assertEqual(statuses, [401] * 5 + [429])
+
+  def test_non_object_json_body_is_a_bad_request(self):
+    response = self.client.post('/api/jwt/create/', ['user@example.com'], format='json')
+
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(self.throttle.stats['admitted'], 1)
+
+  # (corpo, status esperado) iguais nas duas views de login.
+  CREDENTIAL_TYPES = (
+    ({'email': 'numero@example.com', 'password': 12345}, 401),
+    ({'email': 'dict@example.com', 'password': {'a': 1}}, 400),
+    ({'email': ['lista@example.com'], 'password': 'errada'}, 400),
+  )
+
+  def test_sync_view_coerces_or_rejects_non_string_credentials(self):
+    for data, status_code in self.CREDENTIAL_TYPES:
+      self.assertEqual(self.client.post('/api/jwt/create/', data, format='json').status_code, status_code)
+
+  async def test_async_view_coerces_or_rejects_non_string_credentials(self):
+    for data, status_code in self.CREDENTIAL_TYPES:
+      request = AsyncRequestFactory().post('/', data, content_type='application/json')
+      response = await AsyncTokenObtainPairView.as_view()(request)
+      self.assertEqual(response.status_code, status_code)
+
+  async def test_async_view_rejects_a_non_object_json_body(self):
+    request = AsyncRequestFactory().post('/', ['user@example.com'], content_type='application/json')
+    response = await AsyncTokenObtainPairView.as_view()(request)
+
+    self.assertEqual(response.status_code, 400)
+
+
+
+class TokenRevocationTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    user_cache.clear()
+    revocation_store.clear()
+    self.user = create_user()
+    self.client = APIClient()
+
+  def login(self):
+    response = self.client.post('/api/jwt/create/', {'email': self.user.email, 'password': 'S3nha-forte!'})
+    return response.json()
+
+  def refresh(self, token):
+    return self.client.post('/api/jwt/refresh/', {'refresh': token}, format='json')
+
+  def test_refresh_rotates_and_revokes_the_used_token(self):
+    first = self.login()['refresh']
+    self.client.cookies.clear()
+
+    response = self.refresh(first)
+    second = response.json()['refresh']
+
+    self.assertEqual(response.status_code, 200)
+    self.assertNotEqual(second, first)
+    self.assertEqual(response.cookies['refresh'].value, second)
+    self.client.cookies.clear()
+    self.assertEqual(self.refresh(first).status_code, 401)
+    self.assertEqual(self.refresh(second).status_code, 200)
+
+  def test_concurrent_refresh_of_the_same_token_rotates_only_once(self):
+    refresh = self.login()['refresh']
+    self.client.cookies.clear()
+
+    # O outro worker ainda não sincronizou: a checagem local diz que o token
+    # vale, e só o INSERT no primário separa os dois refreshes.
+    with mock.patch.object(revocation_store, 'is_token_revoked', return_value=False):
+      first = self.refresh(refresh)
+      self.client.cookies.clear()
+      again = self.refresh(refresh)
+
+    self.assertEqual(first.status_code, 200)
+    self.assertEqual(again.status_code, 401)
+    self.assertEqual(RevokedToken.objects.count(), 1)
+
+  def test_logout_revokes_access_and_refresh_tokens(self):
+    tokens = self.login()
+    self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+
+    self.assertEqual(self.client.post(reverse('logout')).status_code, 204)
+
+    self.assertEqual(self.client.get(reverse('profile-list')).status_code, 401)
+    self.client.credentials()
+    self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+    self.assertEqual(self.client.post('/api/jwt/verify/', {'token': tokens['access']}).status_code, 401)
+
+  def test_logout_with_only_a_refresh_token(self):
+    tokens = self.login()
+    self.client.cookies.clear()
+    self.client.credentials(HTTP_AUTHORIZATION='Bearer expirado')
+
+    response = self.client.post(reverse('logout'), {'refresh': tokens['refresh']}, format='json')
+
+    self.assertEqual(response.status_code, 204)
+    self.assertEqual((response.cookies['access'].value, response.cookies['refresh'].value), ('', ''))
+    self.client.credentials()
+    self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+  def test_logout_ignores_a_body_that_is_not_a_json_object(self):
+    tokens = self.login()
+    self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+
+    response = self.client.post(reverse('logout'), [tokens['refresh']], format='json')
+
+    self.assertEqual(response.status_code, 204)
+    self.client.credentials()
+    self.assertEqual(self.client.post('/api/jwt/verify/', {'token': tokens['access']}).status_code, 401)
+
+  def test_not_revoked_check_skips_the_database(self):
+    token = RefreshToken.for_user(self.user)
+    revocation_store.revoke_tokens(RefreshToken.for_user(self.user))
+    revocation_store.sync()
+
+    with self.assertNumQueries(0):
+      self.assertFalse(revocation_store.is_token_revoked(token))
+
+  def test_picks_up_other_processes_on_sync(self):
+    store = RevocationStore(sync_interval=0)
+    token = RefreshToken.for_user(self.user)
+    self.assertFalse(store.is_token_revoked(token))
+
+    RevocationStore().revoke_tokens(token)
+
+    self.assertTrue(store.is_token_revoked(token))
+    self.assertEqual(store.stats['tokens'], 1)
+
+  def test_expired_buckets_are_dropped(self):
+    store = RevocationStore(bucket_seconds=60, sync_interval=0)
+    now = time.time()
+    store.revoke('antigo', now + 30)
+    store.revoke('novo', now + 600)
+
+    with mock.patch('users.revocation.time.time', return_value=now + 120):
+      store.sync()
+
+    self.assertEqual(store.stats['tokens'], 1)
+    self.assertFalse(store._maybe_revoked('antigo', now + 30))
+
+  async def test_async_refresh_rejects_a_reused_token(self):
+    refresh = str(RefreshToken.for_user(self.user))
+    view = AsyncTokenRefreshView.as_view()
+    factory = AsyncRequestFactory()
+
+    first = await view(factory.post('/', {'refresh': refresh}, content_type='application/json'))
+    again = await view(factory.post('/', {'refresh': refresh}, content_type='application/json'))
+
+    self.assertEqual(first.status_code, 200)
+    self.assertIn('refresh', json.loads(first.content))
+    self.assertEqual(again.status_code, 401)
+    self.assertEqual(await RevokedToken.objects.acount(), 1)
+
+  async def test_async_refresh_claims_the_token_on_the_primary(self):
+    refresh = str(RefreshToken.for_user(self.user))
+    view = AsyncTokenRefreshView.as_view()
+    factory = AsyncRequestFactory()
+
+    with mock.patch.object(revocation_store, 'ais_token_revoked', return_value=False):
+      first = await view(factory.post('/', {'refresh': refresh}, content_type='application/json'))
+      again = await view(factory.post('/', {'refresh': refresh}, content_type='application/json'))
+
+    self.assertEqual(first.status_code, 200)
+    self.assertEqual(again.status_code, 401)
+
+
+class BloomFilterTests(SimpleTestCase):
+  def test_vectorized_and_single_inserts_set_the_same_bits(self):
+    jtis = [f'jti-{n}' for n in range(500)]
+    vectorized, single = BloomFilter(1000), BloomFilter(1000)
+
+    vectorized.add_many(jtis)
+    for jti in jtis:
+      single.add(jti)
+
+    self.assertEqual(vectorized.bits, single.bits)
+    self.assertTrue(all(jti in vectorized for jti in jtis))
+
+  def test_false_positive_rate_stays_near_the_target(self):
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    bloom.add_many([f'revogado-{n}' for n in range(10_000)])
+
+    false_positives = sum(f'valido-{n}' in bloom for n in range(20_000))
+
+    self.assertLess(false_positives / 20_000, 0.02)
+
+
+
+class AuthBenchmarkTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    user_cache.clear()
+    revocation_store.clear()
+
+  def test_runs_scenarios_and_saves_results(self):
+    output = tempfile.mktemp(suffix='.json')
+    self.addCleanup(os.remove, output)
+
+    call_command(
+      'bench_auth_api', users=3, concurrency=1, requests=30, output=output,
+      mix='jwt-refresh:1,jwt-verify:1,profile-list:1,profile-update-notifications:1', stdout=StringIO()
+    )
+
+    with open(output, encoding='utf-8') as source:
+      result = json.load(source)
+    endpoints = result['endpoints']
+    self.assertEqual(sum(endpoint['requests'] for endpoint in endpoints.values()), 30)
+    for name, endpoint in endpoints.items():
+      self.assertEqual(endpoint['ok'], endpoint['requests'], name)
+      self.assertLessEqual(endpoint['p50_ms'], endpoint['p99_ms'])
+    self.assertEqual(endpoints['jwt-verify']['queries_p50'], 0)
+    self.assertEqual(result['meta']['target'], 'test-client')
+    self.assertEqual(UserAccount.objects.filter(email__endswith='@bench.example.com').count(), 3)
+
+  def test_compare_flags_regressions(self):
+    def result(p95, rps, queries, errors=0):
+      return {'endpoints': {'profile-list': {
+        'requests': 100, 'errors': errors, 'p95_ms': p95, 'rps': rps, 'queries_p50': queries,
+      }}}
+
+    baseline = result(10.0, 100.0, 1)
+
+    self.assertEqual(compare(result(11.0, 90.0, 1), baseline), [])
+    self.assertEqual(len(compare(result(13.0, 70.0, 2, errors=5), baseline)), 4)
+
+  def test_compare_prints_both_runs_side_by_side(self):
+    baseline = tempfile.mktemp(suffix='.json')
+    self.addCleanup(os.remove, baseline)
+    options = {'users': 2, 'concurrency': 1, 'requests': 10, 'mix': 'jwt-verify:1', 'threshold': 100}
+    call_command('bench_auth_api', label='gunicorn', output=baseline, stdout=StringIO(), **options)
+
+    stdout = StringIO()
+    call_command('bench_auth_api', label='uvicorn', compare=baseline, stdout=stdout, **options)
+
+    lines = stdout.getvalue().splitlines()
+    header = next(line for line in lines if 'gunicorn' in line)
+    self.assertLess(header.index('gunicorn'), header.index('uvicorn'))
+    row = next(line for line in lines if line.startswith('jwt-verify') and line.count('ms') == 4)
+    self.assertEqual(len(row.split()), 7)
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=0, REQUEST_TIMING_SLOW_MS=10_000)
+class ServerTimingTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    user_cache.clear()
+    self.user = create_user()
+    self.client = APIClient()
+    self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+  def metrics(self, response):
+    return dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+
+  def test_header_breaks_down_the_request(self):
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(reverse('profile-list'))
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(set(self.metrics(response)), {'db', 'auth', 'serialize', 'total'})
+    self.assertIn(f'desc="{len(queries)} queries"', response['Server-Timing'])
+    self.assertGreater(float(self.metrics(response)['auth']), 0)
+
+  def test_slow_requests_are_logged(self):
+    with override_settings(REQUEST_TIMING_SLOW_MS=0), self.assertLogs('instrumentation', 'WARNING') as logs:
+      self.client.get(reverse('profile-list'))
+
+    record = json.loads(logs.records[0].getMessage())
+    self.assertEqual((record['view'], record['status'], record['slow']), ('profile-list', 200, True))
+    self.assertIn('serialize_ms', record)
+
+  def test_fast_requests_are_sampled(self):
+    with self.assertNoLogs('instrumentation'):
+      self.client.get(reverse('profile-list'))
+
+    with override_settings(REQUEST_TIMING_SAMPLE_RATE=1), self.assertLogs('instrumentation', 'INFO') as logs:
+      self.client.get(reverse('profile-list'))
+    self.assertEqual(logs.records[0].levelname, 'INFO')
+
+  @override_settings(REQUEST_TIMING_HEADER=False)
+  def test_header_can_be_disabled(self):
+    self.assertNotIn('Server-Timing', self.client.get(reverse('profile-list')))
+
+  async def test_counts_queries_of_async_views(self):
+    async def view(request):
+      await sync_to_async(UserAccount.objects.count)()
+      await UserAccount.objects.acount()
+      return HttpResponse()
+
+    response = await ServerTimingMiddleware(view)(AsyncRequestFactory().get('/'))
+
+    self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+
+@override_settings(METRICS_TOKEN=None, METRICS_MULTIPROC_DIR=None)
+class MetricsTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    login_throttle.reset()
+    self.user = create_user()
+    self.client = APIClient()
+
+  def metric(self, name, **labels):
+    text = self.client.get('/metrics').content.decode()
+    selector = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf'^{name}{{{selector}}} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+  def test_counts_requests_and_login_results(self):
+    logins = self.metric('auth_events_total', event='login', result='success')
+    failures = self.metric('auth_events_total', event='login', result='failure')
+    requests = self.metric('http_requests_total', view='jwt-create', method='POST', status='401')
+
+    self.client.post(reverse('jwt-create'), {'email': 'user@example.com', 'password': 'S3nha-forte!'})
+    self.client.post(reverse('jwt-create'), {'email': 'user@example.com', 'password': 'errada'})
+
+    self.assertEqual(self.metric('auth_events_total', event='login', result='success'), logins + 1)
+    self.assertEqual(self.metric('auth_events_total', event='login', result='failure'), failures + 1)
+    self.assertEqual(
+      self.metric('http_requests_total', view='jwt-create', method='POST', status='401'), requests + 1
+    )
+    self.assertGreater(self.metric('http_request_duration_seconds_count', view='jwt-create', method='POST'), 0)
+
+  def test_threads_are_merged_at_collection(self):
+    registry = Registry()
+    counter = registry.counter('hits_total', 'teste', ('kind',))
+    histogram = registry.histogram('size_bytes', 'teste', buckets=(10, 100))
+
+    def work():
+      for value in range(100):
+        counter.inc(kind='a')
+        histogram.observe(value)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    text = registry.exposition()
+    self.assertIn('hits_total{kind="a"} 400.0', text)
+    self.assertIn('size_bytes_bucket{le="10.0"} 44.0', text)
+    self.assertIn('size_bytes_bucket{le="+Inf"} 400.0', text)
+    self.assertIn('size_bytes_count 400.0', text)
+
+  def test_sums_the_files_of_every_process(self):
+    directory = tempfile.mkdtemp()
+    registry = Registry()
+    counter = registry.counter('hits_total', 'teste', ('kind',))
+    counter.inc(3, kind='a')
+    with open(os.path.join(directory, '999999.json'), 'w', encoding='utf-8') as target:
+      json.dump([['hits_total', ['a'], 2], ['hits_total', ['b'], 1]], target)
+
+    with override_settings(METRICS_MULTIPROC_DIR=directory):
+      text = registry.exposition()
+
+    self.assertIn('hits_total{kind="a"} 5.0', text)
+    self.assertIn('hits_total{kind="b"} 1.0', text)
+    self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+
+  @override_settings(METRICS_TOKEN='segredo')
+  def test_token_protects_the_endpoint(self):
+    self.assertEqual(self.client.get('/metrics').status_code, 401)
+    response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo')
+    self.assertEqual(response.status_code, 200)
+    self.assertIn('# TYPE db_connections_opened_total counter', response.content.decode())
+
+  @override_settings(METRICS_TOKEN=None, DEVELOPMENT_MODE=False)
+  def test_endpoint_is_off_without_a_token_outside_development(self):
+    self.assertEqual(self.client.get('/metrics').status_code, 404)
+    self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+@skipUnless('replica' in settings.DATABASES, 'rode com --settings=full_auth.test_settings')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+  databases = {'default', 'replica'} & set(settings.DATABASES)
+
+  def setUp(self):
+    cache.clear()
+    user_cache.clear()
+    revocation_store.clear()
+    self.user = create_user()
+    # A réplica recebe uma cópia com outro risk_profile, para saber quem respondeu.
+    UserAccount.objects.using('replica').bulk_create([self.user])
+    profile = UserProfile.objects.get(user=self.user)
+    profile.risk_profile = 'aggressive'
+    UserProfile.objects.using('replica').bulk_create([profile])
+
+    self.refresh = RefreshToken.for_user(self.user)
+    self.client = APIClient()
+    self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+  def risk_profile(self):
+    return self.client.get(reverse('profile-investment-info')).json()['risk_profile']
+
+  def test_profile_reads_go_to_the_replica(self):
+    self.assertEqual(self.risk_profile(), 'aggressive')
+    with self.settings(DATABASE_REPLICAS=[]):
+      self.assertEqual(self.risk_profile(), 'moderate')
+
+  def test_user_is_pinned_to_the_primary_after_a_write(self):
+    self.client.patch(reverse('profile-update-notifications'), {'email_notifications': False}, format='json')
+    self.assertEqual(self.risk_profile(), 'moderate')
+
+    with mock.patch('django.core.cache.backends.locmem.LocMemCache.get', return_value=None):
+      self.assertEqual(self.risk_profile(), 'aggressive')
+
+  def test_writes_go_to_the_primary(self):
+    with replica_reads():
+      profile = UserProfile.objects.get(user=self.user)
+      profile.profession = 'Analista'
+      profile.save()
+
+    self.assertEqual(profile._state.db, 'default')
+    self.assertEqual(UserProfile.objects.get(user=self.user).profession, 'Analista')
+    self.assertIsNone(UserProfile.objects.using('replica').get(user=self.user).profession)
+
+  def test_revocations_are_read_from_the_primary(self):
+    # Revogado por outro worker e ainda não replicado.
+    RevokedToken.objects.create(jti=self.refresh['jti'], exp=self.refresh['exp'])
+    revocation_store._next_sync = 0
+
+    with CaptureQueriesContext(connections['replica']) as replica_queries:
+      response = self.client.post(reverse('jwt-verify'), {'token': str(self.refresh)}, format='json')
+      with replica_reads():
+        revoked = revocation_store.is_token_revoked(self.refresh)
+
+    self.assertEqual(response.status_code, 401)
+    self.assertTrue(revoked)
+    self.assertEqual(len(replica_queries), 0)
+
+
+def endpoint_names(patterns):
+  for pattern in patterns:
+    if hasattr(pattern, 'url_patterns'):
+      yield from endpoint_names(pattern.url_patterns)
+    else:
+      yield pattern.name
+
+
+def png_upload(name='avatar.png'):
+  buffer = BytesIO()
+  Image.new('RGB', (8, 8), 'red').save(buffer, format='PNG')
+  return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), AVATAR_PROCESSING_WORKERS=0)
+class AvatarPipelineTests(TestCase):
+  def setUp(self):
+    user_cache.clear()
+    self.user = create_user()
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+
+  def jpeg_with_exif(self):
+    buffer = BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    Image.new('RGB', (640, 480), 'blue').save(buffer, format='JPEG', exif=exif)
+    return SimpleUploadedFile('foto.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+  def upload(self):
+    return self.client.post(reverse('profile-update-avatar'), {'avatar': self.jpeg_with_exif()}, format='multipart')
+
+  def test_upload_produces_renditions_without_metadata(self):
+    response = self.upload()
+
+    self.assertEqual(response.status_code, 202)
+    self.assertEqual(response.data['avatar_status'], 'pending')
+    profile = UserProfile.objects.get(user=self.user)
+    self.assertEqual(profile.avatar_status, UserProfile.AVATAR_READY)
+    base = f'avatars/{self.user.pk}/{response.data["avatar_upload_id"]}'
+    self.assertEqual(profile.avatar.name, f'{base}/256.jpg')
+
+    for size in settings.AVATAR_RENDITION_SIZES:
+      for ext in ('jpg', 'webp'):
+        with default_storage.open(f'{base}/{size}.{ext}') as rendition, Image.open(rendition) as image:
+          self.assertEqual(image.size, (size, size))
+          self.assertEqual(len(image.getexif()), 0)
+
+    renditions = self.client.get(reverse('profile-list')).data['avatar_renditions']
+    self.assertTrue(renditions['64']['webp'].endswith(f'{base}/64.webp'))
+
+  def test_new_upload_deletes_previous_renditions(self):
+    first = self.upload().data['avatar_upload_id']
+    self.upload()
+
+    self.assertFalse(default_storage.exists(f'avatars/{self.user.pk}/{first}/256.jpg'))
+    self.assertFalse(default_storage.exists(f'avatars/{self.user.pk}/{first}/64.webp'))
+
+  def test_superseded_upload_is_discarded(self):
+    profile = UserProfile.objects.get(user=self.user)
+    UserProfile.objects.filter(pk=profile.pk).update(avatar_upload_id='outro')
+
+    process_avatar(profile.pk, 'antigo', f'avatars/{self.user.pk}/antigo', self.jpeg_with_exif().read())
+
+    profile.refresh_from_db()
+    self.assertFalse(profile.avatar)
+    self.assertFalse(default_storage.exists(f'avatars/{self.user.pk}/antigo/256.jpg'))
+
+  def test_storage_failure_marks_the_upload_failed(self):
+    with mock.patch.object(default_storage, 'save', side_effect=OSError('disco cheio')):
+      response = self.upload()
+
+    self.assertEqual(response.status_code, 202)
+    profile = UserProfile.objects.get(user=self.user)
+    self.assertEqual(profile.avatar_status, UserProfile.AVATAR_FAILED)
+    self.assertFalse(profile.avatar)
+
+  def test_full_pipeline_refuses_the_upload_and_keeps_the_profile(self):
+    before = UserProfile.objects.values('avatar_status', 'avatar_upload_id').get(user=self.user)
+
+    with override_settings(AVATAR_PROCESSING_WORKERS=1, AVATAR_PROCESSING_BACKLOG=0):
+      response = self.upload()
+
+    self.assertEqual(response.status_code, 503)
+    self.assertEqual(UserProfile.objects.values('avatar_status', 'avatar_upload_id').get(user=self.user), before)
+
+  @override_settings(AVATAR_PROCESSING_WORKERS=1, AVATAR_PROCESSING_BACKLOG=2)
+  def test_pipeline_backlog_is_bounded(self):
+    pipeline = AvatarPipeline()
+    release = threading.Event()
+    pipeline.submit(release.wait, 5)
+    pipeline.submit(release.wait, 5)
+
+    with self.assertRaises(AvatarPipelineFull):
+      pipeline.submit(release.wait, 5)
+
+    release.set()
+    pipeline.shutdown()
+    self.assertEqual(pipeline.backlog, 0)
+
+  def sweep(self, upload_id):
+    profile = self.user.profile
+    UserProfile.objects.filter(pk=profile.pk).update(avatar_status=UserProfile.AVATAR_PENDING, avatar_upload_id=upload_id)
+    stdout = StringIO()
+    with mock.patch('users.avatars.timezone.now', return_value=timezone.now() + timedelta(hours=1)):
+      call_command('sweep_pending_avatars', stdout=stdout)
+    profile.refresh_from_db()
+    return profile, stdout.getvalue()
+
+  def test_sweep_fails_a_lost_upload(self):
+    profile, output = self.sweep('sumiu')
+
+    self.assertIn('reprocessados: 0, falhos: 1', output)
+    self.assertEqual(profile.avatar_status, UserProfile.AVATAR_FAILED)
+
+  def test_sweep_requeues_a_direct_upload(self):
+    default_storage.save(f'avatars/{self.user.pk}/abc/original', png_upload())
+
+    profile, output = self.sweep('abc')
+
+    self.assertIn('reprocessados: 1, falhos: 0', output)
+    self.assertEqual(profile.avatar_status, UserProfile.AVATAR_READY)
+    self.assertEqual(profile.avatar.name, f'avatars/{self.user.pk}/abc/256.jpg')
+
+  def test_sweep_keeps_recent_uploads_pending(self):
+    UserProfile.objects.filter(user=self.user).update(avatar_status=UserProfile.AVATAR_PENDING)
+
+    call_command('sweep_pending_avatars', stdout=StringIO())
+
+    self.assertEqual(UserProfile.objects.get(user=self.user).avatar_status, UserProfile.AVATAR_PENDING)
+
+
+def local_s3_storage():
+  # Endpoint de um S3 local (MinIO/localstack); a assinatura do POST é offline.
+  return CustomS3Boto3Storage(
+    bucket_name='avatars',
+    endpoint_url='http://localhost:9000',
+    access_key='test',
+    secret_key='test',
+    region_name='us-east-1',
+    default_acl=None
+  )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), AVATAR_PROCESSING_WORKERS=0)
+class DirectAvatarUploadTests(TestCase):
+  def setUp(self):
+    user_cache.clear()
+    self.user = create_user()
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+
+  def upload_token(self, upload_id, profile_id=None):
+    profile_id = profile_id or self.user.profile.pk
+    return signing.dumps({'profile': profile_id, 'upload': upload_id}, salt='avatar-upload')
+
+  def test_presigned_post_limits_size_and_content_type(self):
+    with mock.patch('users.avatars.default_storage', local_s3_storage()):
+      response = self.client.post(reverse('profile-avatar-upload-url'), {'content_type': 'image/png'}, format='json')
+
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response.data['url'].startswith('http://localhost:9000/avatars'))
+    self.assertTrue(response.data['fields']['key'].startswith(f'media/avatars/{self.user.pk}/'))
+    policy = json.loads(base64.b64decode(response.data['fields']['policy']))
+    self.assertIn(['content-length-range', 1, settings.AVATAR_MAX_UPLOAD_SIZE], policy['conditions'])
+    self.assertIn({'Content-Type': 'image/png'}, policy['conditions'])
+
+  def test_rejects_unsupported_content_type(self):
+    with mock.patch('users.avatars.default_storage', local_s3_storage()):
+      response = self.client.post(reverse('profile-avatar-upload-url'), {'content_type': 'image/gif'}, format='json')
+
+    self.assertEqual(response.status_code, 400)
+
+  def test_filesystem_storage_has_no_direct_upload(self):
+    response = self.client.post(reverse('profile-avatar-upload-url'), {'content_type': 'image/png'}, format='json')
+
+    self.assertEqual(response.status_code, 501)
+
+  def test_confirm_attaches_uploaded_file(self):
+    name = f'avatars/{self.user.pk}/abc/original'
+    default_storage.save(name, png_upload())
+
+    response = self.client.post(
+      reverse('profile-confirm-avatar-upload'), {'upload_token': self.upload_token('abc')}, format='json'
+    )
+
+    self.assertEqual(response.status_code, 202)
+    profile = UserProfile.objects.get(user=self.user)
+    self.assertEqual(profile.avatar_status, UserProfile.AVATAR_READY)
+    self.assertEqual(profile.avatar.name, f'avatars/{self.user.pk}/abc/256.jpg')
+    self.assertFalse(default_storage.exists(name))
+
+  def test_previous_avatar_stays_until_renditions_are_ready(self):
+    self.client.post(reverse('profile-update-avatar'), {'avatar': png_upload()}, format='multipart')
+    previous = UserProfile.objects.get(user=self.user).avatar.name
+    default_storage.save(f'avatars/{self.user.pk}/abc/original', png_upload())
+    seen = []
+
+    def process(profile_id, *args):
+      seen.append(UserProfile.objects.get(pk=profile_id).avatar.name)
+
+    with mock.patch.object(avatars.pipeline, 'submit', side_effect=lambda func, *args: process(*args)):
+      response = self.client.post(
+        reverse('profile-confirm-avatar-upload'), {'upload_token': self.upload_token('abc')}, format='json'
+      )
+
+    self.assertEqual(response.status_code, 202)
+    self.assertEqual(seen, [previous])
+    profile = UserProfile.objects.get(user=self.user)
+    self.assertEqual((profile.avatar.name, profile.avatar_status), (previous, UserProfile.AVATAR_PENDING))
+    self.assertEqual(profile.avatar_upload_id, 'abc')
+
+  def test_confirm_rejects_missing_or_foreign_upload(self):
+    missing = self.client.post(
+      reverse('profile-confirm-avatar-upload'), {'upload_token': self.upload_token('nada')}, format='json'
+    )
+    foreign = self.client.post(
+      reverse('profile-confirm-avatar-upload'), {'upload_token': self.upload_token('abc', profile_id=999)}, format='json'
+    )
+
+    self.assertEqual(missing.status_code, 400)
+    self.assertEqual(foreign.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), AVATAR_PROCESSING_WORKERS=0)
+class QueryBudgetTests(TestCase):
+  # Número máximo de consultas por endpoint de users.urls. Todo endpoint novo
+  # precisa declarar o seu orçamento aqui.
+  QUERY_BUDGETS = {
+    'provider-auth': 4,
+    'jwt-create': 2,
+    # O claim do jti roda em transaction.atomic: SAVEPOINT e RELEASE contam aqui.
+    'jwt-refresh': 4,
+    'jwt-verify': 0,
+    'jwt-verify-batch': 0,
+    'jwks': 0,
+    'logout': 1,
+    'api-root': 0,
+    'profile-list': 1,
+    'profile-detail': 1,
+    'profile-investment-info': 1,
+    'profile-update-avatar': 3,
+    'profile-update-notifications': 2,
+    'profile-avatar-upload-url': 1,
+    'profile-confirm-avatar-upload': 3,
+    'account-list': 1,
+  }
+
+  def setUp(self):
+    cache.clear()
+    user_cache.clear()
+    revocation_store.clear()
+    # A sincronização do RevocationStore roda só no aquecimento abaixo.
+    patcher = mock.patch.object(revocation_store, 'sync_interval', 3600)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.user = create_user(is_staff=True)
+    self.refresh = RefreshToken.for_user(self.user)
+    self.client = APIClient()
+    self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+    # Aquece o cache de usuários autenticados, como em produção.
+    self.client.get(reverse('profile-list'))
+
+  def requests(self):
+    profile_id = self.user.profile.pk
+    return {
+      'provider-auth': lambda: self.client.get(
+        reverse('provider-auth', kwargs={'provider': 'google-oauth2'}),
+        {'redirect_uri': 'http://localhost:3000'}
+      ),
+      'jwt-create': lambda: self.client.post(
+        reverse('jwt-create'), {'email': self.user.email, 'password': 'S3nha-forte!'}, format='json'
+      ),
+      'jwt-refresh': lambda: self.client.post(
+        reverse('jwt-refresh'), {'refresh': str(self.refresh)}, format='json'
+      ),
+      'jwt-verify': lambda: self.client.post(
+        reverse('jwt-verify'), {'token': str(self.refresh.access_token)}, format='json'
+      ),
+      'jwt-verify-batch': lambda: self.client.post(
+        reverse('jwt-verify-batch'), {'tokens': [str(self.refresh.access_token), str(self.refresh)]}, format='json'
+      ),
+      'jwks': lambda: self.client.get(reverse('jwks')),
+      'api-root': lambda: self.client.get(reverse('api-root')),
+      'profile-list': lambda: self.client.get(reverse('profile-list')),
+      'profile-detail': lambda: self.client.get(reverse('profile-detail', kwargs={'pk': profile_id})),
+      'profile-investment-info': lambda: self.client.get(reverse('profile-investment-info')),
+      'profile-update-avatar': lambda: self.client.patch(
+        reverse('profile-update-avatar'), {'avatar': png_upload()}, format='multipart'
+      ),
+      'profile-avatar-upload-url': self.request_upload_url,
+      'profile-confirm-avatar-upload': self.confirm_upload,
+      'profile-update-notifications': lambda: self.client.patch(
+        reverse('profile-update-notifications'), {'email_notifications': False}, format='json'
+      ),
+      'account-list': lambda: self.client.get(reverse('account-list')),
+      # Por último: o logout revoga o access token usado pelos outros.
+      'logout': lambda: self.client.post(reverse('logout')),
+    }
+
+  def request_upload_url(self):
+    with mock.patch('users.avatars.default_storage', local_s3_storage()):
+      return self.client.post(reverse('profile-avatar-upload-url'), {'content_type': 'image/png'}, format='json')
+
+  def confirm_upload(self):
+    default_storage.save(f'avatars/{self.user.pk}/budget/original', png_upload())
+    token = signing.dumps({'profile': self.user.profile.pk, 'upload': 'budget'}, salt='avatar-upload')
+    return self.client.post(reverse('profile-confirm-avatar-upload'), {'upload_token': token}, format='json')
+
+  def test_every_endpoint_declares_a_budget(self):
+    names = set(endpoint_names(urls.urlpatterns))
+
+    self.assertEqual(names - set(self.QUERY_BUDGETS), set())
+    self.assertEqual(names - set(self.requests()), set())
+
+  def test_endpoints_stay_within_budget(self):
+    for name, send in self.requests().items():
+      with self.subTest(endpoint=name):
+        with CaptureQueriesContext(connection) as ctx:
+          response = send()
+
+        self.assertLess(response.status_code, 400, response.content)
+        self.assertLessEqual(
+          len(ctx.captured_queries),
+          self.QUERY_BUDGETS[name],
+          '\n'.join(query['sql'] for query in ctx.captured_queries)
+        )
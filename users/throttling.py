@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.throttling import BaseThrottle
+
+
+class LoginBusy(APIException):
+  status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+  default_detail = 'Muitos logins em andamento, tente novamente em instantes.'
+  default_code = 'login_busy'
+
+  def __init__(self, wait=1):
+    super().__init__()
+    self.wait = wait
+
+
+class LoginThrottle:
+  """
+  Protege o hash de senha do login em duas camadas, ambas antes do
+  `authenticate`:
+
+  - janela deslizante de tentativas por IP e por e-mail normalizado, guardada
+    no cache `alias` para valer entre processos. O alias precisa ser um cache
+    compartilhado (Redis, Memcached): com o LocMemCache cada worker conta só as
+    tentativas que recebeu e o limite efetivo se multiplica pelo número de
+    workers (users.checks avisa). A janela é aproximada por dois
+    contadores fixos: o atual inteiro mais o anterior proporcional ao tempo que
+    ainda cobre;
+  - limite de hashes simultâneos no processo; quem não consegue vaga em
+    `hash_wait` segundos recebe 503 em vez de esperar numa fila sem fim.
+
+  Toda tentativa conta, inclusive as recusadas, para que uma rajada continue
+  bloqueada enquanto não parar.
+  """
+
+  def __init__(self, window=60, ip_limit=30, email_limit=10, max_concurrent=4, hash_wait=0.5, alias='default'):
+    self.window = window
+    self.limits = {'ip': ip_limit, 'email': email_limit}
+    self.max_concurrent = max_concurrent
+    self.hash_wait = hash_wait
+    self.alias = alias
+    self.in_flight = 0
+    self.counters = dict.fromkeys(('admitted', 'rejected_ip', 'rejected_email', 'rejected_busy'), 0)
+    self._slots = threading.BoundedSemaphore(max_concurrent)
+    self._lock = threading.Lock()
+
+  @property
+  def cache(self):
+    return caches[self.alias]
+
+  def identities(self, request, email):
+    ip = BaseThrottle().get_ident(request)
+    normalized = str(email or '').strip().lower()
+    return {
+      'ip': ip,
+      'email': hashlib.sha256(normalized.encode()).hexdigest() if normalized else None,
+    }
+
+  def check(self, request, email):
+    """Registra a tentativa e levanta Throttled se IP ou e-mail passaram do limite."""
+    now = time.time()
+    keys = self._keys(self.identities(request, email), now)
+    previous = self.cache.get_many([previous for _, previous in keys.values()])
+    counts = {}
+    for scope, (current, _) in keys.items():
+      self.cache.add(current, 0, self.window * 2)
+      counts[scope] = self.cache.incr(current)
+    self._decide(keys, counts, previous, now)
+
+  async def acheck(self, request, email):
+    now = time.time()
+    keys = self._keys(self.identities(request, email), now)
+    previous = await self.cache.aget_many([previous for _, previous in keys.values()])
+    counts = {}
+    for scope, (current, _) in keys.items():
+      await self.cache.aadd(current, 0, self.window * 2)
+      counts[scope] = await self.cache.aincr(current)
+    self._decide(keys, counts, previous, now)
+
+  @contextmanager
+  def hash_slot(self):
+    if not self._slots.acquire(timeout=self.hash_wait):
+      self._count('rejected_busy')
+      raise LoginBusy()
+    try:
+      self._enter()
+      yield
+    finally:
+      self._leave()
+      self._slots.release()
+
+  @asynccontextmanager
+  async def ahash_slot(self):
+    # Esperar no semáforo travaria o event loop; tenta de novo a cada 10 ms.
+    deadline = time.monotonic() + self.hash_wait
+    while not self._slots.acquire(blocking=False):
+      if time.monotonic() >= deadline:
+        self._count('rejected_busy')
+        raise LoginBusy()
+      await asyncio.sleep(0.01)
+    try:
+      self._enter()
+      yield
+    finally:
+      self._leave()
+      self._slots.release()
+
+  def reset(self):
+    with self._lock:
+      self.counters = dict.fromkeys(self.counters, 0)
+
+  @property
+  def stats(self):
+    return {**self.counters, 'in_flight': self.in_flight, 'max_concurrent': self.max_concurrent}
+
+  def _keys(self, identities, now):
+    bucket = int(now // self.window)
+    return {
+      scope: (f'login-throttle:{scope}:{value}:{bucket}', f'login-throttle:{scope}:{value}:{bucket - 1}')
+      for scope, value in identities.items()
+      if value
+    }
+
+  def _decide(self, keys, counts, previous, now):
+    elapsed = (now % self.window) / self.window
+    for scope, (current, previous_key) in keys.items():
+      estimate = counts[scope] + previous.get(previous_key, 0) * (1 - elapsed)
+      if estimate > self.limits[scope]:
+        self._count(f'rejected_{scope}')
+        raise Throttled(wait=max(1, round(self.window * (1 - elapsed))))
+
+  def _enter(self):
+    with self._lock:
+      self.counters['admitted'] += 1
+      self.in_flight += 1
+
+  def _leave(self):
+    with self._lock:
+      self.in_flight -= 1
+
+  def _count(self, name):
+    with self._lock:
+      self.counters[name] += 1
+
+
+login_throttle = LoginThrottle(
+  window=getattr(settings, 'AUTH_LOGIN_THROTTLE_WINDOW', 60),
+  ip_limit=getattr(settings, 'AUTH_LOGIN_THROTTLE_IP_LIMIT', 30),
+  email_limit=getattr(settings, 'AUTH_LOGIN_THROTTLE_EMAIL_LIMIT', 10),
+  max_concurrent=getattr(settings, 'AUTH_LOGIN_MAX_CONCURRENT_HASHES', 4),
+  hash_wait=getattr(settings, 'AUTH_LOGIN_HASH_WAIT', 0.5),
+  alias=getattr(settings, 'AUTH_LOGIN_THROTTLE_CACHE_ALIAS', 'default'),
+)
@@ -0,0 +1,143 @@
+import time
+import jwt
+from jwt.algorithms import get_default_algorithms
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt import state
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.db.models import F
+from .cache import user_cache
+from .models import Subscription, UserAccount
+from .revocation import revocation_store
+
+PLAN_CLAIM = 'plan'
+PLAN_ACTIVE_CLAIM = 'plan_active'
+PLAN_END_CLAIM = 'plan_end'
+PLAN_VERSION_CLAIM = 'plan_version'
+
+CLAIM_FIELDS = ('plan_type', 'is_active', 'end_date', 'user__entitlements_version')
+
+
+def entitlement_claims(user_id):
+  return _claims_from(Subscription.objects.filter(user_id=user_id).values(*CLAIM_FIELDS).first())
+
+
+async def aentitlement_claims(user_id):
+  return _claims_from(await Subscription.objects.filter(user_id=user_id).values(*CLAIM_FIELDS).afirst())
+
+
+def _claims_from(subscription):
+  if subscription is None:
+    return {PLAN_CLAIM: None, PLAN_ACTIVE_CLAIM: False, PLAN_END_CLAIM: None, PLAN_VERSION_CLAIM: None}
+
+  end_date = subscription['end_date']
+  return {
+    PLAN_CLAIM: subscription['plan_type'],
+    PLAN_ACTIVE_CLAIM: subscription['is_active'],
+    PLAN_END_CLAIM: int(end_date.timestamp()) if end_date else None,
+    PLAN_VERSION_CLAIM: subscription['user__entitlements_version'],
+  }
+
+
+def mark_entitlements_changed(user_id):
+  # Tokens emitidos antes da mudança carregam a versão anterior e deixam de
+  # valer para o plano. A versão fica na linha do usuário, que todo worker lê;
+  # o user_cache é invalidado porque o update não passa pelo post_save.
+  UserAccount.objects.filter(pk=user_id).update(entitlements_version=F('entitlements_version') + 1)
+  user_cache.invalidate(user_id)
+
+
+def has_current_entitlements(token, user):
+  """As claims de plano de `token` valem se foram emitidas na versão atual de `user`."""
+  version = token.get(PLAN_VERSION_CLAIM)
+  return version is not None and version == user.entitlements_version
+
+
+def is_pro_from_claims(token):
+  plan_end = token.get(PLAN_END_CLAIM)
+  return (
+    token.get(PLAN_CLAIM) in Subscription.PRO_PLANS
+    and bool(token.get(PLAN_ACTIVE_CLAIM))
+    and (plan_end is None or plan_end > time.time())
+  )
+
+
+class EntitledRefreshToken(RefreshToken):
+  """
+  Refresh token cujos access tokens carregam as claims do plano do usuário,
+  lidas do banco a cada emissão (login ou refresh).
+  """
+
+  @property
+  def access_token(self):
+    access = super().access_token
+    for claim, value in entitlement_claims(self[api_settings.USER_ID_CLAIM]).items():
+      access[claim] = value
+    return access
+
+  async def aaccess_token(self):
+    access = super().access_token
+    for claim, value in (await aentitlement_claims(self[api_settings.USER_ID_CLAIM])).items():
+      access[claim] = value
+    return access
+
+
+class BatchTokenVerifier:
+  """
+  Verifica muitos tokens com um único contexto de verificação: a chave é
+  preparada uma vez (ou, com KeyRing, as chaves públicas já carregadas são
+  escolhidas pelo kid) e cada token é decodificado direto pelo PyJWT, sem
+  montar um objeto Token por item. Tokens válidos passam pelo revocation_store,
+  como no jwt/verify/.
+  """
+
+  VALID = 'valid'
+  INVALID = 'invalid'
+  EXPIRED = 'expired'
+  REVOKED = 'revoked'
+
+  def __init__(self, backend=None):
+    backend = backend or state.token_backend
+    self.backend = backend
+    self.algorithms = [backend.algorithm]
+    self.key_ring = getattr(backend, 'key_ring', None)
+    if self.key_ring is None:
+      algorithm = get_default_algorithms()[backend.algorithm]
+      self.key = algorithm.prepare_key(backend.get_verifying_key(None))
+    self.leeway = backend.get_leeway()
+    self.options = {
+      'verify_aud': backend.audience is not None,
+      'require': ['exp'] + ([api_settings.JTI_CLAIM] if api_settings.JTI_CLAIM else []),
+    }
+    self.decoder = jwt.PyJWT()
+
+  def get_key(self, token):
+    if self.key_ring is None:
+      return self.key
+    return self.key_ring.public_key(jwt.get_unverified_header(token).get('kid'))
+
+  def verify(self, token):
+    try:
+      key = self.get_key(token)
+      if key is None:
+        return self.INVALID
+
+      payload = self.decoder.decode(
+        token,
+        key,
+        algorithms=self.algorithms,
+        audience=self.backend.audience,
+        issuer=self.backend.issuer,
+        leeway=self.leeway,
+        options=self.options,
+      )
+    except jwt.ExpiredSignatureError:
+      return self.EXPIRED
+    except jwt.InvalidTokenError:
+      return self.INVALID
+
+    if revocation_store.is_token_revoked(payload):
+      return self.REVOKED
+    return self.VALID
+
+  def verify_many(self, tokens):
+    return [self.verify(token) for token in tokens]
@@ -3,25 +3,46 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
 from .views import (
+  AccountViewSet,
   CustomProviderAuthView,
   CustomTokenObtainPairView,
   CustomTokenRefreshView,
   CustomTokenVerifyView,
+  CustomTokenBatchVerifyView,
+  JWKSView,
   LogoutView,
   UserProfileViewSet
 )
+from .async_views import (
+  AsyncLogoutView,
+  AsyncTokenObtainPairView,
+  AsyncTokenRefreshView,
+  AsyncTokenVerifyView
+)
+
+if settings.AUTH_ASYNC_VIEWS:
+  TokenCreate, TokenRefresh, TokenVerify, Logout = (
+    AsyncTokenObtainPairView, AsyncTokenRefreshView, AsyncTokenVerifyView, AsyncLogoutView
+  )
+else:
+  TokenCreate, TokenRefresh, TokenVerify, Logout = (
+    CustomTokenObtainPairView, CustomTokenRefreshView, CustomTokenVerifyView, LogoutView
+  )
 
 router = DefaultRouter()
 router.register('profile', UserProfileViewSet, basename='profile')
+router.register('accounts', AccountViewSet, basename='account')
 
 urlpatterns = [
   re_path(
     r'^o/(?P<provider>\S+)/$', CustomProviderAuthView.as_view(), name='provider-auth'
   ),
-  path('jwt/create/', CustomTokenObtainPairView.as_view()),
-  path('jwt/refresh/', CustomTokenRefreshView.as_view()),
-  path('jwt/verify/', CustomTokenVerifyView.as_view()),
-  path('logout/', LogoutView.as_view()),
+  path('jwt/create/', TokenCreate.as_view(), name='jwt-create'),
+  path('jwt/refresh/', TokenRefresh.as_view(), name='jwt-refresh'),
+  path('jwt/verify/', TokenVerify.as_view(), name='jwt-verify'),
+  path('jwt/verify/batch/', CustomTokenBatchVerifyView.as_view(), name='jwt-verify-batch'),
+  path('.well-known/jwks.json', JWKSView.as_view(), name='jwks'),
+  path('logout/', Logout.as_view(), name='logout'),
 
   path('', include(router.urls)),
 ] 
\ No newline at end of file
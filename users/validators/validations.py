@@ -1,4 +1,5 @@
 import re
+import numpy as np
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
 
 def validate_phone(value):
@@ -32,6 +33,60 @@ def validate_cpf(cpf):
 
   return int(cpf[9]) == first_digit and int(cpf[10]) == second_digit
   
+CPF_FIRST_WEIGHTS = np.arange(10, 1, -1)
+CPF_SECOND_WEIGHTS = np.arange(11, 1, -1)
+
+def _cpf_check_digit(digits, weights):
+  remainder = (digits @ weights) % 11
+  return np.where(remainder < 2, 0, 11 - remainder)
+
+def _validate_cpf_chunk(values):
+  text = np.asarray(values, dtype=str)
+  if text.dtype.itemsize < 11 * 4:
+    text = text.astype('<U11')
+  width = text.dtype.itemsize // 4
+
+  # Cada string vira uma linha de code points; os dígitos são compactados no
+  # início da linha (o resto vira \0, que o NumPy descarta no fim da string).
+  codes = text.view(np.uint32).reshape(len(text), width)
+  is_digit = (codes >= 48) & (codes <= 57)
+  counts = is_digit.sum(axis=1)
+  packed = np.zeros_like(codes)
+  packed[np.arange(width) < counts[:, None]] = codes[is_digit]
+  normalized = packed.view(f'<U{width}').ravel()
+
+  valid = counts == 11
+  digits = packed[valid, :11].astype(np.int64) - 48
+  candidates = (
+    ~(digits == digits[:, :1]).all(axis=1)
+    & (_cpf_check_digit(digits[:, :9], CPF_FIRST_WEIGHTS) == digits[:, 9])
+    & (_cpf_check_digit(digits[:, :10], CPF_SECOND_WEIGHTS) == digits[:, 10])
+  )
+  valid[valid] = candidates
+
+  return valid, normalized
+
+def validate_cpfs(values, chunk_size=1_000_000):
+  """
+  Versão em lote de validate_cpf: recebe um iterável (ou array) de CPFs e
+  devolve (máscara de validade, valores só com dígitos). O resultado é o mesmo
+  da função escalar, item a item, mas os dígitos verificadores são calculados
+  de forma vetorizada, em blocos de `chunk_size` para limitar a memória.
+  """
+  if not isinstance(values, np.ndarray):
+    values = list(values)
+
+  masks, normalized = [], []
+  for start in range(0, len(values), chunk_size):
+    mask, digits = _validate_cpf_chunk(values[start:start + chunk_size])
+    masks.append(mask)
+    normalized.append(digits)
+
+  if not masks:
+    return np.zeros(0, dtype=bool), np.zeros(0, dtype='<U11')
+
+  return np.concatenate(masks), np.concatenate(normalized)
+
 def validate_min_value(value):
   return MinValueValidator(value)
 
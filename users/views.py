@@ -1,12 +1,30 @@
+from collections.abc import Mapping
 from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status, viewsets, permissions
+from rest_framework import mixins, status, viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.shortcuts import get_object_or_404
-from .models import UserProfile
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag
+from .avatars import attach_direct_upload, enqueue_avatar, request_direct_upload, supports_direct_upload
+from .keys import get_key_ring
+from full_auth.conditional import Validators
+from full_auth.instrumentation import timing
+from full_auth.pagination import KeysetPagination
+from full_auth.replicas import replica_reads
+from .models import UserAccount, UserProfile
+from .revocation import revocation_store
+from .throttling import login_throttle
 from .serializers import (
+  AccountListSerializer,
+  AvatarUploadConfirmSerializer,
+  AvatarUploadRequestSerializer,
+  CustomTokenObtainPairSerializer,
+  CustomTokenRefreshSerializer,
+  CustomTokenVerifySerializer,
+  TokenBatchVerifySerializer,
   UserProfileSerializer,
   UserProfileUpdateSerializer,
   UserAvatarUpdateSerializer
@@ -15,8 +33,11 @@ from djoser.social.views import ProviderAuthView
 from rest_framework_simplejwt.views import (
   TokenObtainPairView,
   TokenRefreshView,
-  TokenVerifyView
+  TokenVerifyView,
+  TokenViewBase
 )
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
 
 class CustomProviderAuthView(ProviderAuthView):
   def post(self, request, *args, **kwargs):
@@ -49,8 +70,15 @@ class CustomProviderAuthView(ProviderAuthView):
     return response    
 
 class CustomTokenObtainPairView(TokenObtainPairView):
+  serializer_class = CustomTokenObtainPairSerializer
+
   def post(self, request, *args, **kwargs):
-    response = super().post(request, *args, **kwargs)
+    # Um corpo JSON que não é objeto (uma lista, por exemplo) conta só pelo IP;
+    # o serializer é quem responde 400.
+    email = request.data.get(UserAccount.USERNAME_FIELD) if isinstance(request.data, Mapping) else None
+    login_throttle.check(request, email)
+    with login_throttle.hash_slot():
+      response = super().post(request, *args, **kwargs)
 
     if response.status_code == 200:
       access_token = response.data.get('access')
@@ -79,6 +107,8 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     return response
   
 class CustomTokenRefreshView(TokenRefreshView):
+  serializer_class = CustomTokenRefreshSerializer
+
   def post(self, request, *args, **kwargs):
     refresh_token = request.COOKIES.get('refresh')
 
@@ -100,9 +130,22 @@ class CustomTokenRefreshView(TokenRefreshView):
         samesite=settings.AUTH_COOKIE_SAMESITE
       )
 
+      if 'refresh' in response.data:
+        response.set_cookie(
+          'refresh',
+          response.data['refresh'],
+          max_age=settings.AUTH_COOKIE_REFRESH_MAX_AGE,
+          path=settings.AUTH_COOKIE_PATH,
+          secure=settings.AUTH_COOKIE_SECURE,
+          httponly=settings.AUTH_COOKIE_HTTP_ONLY,
+          samesite=settings.AUTH_COOKIE_SAMESITE
+        )
+
     return response
   
 class CustomTokenVerifyView(TokenVerifyView):
+  serializer_class = CustomTokenVerifySerializer
+
   def post(self, request, *args, **kwrgs):
     access_token = request.COOKIES.get('access')
 
@@ -111,8 +154,45 @@ class CustomTokenVerifyView(TokenVerifyView):
 
     return super().post(request, *args, **kwrgs)
 
+class CustomTokenBatchVerifyView(TokenViewBase):
+  serializer_class = TokenBatchVerifySerializer
+
+class JWKSView(APIView):
+  permission_classes = ()
+  authentication_classes = ()
+
+  def get(self, request, *args, **kwargs):
+    key_ring = get_key_ring()
+    jwks = key_ring.jwks if key_ring else {'keys': []}
+    etag = quote_etag(key_ring.etag if key_ring else 'empty')
+
+    if request.headers.get('If-None-Match') == etag:
+      response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+      response = Response(jwks)
+
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.JWKS_MAX_AGE)
+    return response
+
 class LogoutView(APIView):
+  # Sem exigir um access token válido: depois que ele expira, o refresh token
+  # (cookie ou corpo) ainda precisa ser revogado e os cookies apagados.
+  permission_classes = [permissions.AllowAny]
+
   def post(self, request, *args, **kwargs):
+    tokens = [request.auth] if request.auth is not None else []
+    refresh_token = request.COOKIES.get('refresh')
+    if not refresh_token and isinstance(request.data, Mapping):
+      refresh_token = request.data.get('refresh')
+    if refresh_token:
+      try:
+        tokens.append(RefreshToken(refresh_token))
+      except TokenError:
+        pass
+    if tokens:
+      revocation_store.revoke_tokens(*tokens)
+
     response = Response(status=status.HTTP_204_NO_CONTENT)
     response.delete_cookie('access')
     response.delete_cookie('refresh')
@@ -125,7 +205,14 @@ class UserProfileViewSet(viewsets.ModelViewSet):
   permission_classes = [permissions.IsAuthenticated]
 
   def get_queryset(self):
-    return UserProfile.objects.filter(user=self.request.user)
+    return UserProfile.objects.filter(user=self.request.user).select_related('user')
+
+  def get_profile(self):
+    # O usuário já foi carregado pela autenticação; reaproveitá-lo evita
+    # uma nova consulta quando o serializer acessa profile.user.
+    profile = get_object_or_404(UserProfile, user=self.request.user)
+    profile.user = self.request.user
+    return profile
   
   def get_serializer_class(self, *args, **kwargs):
     if self.action == 'update' or self.action == 'partial_update':
@@ -133,38 +220,96 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     
     return UserProfileSerializer
   
+  def get_validators(self, profile):
+    # O perfil já é lido numa única consulta; o 304 só evita a serialização.
+    return Validators(
+      max(profile.update_at, self.request.user.update_ate),
+      self.action,
+      profile.pk,
+      self.request.user.update_ate.isoformat()
+    )
+
   def list(self, request, *args, **kwargs):
-    profile = get_object_or_404(UserProfile, user=request.user)
+    with replica_reads(request.user.pk):
+      profile = self.get_profile()
+    validators = self.get_validators(profile)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+      return not_modified
+
     serializer = self.get_serializer(profile)
-    return Response(serializer.data)
+    with timing('serialize'):
+      data = serializer.data
+    return validators.apply(Response(data))
   
   @action(detail=False, methods=['post', 'patch'], parser_classes=[MultiPartParser, FormParser] )
   def update_avatar(self, request):    
-    profile = get_object_or_404(UserProfile, user=request.user)
+    profile = self.get_profile()
     serializer = UserAvatarUpdateSerializer(profile, data=request.data, partial=True, context={"request": request})
 
     if serializer.is_valid():
-      if profile.avatar:
-        profile.avatar.delete()
+      upload = serializer.validated_data.get('avatar')
+      if not upload:
+        return Response({'avatar': ['Nenhum arquivo foi enviado.']}, status=status.HTTP_400_BAD_REQUEST)
 
-      serializer.save()
-      return Response(serializer.data)
+      upload_id = enqueue_avatar(profile, upload)
+      return Response(
+        {'avatar_status': profile.avatar_status, 'avatar_upload_id': upload_id},
+        status=status.HTTP_202_ACCEPTED
+      )
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
   
+  @action(detail=False, methods=['post'])
+  def avatar_upload_url(self, request):
+    if not supports_direct_upload():
+      return Response(
+        {'detail': 'O storage atual não aceita upload direto.'},
+        status=status.HTTP_501_NOT_IMPLEMENTED
+      )
+
+    serializer = AvatarUploadRequestSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    profile = self.get_profile()
+    return Response(request_direct_upload(profile, serializer.validated_data['content_type']))
+
+  @action(detail=False, methods=['post'])
+  def confirm_avatar_upload(self, request):
+    profile = self.get_profile()
+    serializer = AvatarUploadConfirmSerializer(data=request.data, context={'profile': profile})
+    serializer.is_valid(raise_exception=True)
+
+    if not attach_direct_upload(profile, serializer.validated_data['upload_token']):
+      return Response(
+        {'upload_token': ['Arquivo não encontrado ou maior que o permitido.']},
+        status=status.HTTP_400_BAD_REQUEST
+      )
+
+    return Response(
+      {'avatar_status': profile.avatar_status, 'avatar_upload_id': profile.avatar_upload_id},
+      status=status.HTTP_202_ACCEPTED
+    )
+
   @action(detail=False, methods=['get'])
   def investment_info(self, request):
-    profile = get_object_or_404(UserProfile, user=request.user)
+    with replica_reads(request.user.pk):
+      profile = self.get_profile()
+    validators = self.get_validators(profile)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+      return not_modified
+
     data = {
       'investment_experience': profile.investiment_experience,
       'risk_profile': profile.risk_profile
     }
     
-    return Response(data)
+    return validators.apply(Response(data))
   
   @action(detail=False, methods=['patch'])
   def update_notifications(self, request):
-    profile = get_object_or_404(UserProfile, user=request.user)
+    profile = self.get_profile()
 
     email_notifications = request.data.get('email_notifications')
     sms_notifications = request.data.get('sms_notificatons')
@@ -185,3 +330,15 @@ class UserProfileViewSet(viewsets.ModelViewSet):
       
 
     
+
+
+class AccountPagination(KeysetPagination):
+  ordering = ('-created_at', '-id')
+
+
+class AccountViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+  """Listagem das contas para a equipe, das mais novas para as mais antigas."""
+  queryset = UserAccount.objects.all()
+  serializer_class = AccountListSerializer
+  permission_classes = [permissions.IsAdminUser]
+  pagination_class = AccountPagination